@@ -0,0 +1,65 @@
+import pandas as pd
+from common_utils.data_handler.audit import _validate_dataframe
+
+# string columns with at most this ratio of distinct values to rows become categoricals
+DEFAULT_CATEGORICAL_THRESHOLD = 0.5
+
+
+def _downcast_numeric(column):
+    if pd.api.types.is_integer_dtype(column):
+        return pd.to_numeric(column, downcast="integer")
+
+    # float32 only keeps ~7 significant digits, only downcast when no value changes
+    downcast = pd.to_numeric(column, downcast="float")
+    if downcast.dtype != column.dtype and ((downcast == column) | column.isna()).all():
+        return downcast
+    return column
+
+
+def optimize_dataframe_memory(
+    data, categorical_threshold=DEFAULT_CATEGORICAL_THRESHOLD, downcast=True
+):
+    """
+    Reduce the memory used by a dataframe without changing its values.
+    Integers are downcast to the smallest type holding them, floats to float32 when it's
+    lossless and string columns with few distinct values become categoricals.
+    Works on numpy, nullable and pyarrow backed columns.
+
+    Args:
+        data: pandas DataFrame
+        categorical_threshold: ratio of distinct values to rows under which a string column is
+            made categorical, use 0 to keep the strings as they are. Defaults to DEFAULT_CATEGORICAL_THRESHOLD
+        downcast: downcast numeric columns. Defaults to True
+
+    Return:
+        pandas DataFrame
+    """
+    _validate_dataframe(data)
+
+    optimized_columns = {}
+    for position, (_, column) in enumerate(data.items()):
+        if isinstance(column.dtype, pd.CategoricalDtype) or pd.api.types.is_bool_dtype(
+            column
+        ):
+            continue
+
+        if pd.api.types.is_numeric_dtype(column):
+            if downcast:
+                optimized_columns[position] = _downcast_numeric(column)
+
+        elif (
+            categorical_threshold
+            and len(column)
+            and pd.api.types.is_string_dtype(column)
+            and column.nunique() <= categorical_threshold * len(column)
+        ):
+            optimized_columns[position] = column.astype("category")
+
+    if not optimized_columns:
+        return data
+
+    # by position so duplicated column names are handled
+    optimized = data.copy(deep=False)
+    for position, column in optimized_columns.items():
+        optimized.isetitem(position, column)
+    return optimized
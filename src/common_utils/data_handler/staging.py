@@ -1,7 +1,11 @@
-from common_utils.data_handler.audit import DEFAULT_AUDIT_COLUMNS
+from common_utils.data_handler.audit import DEFAULT_AUDIT_COLUMNS, _validate_dataframe
+from common_utils.io_handler.database.query import ParameterisedQuery
+import numpy as np
 import pandas as pd
+from contextlib import contextmanager
 from functools import cache
 import re
+import time
 import warnings
 
 # every table should have a staging table unless they are a meta/reference table
@@ -9,6 +13,15 @@ import warnings
 STAGING_TABLE_PREFIX = ""
 STAGING_TABLE_SUFFIX = "_staging"
 
+# hash of the record's values, written by populate_staging_table(hash_columns=...) and kept in
+# the source table so changes are found by comparing a single column (use_row_hash=True)
+ROW_HASH_COLUMN = "_row_hash"
+
+# high water mark of each table loaded incrementally (populate_staging_table(watermark_column=...)),
+# one metadata table per schema. pending_watermark is the mark of the rows in the staging table,
+# it becomes the watermark once they are synced to the source table
+WATERMARK_TABLE_NAME = "_staging_watermark"
+
 
 class MissingStagingTableError(Exception):
     pass
@@ -58,6 +71,195 @@ def derive_staging_table_name_from_table_name(
     return f"{staging_table_name_prefix}{table_name}{staging_table_name_suffix}"
 
 
+# hash of a null whatever the column's dtype (None, NaN, NaT or NA)
+_NULL_HASH = pd.util.hash_array(np.array(["<null>"], dtype=object))[0]
+
+
+def _hash_column(column):
+    # the same value hashes the same whatever the dtype it arrives in, e.g. a nullable integer
+    # column is float64 in a batch with a null and int64 otherwise
+    missing = column.isna().to_numpy()
+    if pd.api.types.is_datetime64_any_dtype(column):
+        if column.dt.tz is not None:
+            column = column.dt.tz_convert("UTC").dt.tz_localize(None)
+        hashed = pd.util.hash_array(
+            column.astype("datetime64[ns]").to_numpy().view(np.int64)
+        )
+    elif pd.api.types.is_numeric_dtype(column) and not pd.api.types.is_bool_dtype(
+        column
+    ):
+        # integral numbers hash as integers (1 and 1.0 alike), the others as floats
+        if pd.api.types.is_integer_dtype(column):
+            hashed = pd.util.hash_array(column.to_numpy(dtype=np.int64, na_value=0))
+        else:
+            floats = column.to_numpy(dtype=np.float64, na_value=np.nan)
+            with np.errstate(invalid="ignore"):
+                integral = (np.mod(floats, 1) == 0) & (np.abs(floats) < 2**63)
+            hashed = np.where(
+                integral,
+                pd.util.hash_array(np.where(integral, floats, 0).astype(np.int64)),
+                pd.util.hash_array(floats),
+            )
+    else:
+        # python objects hash the same whatever the array holding them (e.g. arrow strings)
+        hashed = pd.util.hash_array(column.astype(object).to_numpy())
+    return np.where(missing, _NULL_HASH, hashed)
+
+
+def add_row_hash_column(data, hash_columns, row_hash_column=ROW_HASH_COLUMN):
+    """
+    Add a column with a 64 bit hash of the values of each row, computed on the whole dataframe
+    at once. Nulls are hashed like any other value so a value changing to/from null changes
+    the hash. Values are hashed independently of the dtype they come in (1 and 1.0, int64 and
+    a float64 column holding nulls, datetime units, arrow and object strings) so the same
+    record hashes the same from one load to the next.
+
+    Args:
+        data (pd.DataFrame): dataframe of the records
+        hash_columns (list | tuple): columns hashed, in this order
+        row_hash_column (str, optional): name of the hash column. Defaults to ROW_HASH_COLUMN
+
+    Returns:
+        pd.DataFrame: data with the signed (BIGINT) hash column
+    """
+    _validate_dataframe(data)
+
+    # the hashes of the columns (by position, names can repeat) are combined into the row's
+    column_hashes = pd.DataFrame(
+        {
+            position: _hash_column(data[column])
+            for position, column in enumerate(hash_columns)
+        },
+        index=data.index,
+    )
+    row_hash = pd.util.hash_pandas_object(column_hashes, index=False)
+    # unsigned 64 bit integers don't fit database integers, reinterpret them as signed
+    return data.assign(**{row_hash_column: row_hash.to_numpy().view(np.int64)})
+
+
+def _distinct_operator(database_connection):
+    # null safe "not equal", sqlite only has IS NOT before 3.39
+    return (
+        "IS NOT"
+        if database_connection.connection_engine == "sqlite"
+        else "IS DISTINCT FROM"
+    )
+
+
+def _watermark_schema_name(database_connection, schema_name):
+    # sqlite has no schemas, the watermark table is in the database file like the staging tables
+    return None if database_connection.connection_engine == "sqlite" else schema_name
+
+
+def _watermark_table_exists(database_connection, schema_name=None):
+    schema_name = _watermark_schema_name(database_connection, schema_name)
+    # catalog is cached so this doesn't hit the database every time
+    return bool(
+        database_connection.find_objects(
+            table_name=WATERMARK_TABLE_NAME, schema_name=schema_name or None
+        )
+    )
+
+
+def get_watermark(database_connection, table_name: str, schema_name=None):
+    """
+    Get the high water mark of the records synced to a table by the incremental loads
+
+    Args:
+        database_connection: database connection object
+        table_name (str): name of the table
+        schema_name (str, optional): schema of the table. Defaults to None
+
+    Returns:
+        str: watermark (as text) or None if the table hasn't been synced incrementally yet
+    """
+    schema_name = _watermark_schema_name(database_connection, schema_name)
+    if not _watermark_table_exists(database_connection, schema_name):
+        return None
+
+    watermarks = database_connection.select_into_dataframe(
+        {
+            "table": combine_schema_and_table_name(
+                schema_name=schema_name, table_name=WATERMARK_TABLE_NAME
+            ),
+            "columns": ["watermark"],
+            "filters": {"table_name": table_name},
+        }
+    )
+    return watermarks["watermark"].iloc[0] if len(watermarks) else None
+
+
+def _filter_past_watermark(
+    database_connection, table_name, data, watermark_column, schema_name=None
+):
+    """
+    Keep the records past the table's watermark and record the mark they'll move it to
+    """
+    schema_name = _watermark_schema_name(database_connection, schema_name)
+    watermark = get_watermark(database_connection, table_name, schema_name)
+    if watermark is not None:
+        # stored as text, compared as the column's type e.g. timestamp or integer
+        data = data[
+            data[watermark_column]
+            > pd.Series([watermark]).astype(data[watermark_column].dtype).iloc[0]
+        ]
+
+    if data.empty:
+        return data
+
+    watermark_table_name = combine_schema_and_table_name(
+        schema_name=schema_name, table_name=WATERMARK_TABLE_NAME
+    )
+    if not _watermark_table_exists(database_connection, schema_name):
+        database_connection.execute_statement(
+            f"""
+            CREATE TABLE IF NOT EXISTS {watermark_table_name} (
+                table_name TEXT PRIMARY KEY,
+                watermark_column TEXT,
+                watermark TEXT,
+                pending_watermark TEXT
+            )
+        """
+        )
+
+    insert_kwargs = {
+        k: v
+        for k, v in dict(
+            dataframe=pd.DataFrame(
+                {
+                    "table_name": [table_name],
+                    "watermark_column": [watermark_column],
+                    "pending_watermark": [str(data[watermark_column].max())],
+                }
+            ),
+            table_name=WATERMARK_TABLE_NAME,
+            schema=schema_name,
+        ).items()
+        if v is not None
+    }
+    database_connection.insert_into_table(
+        **insert_kwargs, if_exists="upsert", key_columns=["table_name"]
+    )
+    return data
+
+
+def _advance_watermark_query(database_connection, table_name, schema_name=None):
+    schema_name = _watermark_schema_name(database_connection, schema_name)
+    # None when no table is loaded incrementally
+    if not _watermark_table_exists(database_connection, schema_name):
+        return None
+
+    return ParameterisedQuery(
+        sql=f"""
+            update {combine_schema_and_table_name(schema_name=schema_name, table_name=WATERMARK_TABLE_NAME)}
+            set watermark = pending_watermark, pending_watermark = null
+            where table_name = :table_name
+            and pending_watermark is not null
+        """,
+        params={"table_name": table_name},
+    )
+
+
 def get_staging_table_name(database_connection, table_name, schema_name=None):
     """
     Get staging table name from the table name. This enforces staging table name format
@@ -73,25 +275,25 @@ def get_staging_table_name(database_connection, table_name, schema_name=None):
         table_name=table_name
     )
 
-    query = "object_type == 'table' & table_name == @staging_table_name"
-
     # for non-sqlite db, schema_name is required
     if database_connection.connection_engine != "sqlite":
         if not schema_name or not schema_name.strip():
             raise MissingStagingTableSchemaError(
                 "Staging table schema is only supported for non-sqlite database engine, provide schema_name argument"
             )
-    else:
+    elif schema_name:
         warnings.warn(
             f"schema_name argument '{schema_name}' was passed in but is ignored for sqlite database engine"
         )
 
-    if schema_name:
-        query += f" & schema_name == '{schema_name}'"
+    # catalog is cached and indexed by the connection so this doesn't hit the database every time
+    staging_tables = database_connection.find_objects(
+        table_name=staging_table_name,
+        object_type="table",
+        schema_name=schema_name or None,
+    )
 
-    if (
-        expect_row_count := len(database_connection.get_all_objects().query(query))
-    ) == 1:
+    if (expect_row_count := len(staging_tables)) == 1:
         return (
             f"{schema_name}.{staging_table_name}" if schema_name else staging_table_name
         )
@@ -107,7 +309,13 @@ def get_staging_table_name(database_connection, table_name, schema_name=None):
 
 
 def populate_staging_table(
-    database_connection, table_name: str, data: pd.DataFrame, schema_name=None
+    database_connection,
+    table_name: str,
+    data: pd.DataFrame,
+    schema_name=None,
+    hash_columns=None,
+    watermark_column=None,
+    **kwargs,
 ):
     """
     Simple function to flush old data and replace staging table with new data
@@ -116,17 +324,53 @@ def populate_staging_table(
         database_connection: database connection object
         table_name (str): name of the table_
         data (pd.DataFrame): dataframe of the new data
+        hash_columns (list | tuple, optional): columns hashed into the ROW_HASH_COLUMN column (see add_row_hash_column),
+            usually the nonmatching columns. The staging and source tables then need a BIGINT ROW_HASH_COLUMN column.
+            Defaults to None for no hash
+        watermark_column (str, optional): load incrementally, only the records whose watermark_column (e.g. an updated at
+            timestamp or an increasing id) is past the table's watermark are staged. The watermark is tracked in
+            WATERMARK_TABLE_NAME and moves once the records are synced (sync_staging_table_to_source_table or
+            merge_staging_table_into_source_table). Records arriving later with a value at or before the watermark
+            are not loaded. Defaults to None to stage all the data
+        **kwargs: passed to database_connection.insert_into_table, e.g. method="copy" to bulk load on postgres
     """
-
-    staging_table_name = get_staging_table_name(
-        database_connection=database_connection,
-        table_name=table_name,
+    _populate_staging_table(
+        database_connection,
+        get_staging_table_name(
+            database_connection=database_connection,
+            table_name=table_name,
+            schema_name=schema_name,
+        ),
+        table_name,
+        data,
         schema_name=schema_name,
+        hash_columns=hash_columns,
+        watermark_column=watermark_column,
+        **kwargs,
     )
 
+
+def _populate_staging_table(
+    database_connection,
+    staging_table_name,
+    table_name,
+    data,
+    schema_name=None,
+    hash_columns=None,
+    watermark_column=None,
+    **kwargs,
+):
+    if watermark_column:
+        data = _filter_past_watermark(
+            database_connection, table_name, data, watermark_column, schema_name
+        )
+    if hash_columns:
+        # while the data is in memory, rather than comparing every column in the database
+        data = add_row_hash_column(data, hash_columns)
+
     database_connection.execute_statement(f"""DELETE FROM {staging_table_name}""")
 
-    kwargs = {
+    insert_kwargs = {
         k: v
         for k, v in dict(
             dataframe=data,
@@ -138,7 +382,7 @@ def populate_staging_table(
         if v is not None
     }
 
-    database_connection.insert_into_table(**kwargs)
+    database_connection.insert_into_table(**insert_kwargs, **kwargs)
 
 
 def update_staging_table_status(
@@ -147,6 +391,7 @@ def update_staging_table_status(
     matching_columns: list,
     nonmatching_columns: list,
     schema_name=None,
+    use_row_hash=False,
 ):
     """
     Identify records in staging table and update the status column with the appropriate status.
@@ -160,14 +405,34 @@ def update_staging_table_status(
         matching_columns (list | tuple): columns that are in both staging table and table. These columns determine if the records will be added/updated.
         nonmatching_columns (list | tuple): columns that are in both staging table and table. These columns are not used to determine if the records will be added/updated.
         schema_name (str, optional): schema name for the staging table. Defaults to None.
+        use_row_hash (bool, optional): find the updated records by comparing ROW_HASH_COLUMN (see populate_staging_table's
+            hash_columns) instead of every nonmatching column. Defaults to False.
 
     """
-    staging_table_name = get_staging_table_name(
-        database_connection=database_connection,
-        table_name=table_name,
+    _update_staging_table_status(
+        database_connection,
+        get_staging_table_name(
+            database_connection=database_connection,
+            table_name=table_name,
+            schema_name=schema_name,
+        ),
+        table_name,
+        matching_columns,
+        nonmatching_columns,
         schema_name=schema_name,
+        use_row_hash=use_row_hash,
     )
 
+
+def _update_staging_table_status(
+    database_connection,
+    staging_table_name,
+    table_name,
+    matching_columns,
+    nonmatching_columns,
+    schema_name=None,
+    use_row_hash=False,
+):
     table_name = combine_schema_and_table_name(
         schema_name=schema_name, table_name=table_name
     )
@@ -176,11 +441,16 @@ def update_staging_table_status(
         [f"stg.{column} = dlt.{column}" for column in matching_columns]
     )
 
-    nonmatching_str_columns = " and ".join(
-        [f"stg.{column} != src.{column}" for column in nonmatching_columns]
+    nonmatching_str_columns = (
+        # a single column to compare, null safe so records hashed for the first time are updated
+        f"stg.{ROW_HASH_COLUMN} {_distinct_operator(database_connection)} src.{ROW_HASH_COLUMN}"
+        if use_row_hash
+        else " and ".join(
+            [f"stg.{column} != src.{column}" for column in nonmatching_columns]
+        )
     )
 
-    for step, query in {
+    steps = {
         # identify the new records if any
         "Setting new records status to 'new'": f"""
             update {staging_table_name} as stg
@@ -209,9 +479,12 @@ def update_staging_table_status(
             set status = 'old'
             where status not in ('new','update')
         """,
-    }.items():
-        database_connection.execute_statement(query)
-        print(f"{step} in {staging_table_name}")
+    }
+
+    # one transaction for all the steps rather than a commit per statement
+    rowcounts = database_connection.execute_script(list(steps.values()))
+    for step, rowcount in zip(steps, rowcounts):
+        print(f"{step} in {staging_table_name} ({rowcount} rows)")
 
 
 def sync_staging_table_to_source_table(
@@ -221,6 +494,7 @@ def sync_staging_table_to_source_table(
     nonmatching_columns: list | tuple,
     audit_columns: list = None,
     schema_name=None,
+    use_row_hash=False,
 ):
     """
     Load new records or update records in source table using staging table
@@ -231,12 +505,38 @@ def sync_staging_table_to_source_table(
         matching_columns (list | tuple): columns that are in both staging table and table. These columns determine if the records will be added/updated.
         nonmatching_columns (list | tuple): columns that are in both staging table and table. These columns are not used to determine if the records will be added/updated.
         audit_columns (list): list of audit columns. Defaults to None to use the pre-set columns (DEFAULT_AUDIT_COLUMNS) from common_utils.data_handler.audit but if there are no audit columns, then use empty list.
+        use_row_hash (bool, optional): also load ROW_HASH_COLUMN so the next loads can compare it. Defaults to False.
 
     """
-    staging_table_name = get_staging_table_name(
-        database_connection=database_connection,
-        table_name=table_name,
+    _sync_staging_table_to_source_table(
+        database_connection,
+        get_staging_table_name(
+            database_connection=database_connection,
+            table_name=table_name,
+            schema_name=schema_name,
+        ),
+        table_name,
+        matching_columns,
+        nonmatching_columns,
+        audit_columns=audit_columns,
         schema_name=schema_name,
+        use_row_hash=use_row_hash,
+    )
+
+
+def _sync_staging_table_to_source_table(
+    database_connection,
+    staging_table_name,
+    table_name,
+    matching_columns,
+    nonmatching_columns,
+    audit_columns=None,
+    schema_name=None,
+    use_row_hash=False,
+):
+    # before table_name is schema qualified, the watermarks are kept per schema
+    advance_watermark = _advance_watermark_query(
+        database_connection, table_name=table_name, schema_name=schema_name
     )
 
     table_name = combine_schema_and_table_name(
@@ -245,7 +545,12 @@ def sync_staging_table_to_source_table(
     if not audit_columns:
         audit_columns = list(DEFAULT_AUDIT_COLUMNS.keys())
 
-    all_columns = matching_columns + nonmatching_columns + audit_columns
+    all_columns = (
+        list(matching_columns)
+        + list(nonmatching_columns)
+        + audit_columns
+        + ([ROW_HASH_COLUMN] if use_row_hash else [])
+    )
     sql_str_columns = ", ".join(all_columns)
     update_columns = ", ".join([f"{column} = stg.{column}" for column in all_columns])
 
@@ -253,7 +558,7 @@ def sync_staging_table_to_source_table(
         [f"tgt.{column} = stg.{column}" for column in matching_columns]
     )
 
-    for step, query in {
+    steps = {
         "Inserting new records": f"""
             insert into {table_name} ({sql_str_columns})
             select {sql_str_columns}
@@ -267,32 +572,242 @@ def sync_staging_table_to_source_table(
             where status = 'update'
             and {matching_str_columns}
         """,
-    }.items():
-        database_connection.execute_statement(query)
-        print(f"{step} in {table_name}")
+    }
+    if advance_watermark:
+        # in the same transaction so the watermark only moves with the records
+        steps["Advancing watermark"] = advance_watermark
 
+    rowcounts = database_connection.execute_script(list(steps.values()))
+    for step, rowcount in zip(steps, rowcounts):
+        print(f"{step} in {table_name} ({rowcount} rows)")
 
-def is_new_data_available(
+
+def merge_staging_table_into_source_table(
     database_connection,
     table_name: str,
+    matching_columns: list | tuple,
+    nonmatching_columns: list | tuple,
+    audit_columns: list = None,
     schema_name=None,
+    use_row_hash=False,
 ):
     """
-    Function to check if there are new/updated data for the table passed in.
+    Set based alternative to update_staging_table_status then sync_staging_table_to_source_table.
+    The staging records are classified and applied to the source table in a single statement
+    (INSERT ... ON CONFLICT) instead of five passes over the tables. The status column of the
+    staging table isn't used nor updated.
+
+    The source table needs a primary key or unique index on matching_columns.
 
     Args:
-        database_connection: database connection object
+        database_connection : database connection object
         table_name (str): name of table
+        matching_columns (list | tuple): columns that are in both staging table and table. These columns determine if the records will be added/updated.
+        nonmatching_columns (list | tuple): columns that are in both staging table and table. These columns are not used to determine if the records will be added/updated.
+        audit_columns (list): list of audit columns. Defaults to None to use the pre-set columns (DEFAULT_AUDIT_COLUMNS) from common_utils.data_handler.audit but if there are no audit columns, then use empty list.
+        schema_name (str, optional): schema name for the staging table. Defaults to None.
+        use_row_hash (bool, optional): find the updated records by comparing ROW_HASH_COLUMN (see populate_staging_table's
+            hash_columns) instead of every nonmatching column, and load it. Defaults to False.
 
     Returns:
-        True/False: returns boolean if new or updated records are available in the staging table
+        dict: number of 'new', 'updated' and 'unchanged' records
     """
     staging_table_name = get_staging_table_name(
         database_connection=database_connection,
         table_name=table_name,
         schema_name=schema_name,
     )
+    if not audit_columns:
+        audit_columns = list(DEFAULT_AUDIT_COLUMNS.keys())
+
+    compare_columns = [ROW_HASH_COLUMN] if use_row_hash else list(nonmatching_columns)
+    advance_watermark = _advance_watermark_query(
+        database_connection, table_name=table_name, schema_name=schema_name
+    )
+    # one transaction so the watermark only moves with the records
+    with database_connection.transaction():
+        counts = database_connection.upsert_from_table(
+            # schema is passed separately
+            source_table_name=staging_table_name.split(".")[-1],
+            table_name=table_name,
+            columns=list(matching_columns)
+            + list(nonmatching_columns)
+            + audit_columns
+            + ([ROW_HASH_COLUMN] if use_row_hash else []),
+            key_columns=list(matching_columns),
+            # audit columns change on every load so they don't make a record updated
+            compare_columns=compare_columns,
+            schema=schema_name,
+        )
+        if advance_watermark:
+            database_connection.execute_statement(advance_watermark)
+    print(
+        f"Merged {staging_table_name} into "
+        f"{combine_schema_and_table_name(schema_name=schema_name, table_name=table_name)} "
+        f"({counts['new']} new, {counts['updated']} updated, {counts['unchanged']} unchanged records)"
+    )
+    return counts
+
+
+def _null_safe_equal(left: pd.Series, right: pd.Series):
+    # == is False (or NA) when both are null, which would make every null look changed
+    return ((left == right).fillna(False) | (left.isna() & right.isna())).to_numpy(
+        dtype=bool
+    )
+
+
+def _nullable_dtype(dtype):
+    # numpy integers and booleans can't hold nulls, use their nullable extension types
+    if isinstance(dtype, np.dtype) and dtype.kind in "iu":
+        return pd.api.types.pandas_dtype(
+            f"{'U' if dtype.kind == 'u' else ''}Int{dtype.itemsize * 8}"
+        )
+    if isinstance(dtype, np.dtype) and dtype.kind == "b":
+        return pd.BooleanDtype()
+    return dtype
+
+
+def sync_dataframe_to_source_table(
+    database_connection,
+    table_name: str,
+    data: pd.DataFrame,
+    matching_columns: list | tuple,
+    nonmatching_columns: list | tuple,
+    audit_columns: list = None,
+    schema_name=None,
+    use_row_hash=False,
+    **kwargs,
+):
+    """
+    In memory alternative to populate_staging_table, update_staging_table_status and
+    sync_staging_table_to_source_table for tables that fit in memory. The key and value columns of
+    the source table are read once, the records are classified with a vectorized merge and only the
+    new and updated records are written back with a single upsert. The staging table isn't used.
+
+    Upserting on sqlite needs a primary key or unique index on matching_columns.
+
+    Args:
+        database_connection : database connection object
+        table_name (str): name of table
+        data (pd.DataFrame): dataframe of the new data, one record per matching_columns values
+        matching_columns (list | tuple): columns that are in both staging table and table. These columns determine if the records will be added/updated.
+        nonmatching_columns (list | tuple): columns that are in both staging table and table. These columns are not used to determine if the records will be added/updated.
+        audit_columns (list): list of audit columns. Defaults to None to use the pre-set columns (DEFAULT_AUDIT_COLUMNS) from common_utils.data_handler.audit but if there are no audit columns, then use empty list.
+        schema_name (str, optional): schema name of the table. Defaults to None.
+        use_row_hash (bool, optional): hash the nonmatching columns (see add_row_hash_column) and only read and compare
+            ROW_HASH_COLUMN of the source table, which then needs that column. Defaults to False.
+        **kwargs: passed to database_connection.insert_into_table, e.g. method="copy" to bulk load on postgres
+
+    Returns:
+        dict: number of 'new', 'updated' and 'unchanged' records
+    """
+    matching_columns = list(matching_columns)
+    nonmatching_columns = list(nonmatching_columns)
+    if not audit_columns:
+        audit_columns = list(DEFAULT_AUDIT_COLUMNS.keys())
 
+    compare_columns = nonmatching_columns
+    if use_row_hash:
+        data = add_row_hash_column(data, nonmatching_columns)
+        compare_columns = [ROW_HASH_COLUMN]
+
+    source_data = database_connection.select_into_dataframe(
+        {
+            "table": combine_schema_and_table_name(
+                schema_name=schema_name, table_name=table_name
+            ),
+            "columns": matching_columns + compare_columns,
+            "filters": {},
+        },
+        # arrow types hold the nulls without turning integers (e.g. the row hash) into floats
+        dtype_backend="pyarrow",
+    )
+    # same types as the new data so the keys join and the values compare, with nulls allowed
+    # in the values (e.g. a row hash column that was just added)
+    source_data = source_data.astype(
+        {
+            column: data[column].dtype
+            if column in matching_columns
+            else _nullable_dtype(data[column].dtype)
+            for column in source_data.columns
+        }
+    )
+
+    diff = data[matching_columns + compare_columns].merge(
+        source_data,
+        on=matching_columns,
+        how="left",
+        suffixes=("", "_source"),
+        indicator=True,
+        validate="one_to_one",
+    )
+    is_new = (diff["_merge"] == "left_only").to_numpy()
+    is_unchanged = ~is_new
+    for column in compare_columns:
+        is_unchanged &= _null_safe_equal(diff[column], diff[f"{column}_source"])
+    is_updated = ~is_new & ~is_unchanged
+
+    changed_data = data.loc[
+        is_new | is_updated,
+        matching_columns
+        + nonmatching_columns
+        + audit_columns
+        + ([ROW_HASH_COLUMN] if use_row_hash else []),
+    ]
+    if len(changed_data):
+        insert_kwargs = {
+            k: v
+            for k, v in dict(
+                dataframe=changed_data, table_name=table_name, schema=schema_name
+            ).items()
+            if v is not None
+        }
+        database_connection.insert_into_table(
+            **insert_kwargs,
+            if_exists="upsert",
+            key_columns=matching_columns,
+            **kwargs,
+        )
+
+    counts = {
+        "new": int(is_new.sum()),
+        "updated": int(is_updated.sum()),
+        "unchanged": int(is_unchanged.sum()),
+    }
+    print(
+        f"Synced dataframe into "
+        f"{combine_schema_and_table_name(schema_name=schema_name, table_name=table_name)} "
+        f"({counts['new']} new, {counts['updated']} updated, {counts['unchanged']} unchanged records)"
+    )
+    return counts
+
+
+def is_new_data_available(
+    database_connection,
+    table_name: str,
+    schema_name=None,
+):
+    """
+    Function to check if there are new/updated data for the table passed in.
+
+    Args:
+        database_connection: database connection object
+        table_name (str): name of table
+
+    Returns:
+        True/False: returns boolean if new or updated records are available in the staging table
+    """
+    return _is_new_data_available(
+        database_connection,
+        get_staging_table_name(
+            database_connection=database_connection,
+            table_name=table_name,
+            schema_name=schema_name,
+        ),
+    )
+
+
+def _is_new_data_available(database_connection, staging_table_name):
     return (
         database_connection.select_into_dataframe(
             f"""
@@ -303,3 +818,125 @@ def is_new_data_available(
         )["data_count"].item()
         > 0
     )
+
+
+class StagingPipeline:
+    """
+    Run the staging cycle of a table (populate_staging_table, update_staging_table_status,
+    is_new_data_available then sync_staging_table_to_source_table) on one connection in a single
+    transaction, committed once at the end. If a step fails nothing is applied: the staging table,
+    source table and watermark are left as they were. The staging table name is resolved once.
+
+    Example:
+        pipeline = StagingPipeline(conn, 'sales', matching_columns=['id'], nonmatching_columns=['amount'], schema_name='dbo')
+        pipeline.run(data)
+        print(pipeline.timings)
+
+    Args:
+        database_connection: database connection object
+        table_name (str): name of table
+        matching_columns (list | tuple): columns that are in both staging table and table. These columns determine if the records will be added/updated.
+        nonmatching_columns (list | tuple): columns that are in both staging table and table. These columns are not used to determine if the records will be added/updated.
+        audit_columns (list): list of audit columns. Defaults to None to use the pre-set columns (DEFAULT_AUDIT_COLUMNS) from common_utils.data_handler.audit but if there are no audit columns, then use empty list.
+        schema_name (str, optional): schema name for the staging table. Defaults to None.
+        use_row_hash (bool, optional): hash the nonmatching columns into ROW_HASH_COLUMN and compare it instead of every
+            nonmatching column (see populate_staging_table's hash_columns). Defaults to False.
+        watermark_column (str, optional): load incrementally, see populate_staging_table. Defaults to None.
+    """
+
+    def __init__(
+        self,
+        database_connection,
+        table_name: str,
+        matching_columns: list | tuple,
+        nonmatching_columns: list | tuple,
+        audit_columns: list = None,
+        schema_name=None,
+        use_row_hash=False,
+        watermark_column=None,
+    ):
+        self.database_connection = database_connection
+        self.table_name = table_name
+        self.matching_columns = list(matching_columns)
+        self.nonmatching_columns = list(nonmatching_columns)
+        self.audit_columns = audit_columns
+        self.schema_name = schema_name
+        self.use_row_hash = use_row_hash
+        self.watermark_column = watermark_column
+        self.staging_table_name = get_staging_table_name(
+            database_connection=database_connection,
+            table_name=table_name,
+            schema_name=schema_name,
+        )
+        # seconds taken by each step of the last run
+        self.timings = {}
+
+    def run(self, data: pd.DataFrame, **kwargs):
+        """
+        Stage the data and apply the new and updated records to the source table
+
+        Args:
+            data (pd.DataFrame): dataframe of the new data
+            **kwargs: passed to database_connection.insert_into_table, e.g. method="copy" to bulk load on postgres
+
+        Returns:
+            dict: seconds taken by each step ('populate', 'classify', 'check', 'sync' and 'commit'),
+                'sync' is missing when there was no new data
+        """
+        timings = self.timings = {}
+
+        @contextmanager
+        def step(name):
+            started = time.perf_counter()
+            yield
+            timings[name] = time.perf_counter() - started
+
+        with self.database_connection.transaction():
+            with step("populate"):
+                _populate_staging_table(
+                    self.database_connection,
+                    self.staging_table_name,
+                    self.table_name,
+                    data,
+                    schema_name=self.schema_name,
+                    hash_columns=self.nonmatching_columns
+                    if self.use_row_hash
+                    else None,
+                    watermark_column=self.watermark_column,
+                    **kwargs,
+                )
+            with step("classify"):
+                _update_staging_table_status(
+                    self.database_connection,
+                    self.staging_table_name,
+                    self.table_name,
+                    self.matching_columns,
+                    self.nonmatching_columns,
+                    schema_name=self.schema_name,
+                    use_row_hash=self.use_row_hash,
+                )
+            with step("check"):
+                new_data_available = _is_new_data_available(
+                    self.database_connection, self.staging_table_name
+                )
+            if new_data_available:
+                with step("sync"):
+                    _sync_staging_table_to_source_table(
+                        self.database_connection,
+                        self.staging_table_name,
+                        self.table_name,
+                        self.matching_columns,
+                        self.nonmatching_columns,
+                        audit_columns=self.audit_columns,
+                        schema_name=self.schema_name,
+                        use_row_hash=self.use_row_hash,
+                    )
+            # transaction() commits on leaving the block
+            commit_started = time.perf_counter()
+        timings["commit"] = time.perf_counter() - commit_started
+
+        print(
+            f"Staged {combine_schema_and_table_name(schema_name=self.schema_name, table_name=self.table_name)} in "
+            + ", ".join(f"{name} {seconds:.3f}s" for name, seconds in timings.items())
+        )
+        return timings
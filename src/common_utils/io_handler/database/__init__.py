@@ -1,3 +1,8 @@
 from common_utils.io_handler.database.connection import DatabaseConnection
+from common_utils.io_handler.database.instrumentation import (
+    QueryCollector,
+    QueryHook,
+    QueryMetrics,
+)
 
-__all__ = ["DatabaseConnection"]
+__all__ = ["DatabaseConnection", "QueryCollector", "QueryHook", "QueryMetrics"]
@@ -1,45 +1,56 @@
 from functools import singledispatch
+import re
 
 SQL_COMPARATOR = {">", ">=", "<", "<=", "=", "!=", "<>"}
 
 
+def _bind(params, value, column, param_prefix=None):
+    # values are never inlined in the sql, they're added to params and referenced with
+    # a :name placeholder (understood by sqlite3 and sqlalchemy text)
+    prefix = param_prefix or re.sub(r"\W", "_", column)
+    name = f"{prefix}_{len(params)}"
+    params[name] = value
+    return f":{name}"
+
+
 # dodgy black formatting so turning formatting off here
 # fmt: off
 @singledispatch
-def _transform_kv_to_clause(filter, column):
+def _transform_kv_to_clause(filter, column, param_prefix=None):
+    """
+    Transform a filter value into sql clause(s) with placeholders and the parameters they bind
+
+    Args:
+        filter: value, list/tuple of values or dictionary of {comparator: value}
+        column: column name the filter applies to
+        param_prefix: prefix of the parameter names, defaults to the column name
+
+    Return:
+        tuple of clause (str, or list of str for dictionary filters) and dictionary of parameters
+    """
     raise NotImplementedError(
         f"Unable to transform value {filter} for column '{column}'. The type {type(filter)} is not supported"
     )
 
 @_transform_kv_to_clause.register(str)
-def _str(filter, column):
-    return f"{column} = '{filter}'"
-
 @_transform_kv_to_clause.register(int)
 @_transform_kv_to_clause.register(float)
-def _num(filter, column):
-    return f"{column} = {filter}"
+def _scalar(filter, column, param_prefix=None):
+    params = {}
+    return f"{column} = {_bind(params, filter, column, param_prefix)}", params
 
 
 @_transform_kv_to_clause.register(list)
 @_transform_kv_to_clause.register(tuple)
-def _iter(filter, column):
-    reformatted_filter = [
-        (
-            element
-            # if int then we just leave it as is
-            if isinstance(element, int)
-            # otherwise we wrap quotes around it to signify it's str
-            else f"'{element}'"
-        )
-        for element in filter
-    ]
-    return f"{column} in " f"({ ', '.join(reformatted_filter) })"
+def _iter(filter, column, param_prefix=None):
+    params = {}
+    placeholders = [_bind(params, element, column, param_prefix) for element in filter]
+    return f"{column} in ({', '.join(placeholders)})", params
 
 @_transform_kv_to_clause.register(dict)
-def _dict(filter, column):
+def _dict(filter, column, param_prefix=None):
     non_str_comparator = [
-        comparator for comparator in filter.keys() if not isinstance(column, str)
+        comparator for comparator in filter.keys() if not isinstance(comparator, str)
     ]
     assert (
         len(non_str_comparator) == 0
@@ -49,8 +60,11 @@ def _dict(filter, column):
     rogue_comparator = filter.keys() - SQL_COMPARATOR
     assert len(rogue_comparator) == 0, f"{rogue_comparator} sql comparator(s) are not allowed. Allowed comparators are {SQL_COMPARATOR}"
 
-    # I should probably check the value here but cbb
-    return [f"{column} {comparator} {value}" for comparator, value in filter.items()]
+    params = {}
+    return [
+        f"{column} {comparator} {_bind(params, value, column, param_prefix)}"
+        for comparator, value in filter.items()
+    ], params
 # fmt: on
 
 
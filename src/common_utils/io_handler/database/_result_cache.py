@@ -0,0 +1,165 @@
+from collections import OrderedDict
+import re
+import threading
+import numpy as np
+import pandas as pd
+
+# every word in a cached query is treated as a table it may read, it over-invalidates
+# when a column shares a table's name but never misses a table (joins, sub queries, ctes)
+_WORD_PATTERN = re.compile(r"[^\W\d]\w*")
+
+# tables a statement writes to
+_WRITE_PATTERN = re.compile(
+    r"""\b(?:insert\s+(?:or\s+\w+\s+)?into|replace\s+into|merge\s+into|update(?:\s+only)?
+    |delete\s+from|truncate(?:\s+table)?|copy)\s+((?:"[^"]+"|\w+)(?:\s*\.\s*(?:"[^"]+"|\w+))*)""",
+    re.IGNORECASE | re.VERBOSE,
+)
+
+
+def _normalise_table_name(table_name):
+    # schema.table, "Table" and table all refer to the same entries
+    return table_name.split(".")[-1].strip().strip('"').lower()
+
+
+def _make_read_only(dataframe):
+    # numpy backed columns are shared between the cache and every frame handed out, so
+    # writing into them raises instead of changing the cached result
+    for array in dataframe._mgr.arrays:
+        if isinstance(array, np.ndarray):
+            array.flags.writeable = False
+
+
+def _shallow_copy(dataframe):
+    copy = dataframe.copy(deep=False)
+    if pd.options.mode.copy_on_write:
+        return copy
+
+    # extension arrays can be written in place, give each caller its own array object
+    # (zero copy for arrow backed columns as arrow buffers are immutable)
+    for position, dtype in enumerate(copy.dtypes):
+        if not isinstance(dtype, np.dtype):
+            copy.isetitem(position, copy.iloc[:, position].array.copy())
+    return copy
+
+
+class ResultCache:
+    """
+    Memory bounded LRU cache of query results, indexed by the tables each query reads so
+    writes can drop the results they make stale.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._keys_by_table = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(sql, **kwargs):
+        """
+        Build the cache key of a query from its sql and the arguments it's read with
+
+        Args:
+            sql: sql string
+            **kwargs: parameters and reader options e.g. params, dtype, parse_dates
+
+        Return:
+            str key
+        """
+        return repr((" ".join(sql.split()).rstrip(";"), sorted(kwargs.items())))
+
+    def get(self, key):
+        """
+        Get a cached result, the dataframe returned shares its data with the cache
+        but can't modify it.
+
+        Args:
+            key: key from make_key
+
+        Return:
+            pandas dataframe or None if the key isn't cached
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        return _shallow_copy(entry[0])
+
+    def put(self, key, sql, dataframe):
+        """
+        Cache the result of a query, evicting the least recently used results over max_bytes.
+        Results bigger than max_bytes aren't cached.
+
+        Args:
+            key: key from make_key
+            sql: sql string of the query, used to find the tables it reads
+            dataframe: result of the query
+
+        Return:
+            pandas dataframe to return to the caller
+        """
+        size = int(dataframe.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            return dataframe
+
+        cached = dataframe.copy(deep=False)
+        _make_read_only(cached)
+        tables = {word.lower() for word in _WORD_PATTERN.findall(sql)}
+
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (cached, tables, size)
+            self.size_bytes += size
+            for table in tables:
+                self._keys_by_table.setdefault(table, set()).add(key)
+
+            while self.size_bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+        return _shallow_copy(cached)
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        _, tables, size = entry
+        self.size_bytes -= size
+        for table in tables:
+            keys = self._keys_by_table[table]
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_table[table]
+
+    def invalidate_tables(self, *table_names):
+        """
+        Drop the cached results of the queries reading any of the tables
+
+        Args:
+            *table_names: table names, optionally schema qualified
+        """
+        with self._lock:
+            for table_name in table_names:
+                for key in list(
+                    self._keys_by_table.get(_normalise_table_name(table_name), ())
+                ):
+                    self._discard(key)
+
+    def invalidate_statement(self, sql):
+        """
+        Drop the cached results of the queries reading the tables a statement writes to
+
+        Args:
+            sql: sql string of the statement(s) executed
+        """
+        self.invalidate_tables(*_WRITE_PATTERN.findall(sql))
+
+    def clear(self):
+        """
+        Drop every cached result
+        """
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_table.clear()
+            self.size_bytes = 0
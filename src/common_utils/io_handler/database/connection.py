@@ -1,16 +1,46 @@
 from abc import ABC, abstractmethod
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache, partial
+import csv
+import io
+import glob
+import itertools
+import json
+import numpy as np
 import pandas as pd
 from pathlib import Path
+import queue
+import re
+import threading
+import time
 
 # db module
+import duckdb
+import pyarrow as pa
 import sqlite3
 import sqlalchemy
-from sqlalchemy import text
+import sqlparse
+from sqlalchemy import event, text
 
 # local module
 from common_utils import __name__ as pkg_name
+from common_utils.data_handler.array import chunk_iter
+from common_utils.data_handler.memory import optimize_dataframe_memory
 from common_utils.io_handler import file
-from common_utils.io_handler.database.query import QueryParser
+from common_utils.io_handler.database._result_cache import ResultCache
+from common_utils.io_handler.database.instrumentation import (
+    instrumented,
+    record_timing,
+    timed,
+)
+from common_utils.io_handler.database.query import (
+    ParameterisedQuery,
+    QueryParser,
+    _split_query,
+)
 from common_utils._pkg_utils import _read_internal_resource
 
 
@@ -26,6 +56,447 @@ ALL_OBJECTS_REQUIRED_COLUMNS = [
     "schema_name",
 ]
 
+# columns of the get_tables_details result, a row per column of each table
+TABLES_DETAILS_COLUMNS = [
+    "schema_name",
+    "table_name",
+    "column_name",
+    "data_type",
+]
+
+# seconds get_all_objects results are reused before the catalog is queried again
+DEFAULT_CATALOG_TTL = 300
+# statements that can change the catalog, the cached objects are dropped when one is executed
+_DDL_PATTERN = re.compile(r"\b(create|drop|alter)\b", re.IGNORECASE)
+
+# worker threads (each with its own connection) running the async_* methods
+DEFAULT_ASYNC_MAX_WORKERS = 4
+
+# default number of rows per dataframe yielded by select_iter
+DEFAULT_CHUNKSIZE = 10_000
+# default number of rows per page read by select_pages
+DEFAULT_PAGE_SIZE = 10_000
+
+# default number of rows serialised per COPY when bulk loading into postgres
+DEFAULT_COPY_CHUNKSIZE = 100_000
+# written in place of None so empty strings and nulls can be told apart by COPY
+COPY_NULL_MARKER = r"\N"
+
+# default number of rows read from a file and inserted at a time by load_file_into_table
+DEFAULT_LOAD_CHUNKSIZE = 100_000
+
+# opt-in sqlite profile for bulk writes, see SqliteConnection high_throughput argument
+HIGH_THROUGHPUT_SQLITE_PRAGMAS = dict(
+    journal_mode="WAL",
+    synchronous="NORMAL",
+    cache_size=-64_000,  # negative means KiB so ~64MB
+    mmap_size=268_435_456,  # 256MB
+    temp_store="MEMORY",
+)
+# rows bound per executemany call when inserting into sqlite
+DEFAULT_SQLITE_BATCH_SIZE = 50_000
+# set by the sqlite read pool, WAL lets the readers run while the writer writes and
+# every reader maps the same file pages (the os shares them) instead of copying them
+SQLITE_READ_POOL_PRAGMAS = dict(
+    journal_mode="WAL",
+    synchronous="NORMAL",
+    mmap_size=268_435_456,  # 256MB
+)
+# pragmas changing the database file, only set by the writer
+_SQLITE_WRITER_PRAGMAS = {"journal_mode", "synchronous"}
+
+# number of parameterised statements kept prepared per connection
+DEFAULT_STATEMENT_CACHE_SIZE = 256
+# key of the prepared statements cache in the (pooled) dbapi connection info dictionary
+_PREPARED_STATEMENTS_INFO_KEY = "common_utils_prepared_statements"
+# key of the schema generation the prepared statements of a connection were prepared in
+_PREPARED_GENERATION_INFO_KEY = "common_utils_prepared_generation"
+_PREPARED_STATEMENT_NAMES = itertools.count()
+# :name placeholders, string literals and quoted identifiers are matched (group 1 is None)
+# so they're left as they are, like :: casts
+_PLACEHOLDER_PATTERN = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(?<![:\w]):(\w+)(?!:)"
+)
+_EXECUTE_STARTED_INFO_KEY = "common_utils_execute_started"
+# send the sql to the driver as is, no interpolation of % or :name
+_NO_PARAMETERS = {"no_parameters": True}
+
+# duckdb table functions used to read files in place, by file extension
+DUCKDB_FILE_READERS = {
+    ".parquet": "read_parquet",
+    ".csv": "read_csv_auto",
+    ".json": "read_json_auto",
+    ".jsonl": "read_json_auto",
+}
+
+# COPY ... TO options used to write query results to files, by file extension
+DUCKDB_FILE_WRITERS = {
+    ".parquet": "FORMAT parquet",
+    ".csv": "FORMAT csv, HEADER",
+    ".jsonl": "FORMAT json",
+}
+
+# defaults for the sqlalchemy connection pool, see sqlalchemy.create_engine for details
+DEFAULT_POOL_SETTINGS = dict(
+    pool_size=5,
+    max_overflow=10,
+    pool_pre_ping=True,
+    pool_recycle=-1,
+)
+
+# engines (and their pools) shared by every connection object pointing at the same dsn
+_SHARED_ENGINES = {}
+_SHARED_ENGINES_LOCK = threading.Lock()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault(_EXECUTE_STARTED_INFO_KEY, []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    record_timing(
+        "execute_seconds",
+        time.perf_counter() - conn.info[_EXECUTE_STARTED_INFO_KEY].pop(),
+    )
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute isn't called for a failed statement, its start would otherwise stay
+    # on the pooled connection and pair with the next statement
+    conn = exception_context.connection
+    started = conn.info.get(_EXECUTE_STARTED_INFO_KEY) if conn is not None else None
+    if started:
+        record_timing("execute_seconds", time.perf_counter() - started.pop())
+
+
+def _create_engine(url, **pool_settings):
+    # times the statements sent through the engine for the query hooks (see instrumentation)
+    engine = sqlalchemy.create_engine(url, **pool_settings)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+    return engine
+
+
+def _get_shared_engine(url, **pool_settings):
+    """
+    Get (or create) the sqlalchemy engine for the url and pool settings passed in.
+    Engines are created once per process so the connection pool is shared across
+    DatabaseConnection objects pointing at the same database.
+
+    Args:
+        url: sqlalchemy database url
+        **pool_settings: keyword arguments passed to sqlalchemy.create_engine
+
+    Return:
+        sqlalchemy engine
+    """
+    key = (url, tuple(sorted(pool_settings.items())))
+    with _SHARED_ENGINES_LOCK:
+        if key not in _SHARED_ENGINES:
+            _SHARED_ENGINES[key] = _create_engine(url, **pool_settings)
+        return _SHARED_ENGINES[key]
+
+
+def _duckdb_literal(value):
+    """
+    Render a python value as a duckdb sql literal, for the options of statements that
+    can't take parameters (e.g. table functions in a view)
+
+    Args:
+        value: str, bool, int, float, None, list/tuple or dict of those
+
+    Return:
+        sql string
+    """
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    if isinstance(value, (list, tuple)):
+        return f"[{', '.join(_duckdb_literal(element) for element in value)}]"
+    if isinstance(value, dict):
+        return (
+            "{"
+            + ", ".join(
+                f"{_duckdb_literal(str(key))}: {_duckdb_literal(element)}"
+                for key, element in value.items()
+            )
+            + "}"
+        )
+    raise ValueError(f"Unable to render {value!r} of type {type(value)} as sql")
+
+
+def _concat_partitions(partitions):
+    """
+    Concatenate the results of a partitioned read so the dtypes don't depend on the
+    partitioning. A column without values in a partition (all null, or no rows) comes back
+    as object and would make the whole column object, it's cast to the type of the others.
+
+    Args:
+        partitions: list of pandas dataframes with the same columns
+
+    Return:
+        pandas dataframe
+    """
+    casts = [{} for _ in partitions]
+    for column in partitions[0].columns.unique():
+        missing = [partition[column].isna().all() for partition in partitions]
+        if all(missing) or not any(missing):
+            continue
+
+        # the type concatenating the partitions with values gives
+        dtype = pd.concat(
+            [
+                partition[column].iloc[:0]
+                for partition, is_missing in zip(partitions, missing)
+                if not is_missing
+            ]
+        ).dtype
+        if isinstance(dtype, np.dtype) and dtype.kind in "iub":
+            # numpy integers and booleans can't hold the nulls, like a single read gives
+            dtype = np.dtype("float64") if dtype.kind in "iu" else np.dtype(object)
+        for cast, is_missing in zip(casts, missing):
+            if is_missing:
+                cast[column] = dtype
+
+    # one concat of all the partitions, the columns are allocated once at their final size
+    return pd.concat(
+        [
+            partition.astype(cast) if cast else partition
+            for partition, cast in zip(partitions, casts)
+        ],
+        ignore_index=True,
+        copy=False,
+    )
+
+
+def _quote_columns(columns, alias=None):
+    # quote identifiers the same way pandas does when it creates the table
+    return ", ".join(
+        f'{alias}."{column}"' if alias else f'"{column}"' for column in columns
+    )
+
+
+def _quote_table_name(table_name, schema=None):
+    return f'"{schema}"."{table_name}"' if schema else f'"{table_name}"'
+
+
+def _to_copy_value(value):
+    if value is None:
+        return COPY_NULL_MARKER
+    # integer columns with nulls are float in pandas, "1.0" isn't valid input for an integer
+    # column while "1" is for any numeric column
+    if isinstance(value, (float, np.floating)) and value.is_integer():
+        return int(value)
+    return value
+
+
+def _copy_from_stdin(pd_table, conn, keys, data_iter):
+    """
+    Insertion method for pandas.DataFrame.to_sql (method argument) that streams the rows
+    into postgres with COPY ... FROM STDIN instead of INSERT statements.
+    pandas calls this once per chunk (to_sql chunksize) so only one chunk is serialised
+    into the in-memory csv buffer at a time.
+
+    Caveat:
+        A string value of exactly COPY_NULL_MARKER is loaded as NULL
+
+    Args:
+        pd_table: pandas.io.sql.SQLTable being inserted into
+        conn: sqlalchemy connection
+        keys: list of column names
+        data_iter: iterable of row tuples for the chunk
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(
+        tuple(_to_copy_value(value) for value in row) for row in data_iter
+    )
+    buffer.seek(0)
+
+    with conn.connection.cursor() as cursor, timed("execute_seconds"):
+        cursor.copy_expert(
+            f"COPY {_quote_table_name(pd_table.name, pd_table.schema)} ({_quote_columns(keys)}) FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL_MARKER}')",
+            buffer,
+        )
+
+
+def _to_sqlite_records(dataframe):
+    """
+    Convert a dataframe into row tuples of python types that sqlite3 binds natively
+    (it can't bind numpy scalars, pandas timestamps or NaN/NaT as null).
+    Timestamps are written in the same text format pandas.DataFrame.to_sql uses.
+
+    Args:
+        dataframe: pandas dataframe
+
+    Return:
+        iterator of row tuples
+    """
+    columns = []
+    for _, column in dataframe.items():
+        missing = column.isna()
+
+        if pd.api.types.is_datetime64_any_dtype(column):
+            if column.dt.tz is None:
+                # vectorised equivalent of datetime.isoformat(" ")
+                values = column.to_numpy()
+                has_fraction = (column.dt.microsecond != 0).to_numpy()
+                text_values = np.datetime_as_string(values, unit="s")
+                if has_fraction.any():
+                    text_values = np.where(
+                        has_fraction,
+                        np.datetime_as_string(values, unit="us"),
+                        text_values,
+                    )
+                column = pd.Series(np.char.replace(text_values, "T", " "))
+            else:
+                column = column.map(lambda value: value.isoformat(" "))
+        elif pd.api.types.is_timedelta64_dtype(column):
+            column = column.astype("int64")
+
+        # object dtype gives python scalars, missing values become None (null)
+        columns.append(
+            np.where(missing.to_numpy(), None, column.astype(object).to_numpy())
+        )
+
+    return zip(*columns)
+
+
+def _upsert_sql(
+    target_table_name,
+    source_table_name,
+    columns,
+    key_columns,
+    compare_columns=None,
+    distinct_operator="IS DISTINCT FROM",
+):
+    """
+    Build the INSERT ... ON CONFLICT DO UPDATE statement (postgres, sqlite and duckdb syntax)
+    upserting every row of the source table into the target table.
+    The target table needs a unique constraint/index on the key columns.
+
+    Args:
+        target_table_name: quoted name of the table to upsert into
+        source_table_name: quoted name of the table/view holding the new rows
+        columns: list of column names to insert
+        key_columns: list of column names identifying a row
+        compare_columns: only update the existing rows where one of these columns changed,
+            defaults to None to update every existing row
+        distinct_operator: null safe not equal operator, sqlite's is IS NOT
+
+    Return:
+        sql string
+    """
+    update_columns = ", ".join(
+        f'"{column}" = excluded."{column}"'
+        for column in columns
+        if column not in key_columns
+    )
+    update_condition = (
+        " WHERE "
+        + " OR ".join(
+            f'tgt."{column}" {distinct_operator} excluded."{column}"'
+            for column in compare_columns
+        )
+        if compare_columns and update_columns
+        else ""
+    )
+    # WHERE true stops sqlite parsing ON CONFLICT as a join constraint of the select
+    return (
+        f"INSERT INTO {target_table_name} AS tgt ({_quote_columns(columns)}) "
+        f"SELECT {_quote_columns(columns)} FROM {source_table_name} WHERE true "
+        f"ON CONFLICT ({_quote_columns(key_columns)}) "
+        + (
+            f"DO UPDATE SET {update_columns}{update_condition}"
+            if update_columns
+            else "DO NOTHING"
+        )
+    )
+
+
+def _merge_sql(target_table_name, source_table_name, columns, key_columns):
+    """
+    Build the MERGE statement (postgres 15+) upserting every row of the source table into
+    the target table. Unlike ON CONFLICT, the key columns don't need a unique constraint.
+
+    Args:
+        target_table_name: quoted name of the table to upsert into
+        source_table_name: quoted name of the table holding the new rows
+        columns: list of column names to insert
+        key_columns: list of column names identifying a row
+
+    Return:
+        sql string
+    """
+    match_condition = " AND ".join(f'tgt."{key}" = src."{key}"' for key in key_columns)
+    update_columns = ", ".join(
+        f'"{column}" = src."{column}"'
+        for column in columns
+        if column not in key_columns
+    )
+    return (
+        f"MERGE INTO {target_table_name} AS tgt USING {source_table_name} AS src "
+        f"ON {match_condition} "
+        + (f"WHEN MATCHED THEN UPDATE SET {update_columns} " if update_columns else "")
+        + f"WHEN NOT MATCHED THEN INSERT ({_quote_columns(columns)}) "
+        f"VALUES ({_quote_columns(columns, alias='src')})"
+    )
+
+
+@lru_cache(maxsize=None)
+def _read_sql_resource(connection_engine, resource_name):
+    # the resource files don't change while running so each is only read from disk once
+    return _read_internal_resource(
+        f"{_RESOURCE_PATH}/{connection_engine}/{resource_name}.sql"
+    )
+
+
+def _split_schema_table_names(tables, default_schema_name):
+    # tables are (schema_name, table_name) pairs or table names in the default schema
+    schema_names, table_names = [], []
+    for table in tables:
+        schema_name, table_name = (
+            (default_schema_name, table) if isinstance(table, str) else table
+        )
+        schema_names.append(schema_name)
+        table_names.append(table_name)
+    return schema_names, table_names
+
+
+def _expand_file_paths(file_path):
+    """
+    Expand a file path or glob into the sorted list of files it matches
+
+    Args:
+        file_path: string file path or glob
+
+    Return:
+        list of string file paths
+    """
+    file_paths = sorted(glob.glob(str(file_path)))
+    if not file_paths:
+        raise FileNotFoundError(f"No file matches {file_path}")
+    return file_paths
+
+
+def dispose_shared_engines():
+    """
+    Close every pooled connection held by the shared engines. Useful before forking
+    or at the end of a batch job.
+
+    Return:
+        None
+    """
+    with _SHARED_ENGINES_LOCK:
+        for engine in _SHARED_ENGINES.values():
+            engine.dispose()
+        _SHARED_ENGINES.clear()
+
 
 class DatabaseConnection(ABC):
     """
@@ -59,9 +530,55 @@ class DatabaseConnection(ABC):
     Caveat:
         If database doesn't exist then it will raise an error
 
+    For sqlite and duckdb, each thread's connection is opened on first use and reused
+    until the context manager exits (or close is called). For postgres, each call checks a
+    connection out of the (shared) pool and returns it when done, so threads and objects
+    share the pool. A connection is held across calls only within transaction() or while
+    select_iter is being iterated. With pool_pre_ping (the default) every checkout costs a
+    round trip to the server, pass pool_pre_ping=False to skip it when the connections
+    can't go stale (e.g. no idle timeout) or use transaction() to hold one for many calls.
+
+    get_all_objects is cached for catalog_ttl seconds (DEFAULT_CATALOG_TTL by default) and
+    invalidated when a create/drop/alter statement is executed through the connection.
+
+    Pass result_cache_bytes to cache select_into_dataframe results (keyed on the normalised
+    sql and its parameters) up to that many bytes, least recently used results are evicted
+    first. A cached result is dropped when execute_statement or insert_into_table writes to
+    a table it reads. Cached dataframes are shared rather than copied so they can't be
+    modified in place (writing into them raises), changes made outside of this object
+    (other processes, triggers, tables behind a view) aren't seen until clear_result_cache
+    is called.
+
+    Example:
+        with DatabaseConnection(
+            database_file_path="path/to/your/file.db",
+            connection_engine="sqlite",
+            result_cache_bytes=256 * 1024**2,
+        ) as conn:
+            conn.select_into_dataframe('select * from reference_table')  # queries the database
+            conn.select_into_dataframe('select * from reference_table')  # served from memory
+
+    For asyncio code, every method has an async_* counterpart (async_select_into_dataframe,
+    async_execute_statement, ...) that runs on a bounded thread pool of async_max_workers
+    threads, each thread using its own connection so queries run concurrently
+    without blocking the event loop.
+
+    Example:
+        async with DatabaseConnection(
+            database_file_path="path/to/your/file.db",
+            connection_engine="sqlite",
+        ) as conn:
+            await asyncio.gather(
+                conn.async_select_into_dataframe('select * from table_a'),
+                conn.async_select_into_dataframe('select * from table_b'),
+            )
     """
 
     _registry = {}
+    # insert_into_table options giving the engine's fastest bulk insert path
+    _bulk_insert_options = {}
+    # integer modulo written without % which means different things to the drivers
+    _modulo_template = "{dividend} - ({dividend} / {divisor}) * {divisor}"
 
     def __init_subclass__(cls, connection_engine, **kwargs):
         # register the child classes
@@ -79,19 +596,229 @@ class DatabaseConnection(ABC):
                 f"{connection_engine} is not in list of allowed connection_engines. Allowed values are: {', '.join(cls._registry.keys())}"
             )
 
+    def __init__(
+        self,
+        catalog_ttl=DEFAULT_CATALOG_TTL,
+        async_max_workers=DEFAULT_ASYNC_MAX_WORKERS,
+        result_cache_bytes=None,
+        query_hooks=None,
+        **kwargs,
+    ):
+        self.catalog_ttl = catalog_ttl
+        self._catalog = None
+        self._catalog_index = None
+        self._catalog_loaded_at = None
+
+        self._result_cache = (
+            None if result_cache_bytes is None else ResultCache(result_cache_bytes)
+        )
+
+        self._query_hooks = list(query_hooks or [])
+
+        self.async_max_workers = async_max_workers
+        # separate pools for async calls and partitioned reads so a partitioned read
+        # started from an async worker can't deadlock waiting on its own pool
+        self._executors = {}
+        self._executors_lock = threading.Lock()
+
+        # connections aren't thread safe so each thread gets (and reuses) its own
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
     @property
-    @abstractmethod
     def database_connection(self):
+        # open lazily and reuse the same connection for the lifetime of the object
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            with timed("acquire_seconds"):
+                connection = self._local.connection = self._open_connection()
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    @abstractmethod
+    def _open_connection(self):
+        """
+        Open a new connection to the database.
+
+        Return:
+            DBAPI or sqlalchemy connection object
+        """
+        pass
+
+    def close(self):
+        """
+        Close the connection(s) that were opened and the async thread pool. A new connection is opened on next use.
+        """
+        with self._executors_lock:
+            executors, self._executors = self._executors, {}
+        for executor in executors.values():
+            executor.shutdown(wait=True)
+
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
+
+    def _release_connection(self):
+        # close the connection of this thread (back to the pool for pooled engines)
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            return
+        self._local.connection = None
+        with self._connections_lock:
+            if connection in self._connections:
+                self._connections.remove(connection)
+        connection.close()
+
+    @property
+    def _in_transaction(self):
+        return getattr(self._local, "in_transaction", False)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run every call made on this thread within the block in a single transaction on a single
+        connection, committed once at the end or rolled back if the block raises. Calls running on
+        other threads (async_* methods, partitioned reads) aren't part of it. Nested blocks join
+        the outer transaction.
+
+        >>> with conn.transaction():
+                conn.execute_statement('delete from fact_staging')
+                conn.insert_into_table(data, 'fact_staging')
+
+        Return:
+            the connection object
+        """
+        if self._in_transaction:
+            yield self
+            return
+
+        self._begin_transaction()
+        self._local.in_transaction = True
+        try:
+            yield self
+        except BaseException:
+            self._local.in_transaction = False
+            self._end_transaction(commit=False)
+            # what was read within the transaction may not exist anymore
+            self.invalidate_catalog()
+            self.clear_result_cache()
+            raise
+        self._local.in_transaction = False
+        self._end_transaction(commit=True)
+
+    @abstractmethod
+    def _begin_transaction(self):
+        """
+        Begin the transaction of transaction() on this thread's connection, the engine's methods
+        don't commit while it's open
+        """
+        pass
+
+    @abstractmethod
+    def _end_transaction(self, commit):
+        """
+        Commit (rolling back if the commit fails) or roll back the transaction of transaction()
+
+        Args:
+            commit: True to commit, False to roll back
+        """
         pass
 
+    def add_query_hook(self, hook):
+        """
+        Add a hook called before and after every query (select_into_dataframe, select_iter,
+        execute_statement, execute_script and insert_into_table) with its QueryMetrics:
+        parse, connection acquire, execute and fetch times, rows and result bytes.
+        See common_utils.io_handler.database.instrumentation.
+
+        >>> collector = QueryCollector(slow_query_seconds=5)
+        >>> conn.add_query_hook(collector)
+        >>> ...
+        >>> collector.report()
+
+        Args:
+            hook: QueryHook (object with before_query and after_query methods)
+        """
+        self._query_hooks.append(hook)
+
+    def remove_query_hook(self, hook):
+        """
+        Remove a hook added with add_query_hook.
+
+        Args:
+            hook: QueryHook to remove
+        """
+        self._query_hooks.remove(hook)
+
     def __enter__(self):
         return self
 
     def __exit__(self, type, value, tb):
-        self.database_connection.close()
+        self.close()
 
-    @abstractmethod
-    def select_into_dataframe(query, self, **kwargs):
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, type, value, tb):
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    def _get_executor(self, purpose):
+        # lazily start the bounded pool dedicated to this object, the worker threads are
+        # kept alive so their connections are reused
+        with self._executors_lock:
+            if purpose not in self._executors:
+                self._executors[purpose] = ThreadPoolExecutor(
+                    max_workers=self.async_max_workers,
+                    thread_name_prefix=f"{pkg_name}_{self.connection_engine}_{purpose}",
+                )
+            return self._executors[purpose]
+
+    async def _run_async(self, function, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_executor("async"), partial(function, *args, **kwargs)
+        )
+
+    async def async_select_into_dataframe(self, query, **kwargs):
+        """
+        Async version of select_into_dataframe, see select_into_dataframe.
+        """
+        return await self._run_async(self.select_into_dataframe, query, **kwargs)
+
+    async def async_execute_statement(self, query):
+        """
+        Async version of execute_statement, see execute_statement.
+        """
+        return await self._run_async(self.execute_statement, query)
+
+    async def async_execute_script(self, query):
+        """
+        Async version of execute_script, see execute_script.
+        """
+        return await self._run_async(self.execute_script, query)
+
+    async def async_insert_into_table(self, dataframe, table_name, **kwargs):
+        """
+        Async version of insert_into_table, see insert_into_table.
+        """
+        return await self._run_async(
+            self.insert_into_table, dataframe, table_name, **kwargs
+        )
+
+    @instrumented
+    @QueryParser
+    def select_into_dataframe(
+        self,
+        query,
+        partition_column=None,
+        partitions=None,
+        partition_method="modulo",
+        optimize_memory=False,
+        **kwargs,
+    ):
         """
         Select data from a table or view into a pandas dataframe
         Note that query can be sql string or dictionary. This is effectively a
@@ -115,58 +842,589 @@ class DatabaseConnection(ABC):
             }
         }
 
+        For large results, pass partition_column to split the query into partitions that are
+        read concurrently, each on its own connection, and concatenated (row order isn't kept).
+
+        >>> conn.select_into_dataframe('select * from fact', partition_column='id', partitions=8)
+
+        For wide extracts, pass dtype_backend="pyarrow" to get arrow backed columns (strings
+        stored in arrow buffers rather than python objects, the default for duckdb) and/or
+        optimize_memory=True to downcast numerics and make low cardinality strings categorical.
+
+        >>> conn.select_into_dataframe('select * from fact', dtype_backend='pyarrow', optimize_memory=True)
+
         Args:
-            query: a sql query string or a dictionary with keys {'table','columns','filters'}.
+            query: a sql query string or a dictionary with keys {'table','columns','filters'},
+                optionally with 'order_by', 'limit' and 'after' (see select_pages).
+            partition_column: column to partition the query on, defaults to None for a single read
+            partitions: number of partitions, defaults to async_max_workers
+            partition_method: 'modulo' (integer column, abs(column modulo partitions) = n) or
+                'range' (numeric column, split between its min and max). Default is 'modulo'
+            optimize_memory: shrink the result with optimize_dataframe_memory (see
+                common_utils.data_handler.memory), defaults to False
+            **kwargs: passed to pandas.read_sql_query e.g. dtype_backend, dtype, parse_dates
 
         Return:
             pandas dataframe
         """
-        pass
+        select = partial(
+            self._select_into_dataframe_uncached,
+            query,
+            partition_column,
+            partitions,
+            partition_method,
+            optimize_memory,
+            **kwargs,
+        )
+        # uncommitted results aren't cached, they'd outlive a rollback
+        if self._result_cache is None or self._in_transaction:
+            return select()
+
+        sql, read_kwargs = _split_query(query, kwargs)
+        key = ResultCache.make_key(sql, optimize_memory=optimize_memory, **read_kwargs)
+        dataframe = self._result_cache.get(key)
+        if dataframe is None:
+            dataframe = self._result_cache.put(key, sql, select())
+        return dataframe
+
+    def _select_into_dataframe_uncached(
+        self,
+        query,
+        partition_column,
+        partitions,
+        partition_method,
+        optimize_memory,
+        **kwargs,
+    ):
+        if partition_column is None:
+            dataframe = self._select_into_dataframe(query, **kwargs)
+        else:
+            dataframe = self._select_partitioned_into_dataframe(
+                query=query,
+                partition_column=partition_column,
+                partitions=partitions or self.async_max_workers,
+                partition_method=partition_method,
+                **kwargs,
+            )
+
+        # after the partitions are concatenated so they share the same categories
+        return optimize_dataframe_memory(dataframe) if optimize_memory else dataframe
 
     @abstractmethod
-    def execute_statement(self, query):
+    def _select_into_dataframe(self, query, **kwargs):
         """
-        Execute a sql statement.
+        Engine specific select_into_dataframe, query is already parsed by QueryParser
 
         Args:
-            query: a sql query string
+            query: sql string or ParameterisedQuery
+            **kwargs: passed to pandas.read_sql_query
 
         Return:
-            None
+            pandas dataframe
         """
         pass
 
+    def _select_partitioned_into_dataframe(
+        self, query, partition_column, partitions, partition_method, **kwargs
+    ):
+        sql, params = (
+            (query.sql, query.params)
+            if isinstance(query, ParameterisedQuery)
+            else (query, {})
+        )
+        # the query is wrapped in a sub query so can't end with ;
+        sql = re.sub(r"[\s;]+$", "", sql)
+        subquery = f"SELECT * FROM ({sql}) partitioned_query"
+
+        if partition_method == "modulo":
+            predicates = [
+                (
+                    "ABS("
+                    + self._modulo_template.format(
+                        dividend=partition_column, divisor=":partition_count"
+                    )
+                    + ") = :partition_index",
+                    dict(partition_count=partitions, partition_index=index),
+                )
+                for index in range(partitions)
+            ]
+        elif partition_method == "range":
+            bounds = self._select_into_dataframe(
+                ParameterisedQuery(
+                    sql=f"SELECT MIN({partition_column}) lower_bound, MAX({partition_column}) upper_bound FROM ({sql}) partitioned_query",
+                    params=params,
+                )
+            ).iloc[0]
+            if pd.isna(bounds["lower_bound"]):
+                # no rows (or only nulls), partitioning is pointless
+                return self._select_into_dataframe(query, **kwargs)
+
+            lower_bound, upper_bound = bounds["lower_bound"], bounds["upper_bound"]
+            if isinstance(lower_bound, (int, np.integer)) and isinstance(
+                upper_bound, (int, np.integer)
+            ):
+                # python ints, floats can't hold bigints past 2**53 and would drop the last rows
+                lower_bound, upper_bound = int(lower_bound), int(upper_bound)
+                edges = [
+                    lower_bound + (upper_bound - lower_bound) * index // partitions
+                    for index in range(partitions + 1)
+                ]
+            else:
+                edges = np.linspace(
+                    float(lower_bound), float(upper_bound), partitions + 1
+                ).tolist()
+            predicates = [
+                (
+                    f"{partition_column} >= :partition_lower AND {partition_column} "
+                    + ("<=" if index == partitions - 1 else "<")
+                    + " :partition_upper",
+                    dict(partition_lower=lower, partition_upper=upper),
+                )
+                for index, (lower, upper) in enumerate(zip(edges[:-1], edges[1:]))
+            ]
+        else:
+            raise ValueError(
+                f"partition_method '{partition_method}' is not supported. Allowed values are: 'modulo', 'range'"
+            )
+
+        # rows with a null partition column don't match any predicate so go with the first partition
+        predicates[0] = (
+            f"({predicates[0][0]}) OR {partition_column} IS NULL",
+            predicates[0][1],
+        )
+
+        executor = self._get_executor("partition")
+        futures = [
+            executor.submit(
+                self._select_into_dataframe,
+                ParameterisedQuery(
+                    sql=f"{subquery} WHERE {predicate}",
+                    params={**params, **predicate_params},
+                ),
+                **kwargs,
+            )
+            for predicate, predicate_params in predicates
+        ]
+
+        return _concat_partitions([future.result() for future in futures])
+
     @abstractmethod
-    def insert_into_table(self, dataframe, table_name, if_exixts="append"):
+    def select_iter(self, query, chunksize=DEFAULT_CHUNKSIZE, **kwargs):
         """
-        Insert data from dataframe source table and target table, column names need to match
+        Same as select_into_dataframe but yields dataframes of at most chunksize rows
+        so the full result never has to be held in memory.
 
-        >> category = pd.DataFrame([
-                            [1,'b','f'],
-                            [2,'a','o'],
-                            [3,'r','z']
-                        ])
-        >> category.columns = ['a','b','c']
+        Postgres streams the rows through a server side cursor and sqlite reads the
+        cursor with fetchmany.
 
-        >> insert_data_frame_to_sql(category,'Category')
+        >>> for chunk in conn.select_iter('select * from big_table', chunksize=50_000):
+                ...
 
         Args:
-            dataframe: pandas dataframe to be insert
-            table_name: name of the table the dataframe is inserting into
-            if_exists: derive from pandas if_exists argument in pd.to_sql. Default is 'append'
+            query: a sql query string or a dictionary with keys {'table','columns','filters'}.
+            chunksize: maximum number of rows per dataframe. Default is DEFAULT_CHUNKSIZE
+            **kwargs: passed to pandas.read_sql_query (dtype, parse_dates, ...)
 
+        Return:
+            generator of pandas dataframes
         """
         pass
 
-    @abstractmethod
-    def get_all_objects(self):
+    def select_pages(self, query, page_size=DEFAULT_PAGE_SIZE, **kwargs):
         """
-        Gets a table of all the sql objects
+        Walk a table page by page with keyset pagination, each page is its own short
+        query seeking past the last row of the previous page (through the index on the
+        order_by columns) so every page costs the same, unlike OFFSET which reads and
+        throws away all the rows before the page.
+
+        >>> for page in conn.select_pages(
+                {"table": "big_table", "columns": [], "filters": {}, "order_by": ["id"]},
+                page_size=1_000,
+            ):
+                ...
+
+        Args:
+            query: dictionary with keys {'table','columns','filters','order_by'} and optionally
+                'after' to start after a given row. The order_by columns must be selected, unique
+                together and not null, a limit is replaced by page_size
+            page_size: maximum number of rows per page. Default is DEFAULT_PAGE_SIZE
+            **kwargs: passed to select_into_dataframe
 
         Return:
-            pandas dataframe of all the objects in the database along.
+            generator of pandas dataframes, the after of the next page is the order_by
+            columns of the last row
         """
-        pass
+        assert isinstance(query, dict) and query.get("order_by"), (
+            "select_pages needs a dictionary query with order_by columns to page through"
+        )
+        assert page_size > 0, f"page_size should be positive, got {page_size}"
+
+        order_by = query["order_by"]
+        order_columns = [order_by] if isinstance(order_by, str) else list(order_by)
+        page_query = {**query, "limit": page_size}
+        while True:
+            page = self.select_into_dataframe(page_query, **kwargs)
+            if len(page):
+                yield page
+            if len(page) < page_size:
+                return
+
+            # to_dict gives python scalars, which every driver can bind
+            page_query["after"] = page.iloc[[-1]][order_columns].to_dict("records")[0]
+
+    def select_into_file(
+        self,
+        query,
+        file_path,
+        chunksize=DEFAULT_CHUNKSIZE,
+        build_parent_dir=True,
+        file_options=None,
+        **kwargs,
+    ):
+        """
+        Stream the result of a query into a .parquet, .csv or .jsonl file, chunksize rows at a
+        time, so exports larger than memory can be written (see file.save_chunks_to_file).
+
+        >>> conn.select_into_file('select * from big_table', 'exports/big_table.parquet')
+
+        Args:
+            query: a sql query string or a dictionary with keys {'table','columns','filters'}.
+            file_path: string file path of the file to write
+            chunksize: number of rows read and written at a time (a parquet row group).
+                Default is DEFAULT_CHUNKSIZE
+            build_parent_dir: boolean, set to true to build parent dirs. Default is True
+            file_options: dictionary of keyword arguments passed to the file writer
+            **kwargs: passed to select_iter (dtype, parse_dates, ...)
+
+        Return:
+            number of rows written
+        """
+        return file.save_chunks_to_file(
+            self.select_iter(query, chunksize=chunksize, **kwargs),
+            file_path,
+            build_parent_dir=build_parent_dir,
+            **(file_options or {}),
+        )
+
+    def load_file_into_table(
+        self,
+        file_path,
+        table_name,
+        if_exists="append",
+        chunksize=DEFAULT_LOAD_CHUNKSIZE,
+        file_options=None,
+        **kwargs,
+    ):
+        """
+        Load a .parquet, .csv or .jsonl file (or a glob of them) into a table, chunksize rows
+        at a time through the engine's fastest insert path (COPY for postgres, executemany
+        for sqlite) so the files never have to fit in memory.
+
+        The files are read on up to async_max_workers threads while the chunks are being
+        inserted, rows from different files are interleaved. Each chunk is committed on its
+        own, load into a staging table if the load needs to be all or nothing.
+
+        >>> conn.load_file_into_table('exports/sales_*.parquet', 'sales')
+
+        Args:
+            file_path: string file path or glob
+            table_name: name of the table to load into
+            if_exists: see insert_into_table, 'replace' and 'fail' only apply before the first
+                chunk. Default is 'append'
+            chunksize: number of rows read and inserted at a time. Default is DEFAULT_LOAD_CHUNKSIZE
+            file_options: dictionary of keyword arguments passed to the file reader (see
+                file.read_file_chunks)
+            **kwargs: passed to insert_into_table e.g. key_columns, schema
+
+        Return:
+            number of rows loaded
+        """
+        file_paths = _expand_file_paths(file_path)
+        insert_kwargs = {**self._bulk_insert_options, **kwargs}
+        row_count = 0
+        for chunk in self._read_file_chunks(file_paths, chunksize, file_options or {}):
+            self.insert_into_table(
+                chunk, table_name, if_exists=if_exists, **insert_kwargs
+            )
+            if if_exists in ("replace", "fail"):
+                if_exists = "append"
+            row_count += len(chunk)
+        return row_count
+
+    def _read_file_chunks(self, file_paths, chunksize, file_options):
+        # readers put their chunks on a bounded queue so at most async_max_workers chunks
+        # wait to be inserted while the files keep being parsed
+        chunks = queue.Queue(maxsize=self.async_max_workers)
+        stop = threading.Event()
+        file_done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read(file_path):
+            try:
+                for chunk in file.read_file_chunks(
+                    file_path, chunksize, **file_options
+                ):
+                    if not put(chunk):
+                        return
+            except Exception as e:
+                put(e)
+            put(file_done)
+
+        executor = self._get_executor("load")
+        for file_path in file_paths:
+            executor.submit(read, file_path)
+
+        try:
+            files_left = len(file_paths)
+            while files_left:
+                item = chunks.get()
+                if item is file_done:
+                    files_left -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            # unblocks the readers still running when the load stops early
+            stop.set()
+
+    @abstractmethod
+    def execute_statement(self, query):
+        """
+        Execute a sql statement.
+
+        Args:
+            query: a sql query string
+
+        Return:
+            None
+        """
+        pass
+
+    @instrumented
+    @QueryParser
+    def execute_script(self, query):
+        """
+        Execute several sql statements in a single transaction over one connection, either
+        all of them are committed or none are. Cheaper than calling execute_statement for each
+        statement as there's one connection checkout and one commit for the whole script.
+
+        >>> conn.execute_script([
+            'delete from table_staging',
+            {'table': ..., 'columns': [...], 'filters': {...}},
+            'update table_staging set status = 1',
+        ])
+
+        Args:
+            query: sql string of statements separated by ;, or list of sql strings/dictionaries
+                (see select_into_dataframe) to execute in order
+
+        Return:
+            list with the number of rows affected by each statement, -1 when it isn't
+            applicable (e.g. ddl)
+        """
+        statements = [
+            _split_query(statement, {})
+            for statement in (
+                sqlparse.split(query) if isinstance(query, str) else query
+            )
+            if not isinstance(statement, str) or statement.strip()
+        ]
+        rowcounts = self._execute_script(
+            [(sql, kwargs.get("params")) for sql, kwargs in statements]
+        )
+        for sql, _ in statements:
+            self._invalidate_caches_on_statement(sql)
+        return rowcounts
+
+    @abstractmethod
+    def _execute_script(self, statements):
+        """
+        Engine specific execute_script, the statements are already parsed and split
+
+        Args:
+            statements: list of (sql string, parameters dictionary or None) tuples
+
+        Return:
+            list of int row counts, one per statement
+        """
+        pass
+
+    @abstractmethod
+    def insert_into_table(
+        self, dataframe, table_name, if_exists="append", key_columns=None
+    ):
+        """
+        Insert data from dataframe source table and target table, column names need to match
+
+        >> category = pd.DataFrame([
+                            [1,'b','f'],
+                            [2,'a','o'],
+                            [3,'r','z']
+                        ])
+        >> category.columns = ['a','b','c']
+
+        >> insert_data_frame_to_sql(category,'Category')
+
+        Args:
+            dataframe: pandas dataframe to be insert
+            table_name: name of the table the dataframe is inserting into
+            if_exists: derive from pandas if_exists argument in pd.to_sql. Default is 'append'.
+                'upsert' inserts the new rows and updates the rows whose key_columns already
+                exist in a single statement (the table is created if it doesn't exist)
+            key_columns: list of columns identifying a row, required when if_exists is 'upsert'
+
+        """
+        pass
+
+    def _is_upsert_into_existing_table(
+        self, dataframe, table_name, if_exists, key_columns, schema_name=None
+    ):
+        # upserting into a table that doesn't exist yet is just creating it
+        if if_exists != "upsert":
+            return False
+
+        if not key_columns:
+            raise ValueError("key_columns are required when if_exists is 'upsert'")
+        missing_columns = set(key_columns) - set(dataframe.columns)
+        if missing_columns:
+            raise ValueError(
+                f"key_columns {sorted(missing_columns)} are not columns of the dataframe"
+            )
+        return bool(self.find_objects(table_name=table_name, schema_name=schema_name))
+
+    @abstractmethod
+    def upsert_from_table(
+        self,
+        source_table_name,
+        table_name,
+        columns,
+        key_columns,
+        compare_columns=None,
+        schema=None,
+    ):
+        """
+        Upsert every row of a table (e.g. a staging table) into another with a single set based
+        statement. Rows with new keys are inserted, existing rows are updated only when one of
+        compare_columns changed and identical rows are left as they are.
+        table_name needs a unique constraint/index on key_columns.
+
+        >>> conn.upsert_from_table('fact_staging', 'fact', ['id', 'val'], key_columns=['id'])
+        {'new': 1, 'updated': 1, 'unchanged': 1}
+
+        Args:
+            source_table_name: name of the table holding the rows
+            table_name: name of the table to upsert into
+            columns: list of the columns to insert/update, in both tables
+            key_columns: list of columns identifying a row
+            compare_columns: list of columns compared to tell updated rows from unchanged ones,
+                defaults to None for every column not in key_columns
+            schema: schema of both tables, defaults to None
+
+        Return:
+            dictionary of the number of 'new', 'updated' and 'unchanged' rows
+        """
+        pass
+
+    @abstractmethod
+    def _get_all_objects(self):
+        """
+        Query the catalog for all the sql objects
+
+        Return:
+            pandas dataframe with ALL_OBJECTS_REQUIRED_COLUMNS columns
+        """
+        pass
+
+    def get_all_objects(self, refresh=False):
+        """
+        Gets a table of all the sql objects. The result is cached for catalog_ttl seconds.
+
+        Args:
+            refresh: query the catalog even if the cached objects haven't expired
+
+        Return:
+            pandas dataframe of all the objects in the database along.
+        """
+        if (
+            refresh
+            or self._catalog is None
+            or time.monotonic() - self._catalog_loaded_at > self.catalog_ttl
+        ):
+            catalog = self._get_all_objects()
+
+            # index the objects by (object_type, table_name) so lookups are a dict access
+            catalog_index = {}
+            for record in catalog.to_dict("records"):
+                catalog_index.setdefault(
+                    (record["object_type"], record["table_name"]), []
+                ).append(record)
+
+            self._catalog = catalog
+            self._catalog_index = catalog_index
+            self._catalog_loaded_at = time.monotonic()
+
+        return self._catalog.copy()
+
+    def find_objects(self, table_name, object_type="table", schema_name=None):
+        """
+        Look up objects of a table in the (cached) catalog.
+
+        Args:
+            table_name: name of the table the objects belong to
+            object_type: type of object e.g. 'table', 'index', 'view'. Default is 'table'
+            schema_name: only return objects in this schema, defaults to None for all schemas
+
+        Return:
+            list of dictionaries with ALL_OBJECTS_REQUIRED_COLUMNS keys
+        """
+        self.get_all_objects()
+        return [
+            record
+            for record in self._catalog_index.get((object_type, table_name), [])
+            if schema_name is None or record["schema_name"] == schema_name
+        ]
+
+    def invalidate_catalog(self):
+        """
+        Drop the cached catalog so the next get_all_objects queries the database.
+        """
+        self._catalog = None
+        self._catalog_index = None
+        self._catalog_loaded_at = None
+
+    def clear_result_cache(self):
+        """
+        Drop every cached select_into_dataframe result (e.g. after the data was changed by another process).
+        """
+        if self._result_cache is not None:
+            self._result_cache.clear()
+
+    def _invalidate_result_cache(self, table_name):
+        if self._result_cache is not None:
+            self._result_cache.invalidate_tables(table_name)
+
+    def _invalidate_caches_on_statement(self, sql):
+        if _DDL_PATTERN.search(sql):
+            self.invalidate_catalog()
+            self.clear_result_cache()
+        elif self._result_cache is not None:
+            self._result_cache.invalidate_statement(sql)
+
+    def _invalidate_catalog_on_insert(self, table_name):
+        # inserting into a table that isn't in the catalog yet means it's being created
+        if self._catalog_index is not None and not self.find_objects(
+            table_name=table_name.split(".")[-1]
+        ):
+            self.invalidate_catalog()
 
     @abstractmethod
     def get_table_details(self):
@@ -178,8 +1436,42 @@ class DatabaseConnection(ABC):
         """
         pass
 
+    def get_tables_details(self, tables):
+        """
+        Gets the columns of many tables with a single catalog query, tables that don't
+        exist are left out of the result.
+
+        Args:
+            tables: list of (schema_name, table_name) tuples or table names in the default schema
+
+        Return:
+            pandas dataframe with TABLES_DETAILS_COLUMNS columns, ordered by schema, table and column position
+        """
+        tables = list(tables)
+        if not tables:
+            return pd.DataFrame(columns=TABLES_DETAILS_COLUMNS)
+        return self._get_tables_details(tables)[TABLES_DETAILS_COLUMNS]
+
+    @abstractmethod
+    def _get_tables_details(self, tables):
+        """
+        Query the catalog for the columns of the tables
+
+        Args:
+            tables: non empty list of (schema_name, table_name) tuples or table names
+
+        Return:
+            pandas dataframe with TABLES_DETAILS_COLUMNS columns
+        """
+        pass
+
 
 class PostgresConnection(DatabaseConnection, connection_engine="postgres"):
+    _bulk_insert_options = {"method": "copy"}
+    # bumped by every schema change made by any object of the process, the pooled connections
+    # deallocate their prepared statements on next use
+    _schema_generation = 0
+
     def __init__(
         self,
         database_name="postgres",
@@ -187,121 +1479,774 @@ class PostgresConnection(DatabaseConnection, connection_engine="postgres"):
         host="localhost",
         port=5432,
         user="postgres",
+        pool_size=DEFAULT_POOL_SETTINGS["pool_size"],
+        max_overflow=DEFAULT_POOL_SETTINGS["max_overflow"],
+        pool_pre_ping=DEFAULT_POOL_SETTINGS["pool_pre_ping"],
+        pool_recycle=DEFAULT_POOL_SETTINGS["pool_recycle"],
+        share_pool=True,
+        statement_cache_size=DEFAULT_STATEMENT_CACHE_SIZE,
         *args,
         **kwargs,
     ):
+        """
+        Args:
+            database_name: name of the database
+            password: password of the user, this is sensitive so load from env
+            host: database host
+            port: database port
+            user: database user
+            pool_size: number of connections kept open in the pool
+            max_overflow: number of connections allowed on top of pool_size
+            pool_pre_ping: test connections for liveness when they are checked out (every call)
+            pool_recycle: seconds after which a pooled connection is recycled, -1 to never recycle
+            share_pool: share the engine/pool with other objects using the same dsn and pool settings.
+                If False, the engine is disposed when the connection is closed.
+            statement_cache_size: number of parameterised (dictionary) queries kept prepared server side
+                per connection, 0 to bind the parameters without preparing
+        """
         self.database_name = database_name
         self.password = password
         self.host = host
         self.port = port
         self.user = user
-
-    def __exit__(self, type, value, tb):
-        self.database_connection.close()
-        self._engine.dispose()
+        self.pool_settings = dict(
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_pre_ping=pool_pre_ping,
+            pool_recycle=pool_recycle,
+        )
+        self.share_pool = share_pool
+        self.statement_cache_size = statement_cache_size
+        self._engine = None
+        super().__init__(**kwargs)
 
     @property
-    def database_connection(self):
-        try:
+    def engine(self):
+        if self._engine is None:
             # https://www.project-open.com/en/howto-postgresql-port-secure-remote-access#:~:text=Open%20Windows%20Firewall%20Port&text=As%20an%20alternative%20you%20can,Specific%20local%20ports%3A%205432
 
             # using sqlalchemy instead of psycopg2 since pandas throws warning if the conn isn't sqlalchemy
             # return psycopg2.connect(**self.connection_dict)
-            self._engine = sqlalchemy.create_engine(
-                f"postgresql+psycopg2://{self.user}:{self.password}@{self.host}:{self.port}/{self.database_name}"
+            url = f"postgresql+psycopg2://{self.user}:{self.password}@{self.host}:{self.port}/{self.database_name}"
+            self._engine = (
+                _get_shared_engine(url, **self.pool_settings)
+                if self.share_pool
+                else _create_engine(url, **self.pool_settings)
+            )
+        return self._engine
+
+    def _open_connection(self):
+        # checks out a connection from the pool, only kept by the thread for a transaction()
+        return self.engine.connect()
+
+    def close(self):
+        # returns the connection to the pool
+        super().close()
+        if not self.share_pool and self._engine is not None:
+            self._engine.dispose()
+            self._engine = None
+
+    @contextmanager
+    def _statement_scope(self):
+        if self._in_transaction:
+            # the thread's connection, ended by transaction()
+            yield self.database_connection
+            return
+
+        # checked out for the call only so threads (async calls, partitioned reads) and objects
+        # share the pool rather than each holding a connection, and it's pre pinged every time
+        with timed("acquire_seconds"):
+            conn = self.engine.connect()
+        with conn:
+            try:
+                yield conn
+            except BaseException:
+                # BaseException so a generator closed early (GeneratorExit) also ends the transaction
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def _begin_transaction(self):
+        conn = self.database_connection
+        # begun explicitly rather than on the first statement, otherwise pandas (insert_into_table)
+        # sees no transaction in progress and commits its own
+        if not conn.in_transaction():
+            conn.begin()
+
+    def _end_transaction(self, commit):
+        conn = self.database_connection
+        try:
+            if not commit:
+                conn.rollback()
+                return
+            try:
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        finally:
+            self._release_connection()
+
+    def invalidate_catalog(self):
+        super().invalidate_catalog()
+        PostgresConnection._schema_generation += 1
+
+    def _prepare_statement(self, conn, query):
+        """
+        PREPARE a parameterised query server side (once per pooled connection) so postgres
+        can reuse its plan across calls with different values.
+
+        Args:
+            conn: sqlalchemy connection
+            query: ParameterisedQuery with :name placeholders
+
+        Return:
+            ParameterisedQuery executing the prepared statement with the same parameters
+        """
+        if not self.statement_cache_size:
+            return ParameterisedQuery(sql=text(query.sql), params=query.params)
+
+        # prepared statements live as long as the session so they are tracked on the
+        # dbapi connection, which outlives this object when it goes back to the pool
+        info = conn.connection.info
+        if (
+            info.get(_PREPARED_GENERATION_INFO_KEY)
+            != PostgresConnection._schema_generation
+        ):
+            # the schema changed since they were prepared, a plan whose result type changed
+            # (e.g. select * after a column was added) would fail to execute
+            if info.get(_PREPARED_STATEMENTS_INFO_KEY):
+                conn.exec_driver_sql("DEALLOCATE ALL", execution_options=_NO_PARAMETERS)
+            info[_PREPARED_STATEMENTS_INFO_KEY] = OrderedDict()
+            info[_PREPARED_GENERATION_INFO_KEY] = PostgresConnection._schema_generation
+        prepared_statements = info[_PREPARED_STATEMENTS_INFO_KEY]
+        names = list(query.params)
+
+        if query.sql in prepared_statements:
+            prepared_statements.move_to_end(query.sql)
+        else:
+            if len(prepared_statements) >= self.statement_cache_size:
+                _, evicted_name = prepared_statements.popitem(last=False)
+                conn.exec_driver_sql(
+                    f"DEALLOCATE {evicted_name}", execution_options=_NO_PARAMETERS
+                )
+
+            positions = {name: position for position, name in enumerate(names, 1)}
+            positional_sql = _PLACEHOLDER_PATTERN.sub(
+                lambda match: (
+                    f"${positions[match.group(1)]}"
+                    if match.group(1) in positions
+                    else match.group(0)
+                ),
+                query.sql,
+            )
+            statement_name = (
+                f"{_PREPARED_STATEMENTS_INFO_KEY}_{next(_PREPARED_STATEMENT_NAMES)}"
             )
-            return self._engine.connect()
-        except Exception as e:
-            raise e
+            # sent like pandas sends select strings (so %% escaping means the same thing)
+            conn.exec_driver_sql(f"PREPARE {statement_name} AS {positional_sql}")
+            prepared_statements[query.sql] = statement_name
 
+        return ParameterisedQuery(
+            sql=f"EXECUTE {prepared_statements[query.sql]} ({', '.join(f'%({name})s' for name in names)})",
+            params=query.params,
+        )
+
+    def _select_into_dataframe(self, query, **kwargs):
+        with self._statement_scope() as conn:
+            if isinstance(query, ParameterisedQuery) and query.params:
+                query = self._prepare_statement(conn, query)
+            sql, kwargs = _split_query(query, kwargs)
+            return pd.read_sql_query(sql, conn, **kwargs)
+
+    @instrumented
     @QueryParser
-    def select_into_dataframe(self, query, **kwargs):
-        return pd.read_sql_query(query, self.database_connection, **kwargs)
+    def select_iter(self, query, chunksize=DEFAULT_CHUNKSIZE, **kwargs):
+        sql, kwargs = _split_query(query, kwargs)
+        with self._streaming_scope() as conn:
+            # stream_results makes psycopg2 use a named (server side) cursor so only
+            # max_row_buffer rows are held client side at any time. It's a connection option
+            # to keep plain strings sent as is like select_into_dataframe does (pandas uses
+            # exec_driver_sql), only parameterised queries go through text for their :name
+            previous_options = conn.get_execution_options()
+            conn.execution_options(stream_results=True, max_row_buffer=chunksize)
+            try:
+                # executed here, the chunks are then fetched from the open cursor
+                chunks = pd.read_sql_query(
+                    text(sql) if "params" in kwargs else sql,
+                    conn,
+                    chunksize=chunksize,
+                    **kwargs,
+                )
+            finally:
+                # the calls made while iterating (within a transaction) use the same connection
+                conn.execution_options(**{"stream_results": False, **previous_options})
+            yield from chunks
 
+    @contextmanager
+    def _streaming_scope(self):
+        if self._in_transaction:
+            # the cursor lives until the transaction ends and sees its uncommitted writes
+            yield self.database_connection
+            return
+
+        # a connection of its own for as long as the rows are read, the commit of any other
+        # call made while iterating (e.g. inserting the chunks) would close the named cursor
+        with timed("acquire_seconds"):
+            conn = self.engine.connect()
+        with conn:
+            yield conn
+
+    @instrumented
     @QueryParser
     def execute_statement(self, query):
-        query = text(f"{query.strip()}; COMMIT;")
-        try:
-            with self.database_connection.begin():
-                # not able to execute script like sqlite :(
-                self.database_connection.execute(
-                    query.execution_options(
-                        autocommit=True
-                    )  # auto commit doesn't do anything here???
-                )
-        except Exception as e:
-            raise e
+        sql, kwargs = _split_query(query, {})
+        with self._statement_scope() as conn:
+            if kwargs:
+                conn.execute(text(sql), kwargs["params"])
+            else:
+                # no_parameters sends the script as is (multiple statements allowed)
+                # without the driver trying to interpolate % or :name
+                conn.exec_driver_sql(sql, execution_options=_NO_PARAMETERS)
+        self._invalidate_caches_on_statement(sql)
+
+    def _execute_script(self, statements):
+        # psycopg2 has no pipeline mode, the statements go one by one over the same
+        # connection but inside one transaction
+        with self._statement_scope() as conn:
+            return [
+                (
+                    conn.execute(text(sql), params)
+                    if params
+                    else conn.exec_driver_sql(sql, execution_options=_NO_PARAMETERS)
+                ).rowcount
+                for sql, params in statements
+            ]
+
+    @instrumented
+    def insert_into_table(
+        self,
+        dataframe,
+        table_name,
+        if_exists="append",
+        key_columns=None,
+        method=None,
+        **kwargs,
+    ):
+        """
+        See DatabaseConnection.insert_into_table.
+
+        Postgres also accepts method="copy" to bulk load the dataframe with
+        COPY ... FROM STDIN (in chunks of DEFAULT_COPY_CHUNKSIZE rows unless chunksize is
+        passed). pandas still creates/replaces the table as per if_exists.
 
-    def insert_into_table(self, dataframe, table_name, if_exists="append", **kwargs):
+        With if_exists="upsert" the dataframe is loaded (with method) into a temporary table
+        and applied with a single MERGE on postgres 15+, or INSERT ... ON CONFLICT on older
+        servers which needs a unique constraint on key_columns.
+        """
         assert isinstance(dataframe, pd.DataFrame), "Use dataframe as data source"
+        if if_exists == "replace":
+            self.invalidate_catalog()
+        else:
+            self._invalidate_catalog_on_insert(table_name)
 
-        dataframe.to_sql(
-            name=table_name,
-            con=self.database_connection,
-            index=False,
-            if_exists=if_exists,
-            **kwargs,
-        )
+        if method == "copy":
+            method = _copy_from_stdin
+            kwargs.setdefault("chunksize", DEFAULT_COPY_CHUNKSIZE)
+
+        if self._is_upsert_into_existing_table(
+            dataframe, table_name, if_exists, key_columns, kwargs.get("schema")
+        ):
+            self._upsert_into_table(
+                dataframe, table_name, key_columns, method, **kwargs
+            )
+            self._invalidate_result_cache(table_name)
+            return
+
+        with self._statement_scope() as conn:
+            dataframe.to_sql(
+                name=table_name,
+                con=conn,
+                index=False,
+                if_exists="append" if if_exists == "upsert" else if_exists,
+                method=method,
+                **kwargs,
+            )
+        self._invalidate_result_cache(table_name)
+
+    def _upsert_into_table(
+        self, dataframe, table_name, key_columns, method, schema=None, **kwargs
+    ):
+        target_table_name = _quote_table_name(table_name, schema)
+        # temporary tables are per session and the connection is per thread so the name
+        # can't clash, it's dropped once applied (or at commit/rollback if that fails)
+        temp_table_name = f"_{pkg_name}_upsert"
+        columns = list(dataframe.columns)
+
+        with self._statement_scope() as conn:
+            conn.exec_driver_sql(
+                f'CREATE TEMPORARY TABLE "{temp_table_name}" ON COMMIT DROP AS '
+                f"SELECT {_quote_columns(columns)} FROM {target_table_name} WITH NO DATA"
+            )
+            dataframe.to_sql(
+                name=temp_table_name,
+                con=conn,
+                index=False,
+                if_exists="append",
+                method=method,
+                **kwargs,
+            )
+            build_sql = (
+                _merge_sql if conn.dialect.server_version_info >= (15,) else _upsert_sql
+            )
+            conn.exec_driver_sql(
+                build_sql(
+                    target_table_name, f'"{temp_table_name}"', columns, key_columns
+                ),
+                execution_options=_NO_PARAMETERS,
+            )
+            # a transaction() can upsert again before it commits
+            conn.exec_driver_sql(f'DROP TABLE "{temp_table_name}"')
+
+    @instrumented
+    def upsert_from_table(
+        self,
+        source_table_name,
+        table_name,
+        columns,
+        key_columns,
+        compare_columns=None,
+        schema=None,
+    ):
+        """
+        See DatabaseConnection.upsert_from_table.
 
-    def get_all_objects(self):
-        sql = _read_internal_resource(
-            f"{_RESOURCE_PATH}/{self.connection_engine}/get_all_objects.sql"
+        postgres classifies the rows in the same statement, xmax (the id of the transaction
+        that deleted/locked the row version) is 0 for the rows inserted and set for the
+        rows updated through ON CONFLICT.
+        """
+        upsert_sql = _upsert_sql(
+            _quote_table_name(table_name, schema),
+            "staged",
+            columns,
+            key_columns,
+            compare_columns
+            or [column for column in columns if column not in key_columns],
+        )
+        # staged is referenced twice so it's materialised and the source is read once
+        sql = (
+            f"WITH staged AS (SELECT {_quote_columns(columns)} "
+            f"FROM {_quote_table_name(source_table_name, schema)}), "
+            f"upserted AS ({upsert_sql} RETURNING (xmax = 0) AS is_new) "
+            "SELECT count(*) FILTER (WHERE is_new) AS new, "
+            "count(*) FILTER (WHERE NOT is_new) AS updated, "
+            "(SELECT count(*) FROM staged) - count(*) AS unchanged "
+            "FROM upserted"
         )
+        with self._statement_scope() as conn:
+            counts = (
+                conn.exec_driver_sql(sql, execution_options=_NO_PARAMETERS)
+                .mappings()
+                .one()
+            )
+        self._invalidate_result_cache(table_name)
+        return dict(counts)
+
+    def _get_all_objects(self):
+        sql = _read_sql_resource(self.connection_engine, "get_all_objects")
         return self.select_into_dataframe(sql)[ALL_OBJECTS_REQUIRED_COLUMNS]
 
     def get_table_details(self, table_name, schema_name):
-        sql = _read_internal_resource(
-            f"{_RESOURCE_PATH}/{self.connection_engine}/get_object_details.sql"
-        ).format(
+        sql = _read_sql_resource(self.connection_engine, "get_object_details").format(
             schema=schema_name,
             table_name=table_name,
         )
         return self.select_into_dataframe(sql)
 
+    def _get_tables_details(self, tables):
+        schema_names, table_names = _split_schema_table_names(tables, "public")
+        return self.select_into_dataframe(
+            ParameterisedQuery(
+                sql=_read_sql_resource(self.connection_engine, "get_tables_details"),
+                params={"schema_names": schema_names, "table_names": table_names},
+            )
+        )
+
+
+class _TimedSqliteCursor(sqlite3.Cursor):
+    # times the statements pandas runs on its cursors for the query hooks
+    def execute(self, *args):
+        with timed("execute_seconds"):
+            return super().execute(*args)
+
+    def executemany(self, *args):
+        with timed("execute_seconds"):
+            return super().executemany(*args)
+
+
+class _TimedSqliteConnection(sqlite3.Connection):
+    # set while a DatabaseConnection.transaction is open, pandas commits after writing
+    hold_commits = False
+
+    def commit(self):
+        if not self.hold_commits:
+            super().commit()
+
+    # the connection shortcuts don't go through cursor() so they're timed separately
+    def cursor(self, factory=_TimedSqliteCursor):
+        return super().cursor(factory)
+
+    def execute(self, *args):
+        with timed("execute_seconds"):
+            return super().execute(*args)
+
+    def executemany(self, *args):
+        with timed("execute_seconds"):
+            return super().executemany(*args)
+
+    def executescript(self, *args):
+        with timed("execute_seconds"):
+            return super().executescript(*args)
+
 
 class SqliteConnection(DatabaseConnection, connection_engine="sqlite"):
+    _bulk_insert_options = {"method": "executemany"}
+
     def __init__(
         self,
         database_file_path="database.db",
+        high_throughput=False,
+        pragmas=None,
+        batch_size=DEFAULT_SQLITE_BATCH_SIZE,
+        statement_cache_size=DEFAULT_STATEMENT_CACHE_SIZE,
+        read_pool_size=None,
         *args,
         **kwargs,
     ):
+        """
+        Args:
+            database_file_path: path of the sqlite database file
+            high_throughput: opt in to the bulk write profile. Sets HIGH_THROUGHPUT_SQLITE_PRAGMAS
+                (WAL, synchronous=NORMAL, ...) and inserts through executemany in a single transaction
+            pragmas: dictionary of extra pragmas set on the connection, overrides the profile's pragmas
+            batch_size: rows bound per executemany call when inserting
+            statement_cache_size: number of compiled statements sqlite3 keeps per connection
+                (cached_statements), parameterised dictionary queries reuse them
+            read_pool_size: opt in to the concurrent profile for multi threaded readers. Reads go
+                through a pool of up to read_pool_size read only connections shared by the threads
+                and writes through a single connection, one at a time. Sets SQLITE_READ_POOL_PRAGMAS
+                (WAL so readers don't block on the writer). Defaults to None for a connection per thread
+        """
         self.database_file_path = file.prepare_file_path(Path(database_file_path))
+        self.high_throughput = high_throughput
+        self.pragmas = {
+            **(HIGH_THROUGHPUT_SQLITE_PRAGMAS if high_throughput else {}),
+            **(SQLITE_READ_POOL_PRAGMAS if read_pool_size else {}),
+            **(pragmas or {}),
+        }
+        self.batch_size = batch_size
+        self.statement_cache_size = statement_cache_size
+
+        self.read_pool_size = read_pool_size
+        self._writer = None
+        self._writer_open_lock = threading.Lock()
+        # writes are serialised in process rather than failing with "database is locked"
+        self._write_lock = threading.RLock() if read_pool_size else nullcontext()
+        self._readers = queue.LifoQueue()
+        self._reader_slots = threading.BoundedSemaphore(read_pool_size or 1)
+        super().__init__(**kwargs)
+
+    def _open_connection(self):
+        # opening a sqlite file is cheap so there is no pool, the single connection is reused
+        conn = sqlite3.connect(
+            self.database_file_path,
+            cached_statements=self.statement_cache_size,
+            # every thread has its own connection, this only allows close() from another thread
+            check_same_thread=False,
+            factory=_TimedSqliteConnection,
+        )
+        for pragma, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
+
+    def _open_reader(self):
+        conn = sqlite3.connect(
+            f"{self.database_file_path.resolve().as_uri()}?mode=ro",
+            uri=True,
+            cached_statements=self.statement_cache_size,
+            # pooled connections are used by whichever thread checks them out
+            check_same_thread=False,
+            factory=_TimedSqliteConnection,
+        )
+        for pragma, value in self.pragmas.items():
+            if pragma not in _SQLITE_WRITER_PRAGMAS:
+                conn.execute(f"PRAGMA {pragma} = {value}")
+        return conn
 
     @property
     def database_connection(self):
+        if not self.read_pool_size:
+            return super().database_connection
+
+        # the single writer shared by the threads, use it within _writer_scope
+        with self._writer_open_lock:
+            if self._writer is None:
+                with timed("acquire_seconds"):
+                    self._writer = self._open_connection()
+                with self._connections_lock:
+                    self._connections.append(self._writer)
+            return self._writer
+
+    @contextmanager
+    def _writer_scope(self):
+        with self._write_lock:
+            yield self.database_connection
+
+    @contextmanager
+    def _reader_scope(self):
+        # within a transaction() the reads have to see its uncommitted writes
+        if not self.read_pool_size or self._in_transaction:
+            yield self.database_connection
+            return
+
+        with timed("acquire_seconds"):
+            # the writer creates the database file and switches it to WAL
+            self.database_connection
+            self._reader_slots.acquire()
+            try:
+                conn = self._readers.get_nowait()
+            except queue.Empty:
+                try:
+                    conn = self._open_reader()
+                except BaseException:
+                    self._reader_slots.release()
+                    raise
+                with self._connections_lock:
+                    self._connections.append(conn)
         try:
-            return sqlite3.connect(self.database_file_path)
-        except Exception as e:
-            raise e
+            yield conn
+        finally:
+            self._readers.put(conn)
+            self._reader_slots.release()
 
+    @contextmanager
+    def _transaction_scope(self, conn, begin=True):
+        if self._in_transaction:
+            # ended by transaction()
+            yield conn
+            return
+
+        # A Connection object can be used as a context manager that automatically commits or rolls back open transactions when leaving the body of the context manager.
+        # If the body of the with statement finishes without exceptions, the transaction is committed.
+        # If this commit fails, or if the body of the with statement raises an uncaught exception, the transaction is rolled back
+        with conn:
+            if begin:
+                # sqlite3 only opens a transaction implicitly before insert/update/delete,
+                # begin explicitly so ddl is rolled back with the rest
+                conn.execute("BEGIN")
+            yield conn
+
+    def _begin_transaction(self):
+        if self.read_pool_size:
+            # held until the end so other threads can't write in the middle of it
+            self._write_lock.acquire()
+        try:
+            conn = self.database_connection
+            conn.execute("BEGIN")
+        except BaseException:
+            if self.read_pool_size:
+                self._write_lock.release()
+            raise
+        conn.hold_commits = True
+
+    def _end_transaction(self, commit):
+        conn = self.database_connection
+        conn.hold_commits = False
+        try:
+            if commit:
+                try:
+                    conn.commit()
+                except BaseException:
+                    conn.rollback()
+                    raise
+            else:
+                conn.rollback()
+        finally:
+            if self.read_pool_size:
+                self._write_lock.release()
+
+    def close(self):
+        super().close()
+        self._writer = None
+        self._readers = queue.LifoQueue()
+
+    def _select_into_dataframe(self, query, **kwargs):
+        sql, kwargs = _split_query(query, kwargs)
+        with self._reader_scope() as conn:
+            return pd.read_sql_query(sql, conn, **kwargs)
+
+    @instrumented
     @QueryParser
-    def select_into_dataframe(self, query, **kwargs):
-        return pd.read_sql_query(query, self.database_connection, **kwargs)
+    def select_iter(self, query, chunksize=DEFAULT_CHUNKSIZE, **kwargs):
+        sql, kwargs = _split_query(query, kwargs)
+        # pandas reads the sqlite cursor with fetchmany(chunksize)
+        with self._reader_scope() as conn:
+            yield from pd.read_sql_query(sql, conn, chunksize=chunksize, **kwargs)
 
+    @instrumented
     @QueryParser
     def execute_statement(self, query):
-        with self.database_connection as conn:
-            # A Connection object can be used as a context manager that automatically commits or rolls back open transactions when leaving the body of the context manager.
-            # If the body of the with statement finishes without exceptions, the transaction is committed.
-            # If this commit fails, or if the body of the with statement raises an uncaught exception, the transaction is rolled back
-            conn.executescript(query)
-            # conn.cursor().lastrowid
-            # cursor.commit()
-
-    def insert_into_table(self, dataframe, table_name, if_exixts="append"):
+        sql, kwargs = _split_query(query, {})
+        with (
+            self._writer_scope() as conn,
+            self._transaction_scope(conn, begin=False),
+        ):
+            if kwargs:
+                conn.execute(sql, kwargs["params"])
+            elif self._in_transaction:
+                # executescript would commit the open transaction first
+                for statement in sqlparse.split(sql):
+                    conn.execute(statement)
+            else:
+                conn.executescript(sql)
+        self._invalidate_caches_on_statement(sql)
+        # conn.cursor().lastrowid
+        # cursor.commit()
+
+    def _execute_script(self, statements):
+        with self._writer_scope() as conn, self._transaction_scope(conn):
+            return [
+                conn.execute(sql, params or ()).rowcount for sql, params in statements
+            ]
+
+    @instrumented
+    def insert_into_table(
+        self,
+        dataframe,
+        table_name,
+        if_exists="append",
+        key_columns=None,
+        method=None,
+        batch_size=None,
+    ):
+        """
+        See DatabaseConnection.insert_into_table.
+
+        sqlite also accepts method="executemany" (the default when high_throughput is set)
+        to bind the rows with executemany in batches of batch_size, all in a single transaction.
+        pandas still creates/replaces the table as per if_exists.
+
+        With if_exists="upsert" the dataframe is loaded into a temporary table and applied with
+        a single INSERT ... ON CONFLICT, which needs a unique index on key_columns.
+        """
         assert isinstance(dataframe, pd.DataFrame), "Use dataframe as data source"
-        dataframe.to_sql(
-            name=table_name,
-            con=self.database_connection,
-            index=False,
-            if_exists=if_exixts,
+        self._invalidate_catalog_on_insert(table_name)
+
+        if method is None and self.high_throughput:
+            method = "executemany"
+
+        is_upsert = self._is_upsert_into_existing_table(
+            dataframe, table_name, if_exists, key_columns
         )
+        with self._writer_scope() as conn:
+            if is_upsert:
+                self._upsert_into_table(
+                    conn, dataframe, table_name, key_columns, batch_size
+                )
+            elif method != "executemany":
+                dataframe.to_sql(
+                    name=table_name,
+                    con=conn,
+                    index=False,
+                    if_exists="append" if if_exists == "upsert" else if_exists,
+                    method=method,
+                )
+            else:
+                # let pandas deal with if_exists (and creating the table) using an empty frame
+                dataframe.head(0).to_sql(
+                    name=table_name,
+                    con=conn,
+                    index=False,
+                    if_exists="append" if if_exists == "upsert" else if_exists,
+                )
+
+                with self._transaction_scope(conn, begin=False):
+                    self._executemany_insert(
+                        conn, dataframe, f'"{table_name}"', batch_size
+                    )
+        self._invalidate_result_cache(table_name)
+
+    def _executemany_insert(self, conn, dataframe, table_name, batch_size=None):
+        placeholders = ", ".join("?" for _ in dataframe.columns)
+        sql = f"INSERT INTO {table_name} ({_quote_columns(dataframe.columns)}) VALUES ({placeholders})"
+        for chunk in chunk_iter(dataframe, batch_size or self.batch_size):
+            conn.executemany(sql, _to_sqlite_records(chunk))
+
+    def _upsert_into_table(
+        self, conn, dataframe, table_name, key_columns, batch_size=None
+    ):
+        temp_table_name = f'temp."_{pkg_name}_upsert"'
+        columns = list(dataframe.columns)
 
-    def get_all_objects(self):
-        sql = _read_internal_resource(
-            f"{_RESOURCE_PATH}/{self.connection_engine}/get_all_objects.sql"
+        # the temporary table is created inside the transaction so it's gone on rollback
+        with self._transaction_scope(conn):
+            conn.execute(
+                f"CREATE TEMPORARY TABLE {temp_table_name} AS "
+                f'SELECT {_quote_columns(columns)} FROM "{table_name}" WHERE false'
+            )
+            self._executemany_insert(conn, dataframe, temp_table_name, batch_size)
+            conn.execute(
+                _upsert_sql(f'"{table_name}"', temp_table_name, columns, key_columns)
+            )
+            conn.execute(f"DROP TABLE {temp_table_name}")
+
+    @instrumented
+    def upsert_from_table(
+        self,
+        source_table_name,
+        table_name,
+        columns,
+        key_columns,
+        compare_columns=None,
+        schema=None,
+    ):
+        """
+        See DatabaseConnection.upsert_from_table, schema is ignored.
+
+        sqlite can't tell inserted rows from updated ones in the statement so the rows
+        inserted are the difference in the table's row count, in the same transaction.
+        """
+        target_table_name = _quote_table_name(table_name)
+        source_table_name = _quote_table_name(source_table_name)
+        upsert_sql = _upsert_sql(
+            target_table_name,
+            source_table_name,
+            columns,
+            key_columns,
+            compare_columns
+            or [column for column in columns if column not in key_columns],
+            distinct_operator="IS NOT",
         )
+
+        with self._writer_scope() as conn, self._transaction_scope(conn):
+            source_rows, target_rows = conn.execute(
+                f"SELECT (SELECT count(*) FROM {source_table_name}), "
+                f"(SELECT count(*) FROM {target_table_name})"
+            ).fetchone()
+            changed_rows = conn.execute(upsert_sql).rowcount
+            new_rows = (
+                conn.execute(f"SELECT count(*) FROM {target_table_name}").fetchone()[0]
+                - target_rows
+            )
+        self._invalidate_result_cache(table_name)
+        return {
+            "new": new_rows,
+            "updated": changed_rows - new_rows,
+            "unchanged": source_rows - changed_rows,
+        }
+
+    def _get_all_objects(self):
+        sql = _read_sql_resource(self.connection_engine, "get_all_objects")
         all_obj = self.select_into_dataframe(sql)
         # simulate schema by using the file name without extension, same as postgres schema
         all_obj.db_file = all_obj.db_file.apply(lambda path: Path(path).stem)
@@ -310,13 +2255,444 @@ class SqliteConnection(DatabaseConnection, connection_engine="sqlite"):
         ]
 
     def get_table_details(self, table_name):
-        sql = _read_internal_resource(
-            f"{_RESOURCE_PATH}/{self.connection_engine}/get_object_details.sql"
-        ).format(
+        sql = _read_sql_resource(self.connection_engine, "get_object_details").format(
             table_name=table_name,
         )
         return self.select_into_dataframe(sql)
 
+    def _get_tables_details(self, tables):
+        # sqlite has no arrays so the names are bound as json, there's a single schema
+        # (named after the database file like in get_all_objects) so it isn't filtered on
+        schema_names, table_names = _split_schema_table_names(
+            tables, self.database_file_path.stem
+        )
+        return self.select_into_dataframe(
+            ParameterisedQuery(
+                sql=_read_sql_resource(self.connection_engine, "get_tables_details"),
+                params={
+                    "schema_names": json.dumps(schema_names),
+                    "table_names": json.dumps(table_names),
+                },
+            )
+        )
+
+
+class DuckdbConnection(DatabaseConnection, connection_engine="duckdb"):
+    # / is float division in duckdb, but % is safe since there's no pyformat driver
+    _modulo_template = "{dividend} % {divisor}"
+
+    def __init__(
+        self,
+        database_file_path=":memory:",
+        read_only=False,
+        config=None,
+        *args,
+        **kwargs,
+    ):
+        """
+        Args:
+            database_file_path: path of the duckdb database file, defaults to ":memory:" for an in-memory database
+            read_only: open the database file read only
+            config: dictionary of duckdb configuration options e.g. {"threads": 4, "memory_limit": "4GB"}
+        """
+        self.database_file_path = (
+            database_file_path
+            if database_file_path == ":memory:"
+            else file.prepare_file_path(Path(database_file_path))
+        )
+        self.read_only = read_only
+        self.config = config or {}
+        self._database = None
+        self._database_lock = threading.Lock()
+        super().__init__(**kwargs)
+
+    def _open_connection(self):
+        # duckdb.connect on ":memory:" would create a new database each time so the database is
+        # opened once and every thread gets its own cursor (a connection to the same database)
+        with self._database_lock:
+            if self._database is None:
+                self._database = duckdb.connect(
+                    str(self.database_file_path),
+                    read_only=self.read_only,
+                    config=self.config,
+                )
+            return self._database.cursor()
+
+    def close(self):
+        super().close()
+        with self._database_lock:
+            if self._database is not None:
+                self._database.close()
+                self._database = None
+
+    @contextmanager
+    def _transaction_scope(self):
+        conn = self.database_connection
+        if self._in_transaction:
+            # ended by transaction()
+            yield conn
+            return
+        conn.begin()
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def _begin_transaction(self):
+        self.database_connection.begin()
+
+    def _end_transaction(self, commit):
+        conn = self.database_connection
+        if not commit:
+            conn.rollback()
+            return
+        try:
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    @staticmethod
+    def _to_duckdb_query(query):
+        # duckdb names its parameters $name instead of :name
+        sql, kwargs = _split_query(query, {})
+        if kwargs:
+            sql = _PLACEHOLDER_PATTERN.sub(
+                lambda match: (
+                    f"${match.group(1)}" if match.group(1) else match.group(0)
+                ),
+                sql,
+            )
+        return sql, kwargs.get("params")
+
+    @staticmethod
+    def _arrow_to_dataframe(
+        table,
+        dtype_backend="pyarrow",
+        dtype=None,
+        parse_dates=None,
+        index_col=None,
+        **kwargs,
+    ):
+        # the pandas.read_sql_query options that apply to a result already read
+        if kwargs:
+            raise TypeError(
+                f"{sorted(kwargs)} option(s) not supported by duckdb. Supported options are "
+                "dtype_backend, dtype, parse_dates and index_col"
+            )
+
+        # pyarrow backed columns wrap the arrow buffers without copying them
+        dataframe = (
+            table.to_pandas(types_mapper=pd.ArrowDtype)
+            if dtype_backend == "pyarrow"
+            else table.to_pandas()
+        )
+        if dtype:
+            dataframe = dataframe.astype(dtype)
+        if parse_dates:
+            # same forms as pandas: column names, {column: format} or {column: to_datetime kwargs}
+            if isinstance(parse_dates, str):
+                parse_dates = [parse_dates]
+            if not isinstance(parse_dates, dict):
+                parse_dates = dict.fromkeys(parse_dates)
+            for column, options in parse_dates.items():
+                dataframe[column] = pd.to_datetime(
+                    dataframe[column],
+                    **(options if isinstance(options, dict) else {"format": options}),
+                )
+        if index_col is not None:
+            dataframe = dataframe.set_index(index_col)
+        return dataframe
+
+    def _select_into_dataframe(self, query, **kwargs):
+        """
+        duckdb results come back as arrow tables and are returned as pyarrow backed
+        dataframes without copying. Use dtype_backend="numpy" for numpy backed columns.
+        dtype, parse_dates and index_col are applied to the result like pandas does.
+        """
+        sql, params = self._to_duckdb_query(query)
+        conn = self.database_connection
+        with timed("execute_seconds"):
+            result = conn.execute(sql, params)
+        table = result.fetch_arrow_table()
+        return self._arrow_to_dataframe(table, **kwargs)
+
+    @instrumented
+    @QueryParser
+    def select_iter(self, query, chunksize=DEFAULT_CHUNKSIZE, **kwargs):
+        sql, params = self._to_duckdb_query(query)
+        # use a dedicated cursor so other queries on this thread don't consume the result
+        cursor = self.database_connection.cursor()
+        try:
+            with timed("execute_seconds"):
+                reader = cursor.execute(sql, params).fetch_record_batch(chunksize)
+            for batch in reader:
+                yield self._arrow_to_dataframe(pa.Table.from_batches([batch]), **kwargs)
+        finally:
+            cursor.close()
+
+    @QueryParser
+    def select_into_file(
+        self,
+        query,
+        file_path,
+        chunksize=DEFAULT_CHUNKSIZE,
+        build_parent_dir=True,
+        file_options=None,
+        **kwargs,
+    ):
+        """
+        See DatabaseConnection.select_into_file. Unless parameters, reader or writer options
+        are passed, duckdb writes the file itself with COPY ... TO which streams the result
+        without going through pandas.
+        """
+        sql, params = self._to_duckdb_query(query)
+        copy_options = DUCKDB_FILE_WRITERS.get(Path(file_path).suffix)
+        if params or file_options or kwargs or copy_options is None:
+            return super().select_into_file(
+                query,
+                file_path,
+                chunksize=chunksize,
+                build_parent_dir=build_parent_dir,
+                file_options=file_options,
+                **kwargs,
+            )
+
+        file_path = (
+            file.prepare_file_path(file_path) if build_parent_dir else Path(file_path)
+        )
+        if file_path.suffix == ".parquet":
+            copy_options += f", ROW_GROUP_SIZE {chunksize}"
+        escaped_file_path = str(file_path).replace("'", "''")
+        return self.database_connection.execute(
+            f"COPY ({sql}) TO '{escaped_file_path}' ({copy_options})"
+        ).fetchone()[0]
+
+    @instrumented
+    @QueryParser
+    def execute_statement(self, query):
+        sql, params = self._to_duckdb_query(query)
+        conn = self.database_connection
+        # duckdb runs every statement of a script passed to execute
+        with timed("execute_seconds"):
+            conn.execute(sql, params)
+        self._invalidate_caches_on_statement(sql)
+
+    def _execute_script(self, statements):
+        rowcounts = []
+        with self._transaction_scope() as conn:
+            for sql, params in statements:
+                sql, params = self._to_duckdb_query(
+                    ParameterisedQuery(sql, params or {})
+                )
+                with timed("execute_seconds"):
+                    conn.execute(sql, params)
+                # insert/update/delete return their row count as a single "Count" row
+                is_count = [column[0] for column in conn.description or []] == ["Count"]
+                row = conn.fetchone() if is_count else None
+                rowcounts.append(row[0] if row else -1)
+        return rowcounts
+
+    @instrumented
+    def insert_into_table(
+        self,
+        dataframe,
+        table_name,
+        if_exists="append",
+        key_columns=None,
+        schema=None,
+    ):
+        """
+        See DatabaseConnection.insert_into_table. duckdb scans the dataframe in place
+        (no row by row inserts), columns are matched by name.
+
+        With if_exists="upsert" the dataframe is applied with a single INSERT ... ON CONFLICT,
+        which needs a primary key or unique constraint on key_columns.
+        """
+        assert isinstance(dataframe, pd.DataFrame), "Use dataframe as data source"
+        self._invalidate_catalog_on_insert(table_name)
+
+        full_table_name = _quote_table_name(table_name, schema)
+        is_upsert = self._is_upsert_into_existing_table(
+            dataframe, table_name, if_exists, key_columns, schema
+        )
+        table_exists = bool(
+            self.find_objects(table_name=table_name, schema_name=schema)
+        ) or bool(self.find_objects(table_name=table_name, object_type="view"))
+
+        if table_exists and if_exists == "fail":
+            raise ValueError(f"Table '{table_name}' already exists.")
+
+        conn = self.database_connection
+        view_name = f"_{pkg_name}_insert_{threading.get_ident()}"
+        conn.register(view_name, dataframe)
+        try:
+            if not table_exists or if_exists == "replace":
+                sql = f"CREATE OR REPLACE TABLE {full_table_name} AS SELECT * FROM {view_name}"
+            elif is_upsert:
+                sql = _upsert_sql(
+                    full_table_name, view_name, list(dataframe.columns), key_columns
+                )
+            else:
+                sql = f"INSERT INTO {full_table_name} BY NAME SELECT * FROM {view_name}"
+            with timed("execute_seconds"):
+                conn.execute(sql)
+        finally:
+            conn.unregister(view_name)
+        if not table_exists or if_exists == "replace":
+            self.invalidate_catalog()
+        self._invalidate_result_cache(table_name)
+
+    @instrumented
+    def upsert_from_table(
+        self,
+        source_table_name,
+        table_name,
+        columns,
+        key_columns,
+        compare_columns=None,
+        schema=None,
+    ):
+        """
+        See DatabaseConnection.upsert_from_table.
+
+        Like sqlite, the rows inserted are the difference in the table's row count.
+        """
+        target_table_name = _quote_table_name(table_name, schema)
+        source_table_name = _quote_table_name(source_table_name, schema)
+        upsert_sql = _upsert_sql(
+            target_table_name,
+            source_table_name,
+            columns,
+            key_columns,
+            compare_columns
+            or [column for column in columns if column not in key_columns],
+        )
+
+        with self._transaction_scope() as conn:
+            source_rows, target_rows = conn.execute(
+                f"SELECT (SELECT count(*) FROM {source_table_name}), "
+                f"(SELECT count(*) FROM {target_table_name})"
+            ).fetchone()
+            with timed("execute_seconds"):
+                # the row count comes back as a single "Count" row
+                changed_rows = conn.execute(upsert_sql).fetchone()[0]
+            new_rows = (
+                conn.execute(f"SELECT count(*) FROM {target_table_name}").fetchone()[0]
+                - target_rows
+            )
+        self._invalidate_result_cache(table_name)
+        return {
+            "new": new_rows,
+            "updated": changed_rows - new_rows,
+            "unchanged": source_rows - changed_rows,
+        }
+
+    def create_view_from_files(self, view_name, file_path, **reader_options):
+        """
+        Create (or replace) a view over one or many files so they can be queried in place
+        without loading them into pandas first. file_path can be a glob.
+
+        >>> conn.create_view_from_files('sales', 'exports/sales_*.parquet')
+        >>> conn.select_into_dataframe('select region, sum(amount) from sales group by region')
+
+        Args:
+            view_name: name of the view
+            file_path: path or glob of parquet, csv or json files
+            **reader_options: options passed to the duckdb reader e.g. union_by_name=True
+
+        Return:
+            None
+        """
+        self.execute_statement(
+            f"CREATE OR REPLACE VIEW {view_name} AS SELECT * FROM {self._file_reader_sql(file_path, **reader_options)}"
+        )
+
+    @staticmethod
+    def _file_reader_sql(file_path, **reader_options):
+        suffix = Path(str(file_path)).suffix
+        try:
+            reader = DUCKDB_FILE_READERS[suffix]
+        except KeyError:
+            raise file.UnsupportedFileExtensionError(
+                f"File with extension '{suffix}' can't be read by duckdb. "
+                f"The allowed extension are: {list(DUCKDB_FILE_READERS.keys())}."
+            )
+
+        options = "".join(
+            f", {option} = {_duckdb_literal(value)}"
+            for option, value in reader_options.items()
+        )
+        return f"{reader}({_duckdb_literal(Path(str(file_path)).as_posix())}{options})"
+
+    def load_file_into_table(
+        self,
+        file_path,
+        table_name,
+        if_exists="append",
+        chunksize=DEFAULT_LOAD_CHUNKSIZE,
+        file_options=None,
+        **kwargs,
+    ):
+        """
+        See DatabaseConnection.load_file_into_table. Unless upserting or passing reader/insert
+        options, duckdb reads the files itself (in parallel) with a single
+        INSERT/CREATE TABLE ... SELECT FROM read_parquet/read_csv_auto/read_json_auto.
+        """
+        if if_exists == "upsert" or file_options or kwargs:
+            return super().load_file_into_table(
+                file_path,
+                table_name,
+                if_exists=if_exists,
+                chunksize=chunksize,
+                file_options=file_options,
+                **kwargs,
+            )
+
+        _expand_file_paths(file_path)
+        self._invalidate_catalog_on_insert(table_name)
+        table_exists = bool(self.find_objects(table_name=table_name))
+        if table_exists and if_exists == "fail":
+            raise ValueError(f"Table '{table_name}' already exists.")
+
+        reader_sql = self._file_reader_sql(file_path)
+        if not table_exists or if_exists == "replace":
+            sql = (
+                f'CREATE OR REPLACE TABLE "{table_name}" AS SELECT * FROM {reader_sql}'
+            )
+            self.invalidate_catalog()
+        else:
+            sql = f'INSERT INTO "{table_name}" BY NAME SELECT * FROM {reader_sql}'
+
+        row_count = self.database_connection.execute(sql).fetchone()[0]
+        self._invalidate_result_cache(table_name)
+        return row_count
+
+    def _get_all_objects(self):
+        sql = _read_sql_resource(self.connection_engine, "get_all_objects")
+        return self.select_into_dataframe(sql, dtype_backend="numpy")[
+            ALL_OBJECTS_REQUIRED_COLUMNS
+        ]
+
+    def get_table_details(self, table_name, schema_name="main"):
+        sql = _read_sql_resource(self.connection_engine, "get_object_details").format(
+            schema=schema_name,
+            table_name=table_name,
+        )
+        return self.select_into_dataframe(sql, dtype_backend="numpy")
+
+    def _get_tables_details(self, tables):
+        schema_names, table_names = _split_schema_table_names(tables, "main")
+        return self.select_into_dataframe(
+            ParameterisedQuery(
+                sql=_read_sql_resource(self.connection_engine, "get_tables_details"),
+                params={"schema_names": schema_names, "table_names": table_names},
+            ),
+            dtype_backend="numpy",
+        )
+
 
 if __name__ == "__main__":
     with DatabaseConnection(
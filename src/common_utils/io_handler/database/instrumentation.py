@@ -0,0 +1,315 @@
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+from functools import wraps
+import inspect
+import threading
+import time
+import warnings
+import pandas as pd
+
+# queries taking at least this many seconds are reported by QueryCollector.slow_queries
+DEFAULT_SLOW_QUERY_SECONDS = 1.0
+# number of most recent queries kept by QueryCollector
+DEFAULT_COLLECTOR_MAX_RECORDS = 10_000
+
+# metrics of the calls running on the current thread, innermost last
+_state = threading.local()
+
+
+@dataclass
+class QueryMetrics:
+    """
+    Timings and sizes of a single DatabaseConnection call, passed to the query hooks.
+    Times are in seconds, fetch_seconds is whatever isn't parsing, waiting for a
+    connection or executing i.e. reading the rows and converting them (pandas).
+    """
+
+    method: str
+    connection_engine: str
+    sql: str = None
+    started_at: float = field(default_factory=time.time)
+    parse_seconds: float = 0.0
+    acquire_seconds: float = 0.0
+    execute_seconds: float = 0.0
+    fetch_seconds: float = 0.0
+    total_seconds: float = 0.0
+    rows: int = 0
+    result_bytes: int = 0
+    error: str = None
+
+
+class QueryHook:
+    """
+    Base class of the hooks added with DatabaseConnection.add_query_hook, override
+    before_query and/or after_query. after_query is called even if the query failed
+    (metrics.error is set).
+    """
+
+    def before_query(self, metrics):
+        pass
+
+    def after_query(self, metrics):
+        pass
+
+
+class QueryCollector(QueryHook):
+    """
+    Query hook keeping the metrics of the most recent queries and reporting on them.
+
+    Example:
+        collector = QueryCollector()
+        conn.add_query_hook(collector)
+        ...
+        print(collector.report())
+        print(collector.slow_queries())
+    """
+
+    def __init__(
+        self,
+        slow_query_seconds=DEFAULT_SLOW_QUERY_SECONDS,
+        max_records=DEFAULT_COLLECTOR_MAX_RECORDS,
+    ):
+        self.slow_query_seconds = slow_query_seconds
+        self.records = deque(maxlen=max_records)
+
+    def after_query(self, metrics):
+        self.records.append(metrics)
+
+    def to_dataframe(self):
+        """
+        Metrics of every collected query
+
+        Return:
+            pandas dataframe with a row per query and QueryMetrics fields as columns
+        """
+        return pd.DataFrame(
+            [asdict(metrics) for metrics in list(self.records)],
+            columns=list(QueryMetrics.__dataclass_fields__),
+        )
+
+    def report(self):
+        """
+        Aggregate the collected queries by method and sql, slowest (total time) first
+
+        Return:
+            pandas dataframe with the count, total/mean/max seconds, time per phase,
+            rows and result bytes of each query
+        """
+        records = self.to_dataframe()
+        return (
+            records.assign(sql=records["sql"].fillna(""))
+            .groupby(["method", "sql"])
+            .agg(
+                count=("total_seconds", "size"),
+                total_seconds=("total_seconds", "sum"),
+                mean_seconds=("total_seconds", "mean"),
+                max_seconds=("total_seconds", "max"),
+                parse_seconds=("parse_seconds", "sum"),
+                acquire_seconds=("acquire_seconds", "sum"),
+                execute_seconds=("execute_seconds", "sum"),
+                fetch_seconds=("fetch_seconds", "sum"),
+                rows=("rows", "sum"),
+                result_bytes=("result_bytes", "sum"),
+                errors=("error", "count"),
+            )
+            .sort_values("total_seconds", ascending=False)
+            .reset_index()
+        )
+
+    def slow_queries(self, slow_query_seconds=None):
+        """
+        Collected queries that took at least slow_query_seconds, slowest first
+
+        Args:
+            slow_query_seconds: threshold in seconds, defaults to the collector's slow_query_seconds
+
+        Return:
+            pandas dataframe with a row per query
+        """
+        threshold = (
+            self.slow_query_seconds
+            if slow_query_seconds is None
+            else slow_query_seconds
+        )
+        records = self.to_dataframe()
+        return (
+            records[records["total_seconds"] >= threshold]
+            .sort_values("total_seconds", ascending=False)
+            .reset_index(drop=True)
+        )
+
+    def clear(self):
+        """
+        Drop the collected metrics
+        """
+        self.records.clear()
+
+
+def _current_metrics():
+    stack = getattr(_state, "stack", None)
+    return stack[-1] if stack else None
+
+
+@contextmanager
+def _active(metrics):
+    stack = _state.__dict__.setdefault("stack", [])
+    stack.append(metrics)
+    try:
+        yield metrics
+    finally:
+        stack.pop()
+
+
+@contextmanager
+def timed(metric):
+    """
+    Add the time spent in the block to a timing (e.g. 'execute_seconds') of the call being
+    instrumented on this thread, does nothing when no call is instrumented.
+    """
+    metrics = _current_metrics()
+    if metrics is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        setattr(
+            metrics, metric, getattr(metrics, metric) + time.perf_counter() - started
+        )
+
+
+def record_timing(metric, seconds):
+    """
+    Add seconds to a timing (e.g. 'execute_seconds') of the call being instrumented on this
+    thread, for timings measured elsewhere (driver events).
+    """
+    metrics = _current_metrics()
+    if metrics is not None:
+        setattr(metrics, metric, getattr(metrics, metric) + seconds)
+
+
+def record_parse(sql, seconds):
+    """
+    Record the sql and the time QueryParser took to parse it on the call being instrumented
+    """
+    metrics = _current_metrics()
+    if metrics is not None:
+        metrics.parse_seconds += seconds
+        if metrics.sql is None:
+            metrics.sql = sql
+
+
+def _measure_result(metrics, result):
+    if isinstance(result, pd.DataFrame):
+        metrics.rows += len(result)
+        metrics.result_bytes += int(result.memory_usage(index=False, deep=True).sum())
+    elif isinstance(result, int):
+        metrics.rows += max(result, 0)
+    elif isinstance(result, list):
+        # execute_script row counts, -1 when not applicable
+        metrics.rows += sum(count for count in result if count > 0)
+
+
+def _call_hooks(hooks, hook_name, metrics):
+    for hook in hooks:
+        try:
+            getattr(hook, hook_name)(metrics)
+        except Exception as e:
+            warnings.warn(f"Query hook {hook} failed in {hook_name}: {e!r}")
+
+
+def _finish(metrics, total_seconds):
+    metrics.total_seconds = total_seconds
+    metrics.fetch_seconds = max(
+        metrics.total_seconds
+        - metrics.parse_seconds
+        - metrics.acquire_seconds
+        - metrics.execute_seconds,
+        0.0,
+    )
+
+
+def instrumented(function):
+    """
+    Decorator for DatabaseConnection methods, records a QueryMetrics for every call and
+    passes it to the connection's query hooks. Calls aren't measured when there are no hooks.
+    Use it above QueryParser so the parse time is included.
+    """
+
+    # QueryParser keeps the function it decorates
+    method = getattr(function, "function", function).__name__
+
+    def make_metrics(self, args, kwargs):
+        metrics = QueryMetrics(method=method, connection_engine=self.connection_engine)
+        dataframe = kwargs.get("dataframe", args[0] if args else None)
+        if isinstance(dataframe, pd.DataFrame):
+            # written rather than read
+            _measure_result(metrics, dataframe)
+        return metrics
+
+    if inspect.isgeneratorfunction(getattr(function, "function", function)):
+
+        @wraps(function)
+        def generator_wrapper(self, *args, **kwargs):
+            if not self._query_hooks:
+                yield from function(self, *args, **kwargs)
+                return
+
+            hooks = list(self._query_hooks)
+
+            # only the time spent producing the chunks is measured, not the caller's
+            metrics = make_metrics(self, args, kwargs)
+            elapsed = 0.0
+            generator = None
+            _call_hooks(hooks, "before_query", metrics)
+            try:
+                while True:
+                    started = time.perf_counter()
+                    with _active(metrics):
+                        try:
+                            if generator is None:
+                                generator = function(self, *args, **kwargs)
+                            chunk = next(generator)
+                        except StopIteration:
+                            break
+                        finally:
+                            elapsed += time.perf_counter() - started
+                    _measure_result(metrics, chunk)
+                    yield chunk
+            except BaseException as e:
+                metrics.error = repr(e)
+                raise
+            finally:
+                if generator is not None:
+                    generator.close()
+                _finish(metrics, elapsed)
+                _call_hooks(hooks, "after_query", metrics)
+
+        return generator_wrapper
+
+    @wraps(function)
+    def wrapper(self, *args, **kwargs):
+        if not self._query_hooks:
+            return function(self, *args, **kwargs)
+
+        hooks = list(self._query_hooks)
+
+        metrics = make_metrics(self, args, kwargs)
+        _call_hooks(hooks, "before_query", metrics)
+        started = time.perf_counter()
+        try:
+            with _active(metrics):
+                result = function(self, *args, **kwargs)
+            _measure_result(metrics, result)
+            return result
+        except BaseException as e:
+            metrics.error = repr(e)
+            raise
+        finally:
+            _finish(metrics, time.perf_counter() - started)
+            _call_hooks(hooks, "after_query", metrics)
+
+    return wrapper
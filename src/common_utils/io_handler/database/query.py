@@ -1,9 +1,16 @@
-from functools import partial, singledispatchmethod
+from functools import lru_cache, partial, singledispatchmethod
 import inspect
+import os
 import re
+import time
+from typing import NamedTuple
 import sqlparse
 
-from common_utils.io_handler.database._query_transformer import _transform_kv_to_clause
+from common_utils.io_handler.database._query_transformer import (
+    _bind,
+    _transform_kv_to_clause,
+)
+from common_utils.io_handler.database.instrumentation import record_parse
 
 DEFAULT_SQLPARSE_KWARGS = dict(
     keyword_case="upper",
@@ -12,62 +19,140 @@ DEFAULT_SQLPARSE_KWARGS = dict(
     reindent_aligned=True,
 )
 
+# number of distinct (normalised) queries whose formatted sql is kept in memory
+FORMATTED_QUERY_CACHE_SIZE = 1024
+
+# pretty formatting is only cosmetic, set common_utils_format_sql=false in env (or
+# QueryParser.format_sql = False) to skip it, the queries are still validated/normalised
+FORMAT_SQL = os.getenv("common_utils_format_sql", "true").lower() not in (
+    "false",
+    "0",
+    "no",
+)
+
+_MULTIPLE_WHITESPACE_PATTERN = re.compile(r"\s{2,}")
+
+SQL_DIRECTION = {"ASC", "DESC"}
+
+
+class ParameterisedQuery(NamedTuple):
+    """
+    Sql with :name placeholders and the parameters bound to them (what dictionary queries parse into)
+    """
+
+    sql: str
+    params: dict
+
+
+def _split_query(query, kwargs):
+    """
+    Split a parsed query into the sql text and the keyword arguments to execute it with,
+    adding the bound parameters of a ParameterisedQuery to kwargs["params"].
+
+    Args:
+        query: sql string or ParameterisedQuery
+        kwargs: dictionary of keyword arguments passed to the reader (e.g. pandas.read_sql_query)
+
+    Return:
+        tuple of sql string and kwargs
+    """
+    if isinstance(query, ParameterisedQuery):
+        if query.params:
+            kwargs = {**kwargs, "params": {**kwargs.get("params", {}), **query.params}}
+        return query.sql, kwargs
+    return query, kwargs
+
+
+def _query_text(query):
+    # sql of a parsed query, statements of a list are joined
+    if isinstance(query, list):
+        return ";\n".join(_query_text(element) for element in query)
+    return query.sql if isinstance(query, ParameterisedQuery) else query
+
+
+@lru_cache(maxsize=FORMATTED_QUERY_CACHE_SIZE)
+def _format_sql(query):
+    # sqlparse tokenises in pure python so cache the output per query text
+    return sqlparse.format(query, **DEFAULT_SQLPARSE_KWARGS)
+
 
 class QueryParser:
     """
     Class decorator to pre-check sql queries/dictionary passed into the database connection objects
     """
 
+    format_sql = FORMAT_SQL
+
     def __init__(self, function):
         self.function = function
         self._expected_arguement = "query"
-        self._sqlparse_kwargs = DEFAULT_SQLPARSE_KWARGS
-
-    def __call__(self, *args, **kwargs):
-        all_arguments_name = inspect.signature(self.function).parameters.keys()
 
+        # signature doesn't change so work out where "query" sits once, at decoration time
+        all_arguments_name = list(inspect.signature(function).parameters.keys())
         if self._expected_arguement not in all_arguments_name:
             raise KeyError(
-                f"{self._expected_arguement} is expected to be an argument but {self.function} does't have this argument"
+                f"{self._expected_arguement} is expected to be an argument but {function} does't have this argument"
             )
+        self._arguement_position = all_arguments_name.index(self._expected_arguement)
 
+    def __call__(self, *args, **kwargs):
         # if query is in keyword args then we parse it and replace its value
         if self._expected_arguement in kwargs:
-            kwargs[self._expected_arguement] = self.parse(kwargs["query"])
-            result = self.function(*args, **kwargs)
+            kwargs[self._expected_arguement] = self._timed_parse(
+                kwargs[self._expected_arguement]
+            )
+            return self.function(*args, **kwargs)
 
         # if query is in positional args, we can deduce the position of "query"
         # which should be in the same the position in the args
-        index_position = list(all_arguments_name).index(self._expected_arguement)
         # convert tuple to list to allow reassignment
         args = list(args)
-        args[index_position] = self.parse(args[index_position])
-        result = self.function(*args, **kwargs)
+        args[self._arguement_position] = self._timed_parse(
+            args[self._arguement_position]
+        )
+        return self.function(*args, **kwargs)
 
-        return result
+    def _timed_parse(self, query):
+        # parse time is reported to the query hooks (see instrumentation)
+        started = time.perf_counter()
+        parsed = self.parse(query)
+        record_parse(_query_text(parsed), time.perf_counter() - started)
+        return parsed
 
     #  method to allow class to be a decorator
     #  https://stackoverflow.com/questions/30104047/how-can-i-decorate-an-instance-method-with-a-decorator-class
     def __get__(self, instance, owner):
         return partial(self.__call__, instance)
 
+    def _format(self, query):
+        return _format_sql(query) if self.format_sql else query
+
     @singledispatchmethod
     def parse(self, query):
         raise NotImplementedError(f"Unable to parse query type: {type(query)}")
 
     @parse.register
     def _parse_string(self, query: str):
-        return sqlparse.format(
-            re.sub(
-                # remove double whitespace in between
-                r"\s{2,}",
+        return self._format(
+            # remove double whitespace in between
+            _MULTIPLE_WHITESPACE_PATTERN.sub(
                 " ",
                 # strip leading and trailing whitespaces
                 query.strip(),
-            ),
-            **self._sqlparse_kwargs,
+            )
         )
 
+    # already parsed (e.g. passed on from one decorated method to another)
+    @parse.register
+    def _parse_parameterised_query(self, query: ParameterisedQuery):
+        return query
+
+    # list of queries e.g. the statements of a script, each parsed on its own
+    @parse.register(list)
+    @parse.register(tuple)
+    def _parse_iter(self, query):
+        return [self.parse(element) for element in query]
+
     # using dictionary to filter simple query rather
     @parse.register
     def _parse_dict(self, query: dict):
@@ -76,10 +161,15 @@ class QueryParser:
         columns = "columns"
         filters = "filters"
         allowed_key = [table, columns, filters]
+        # and optionally order_by, limit and after (keyset pagination)
+        order_by = "order_by"
+        limit = "limit"
+        after = "after"
+        optional_key = [order_by, limit, after]
 
         # check if all the keys are there, even if "select * ", still expects filter to be an empty dict
-        assert sorted(list(query)) == (sorted(allowed_key)), (
-            f"Only a dictionary with {len(allowed_key)} keys is allowed. The keys are {allowed_key}. The passed in keys are {list(query)}"
+        assert set(allowed_key) <= set(query) <= set(allowed_key + optional_key), (
+            f"Only a dictionary with {len(allowed_key)} keys is allowed. The keys are {allowed_key}, optionally with {optional_key}. The passed in keys are {list(query)}"
         )
 
         # table name is only allowed to be a string
@@ -103,13 +193,6 @@ class QueryParser:
         # from this point on, we can construct query
         select_columns_from_table = f"SELECT {', '.join(columns_iter) if columns_iter else '*'} FROM  {table_name}"
 
-        if not filter_dict:
-            # return if no filtering
-            return sqlparse.format(
-                select_columns_from_table,
-                **self._sqlparse_kwargs,
-            )
-
         # all the keys in this nested filter dict represent columns and need to be str also
         non_str_columns = [
             column for column in filter_dict.keys() if not isinstance(column, str)
@@ -118,31 +201,108 @@ class QueryParser:
             f"Keys in {filter} represent column names and should be of type str"
         )
 
-        # transform the filter into actual list of sql clauses
+        # transform the filter into actual list of sql clauses, the values are bound
+        # as parameters so the sql text is the same whatever the filter values are
+        sql_clause_list = []
+        params = {}
+        for position, (column, filter_clause) in enumerate(filter_dict.items()):
+            clause, clause_params = _transform_kv_to_clause(
+                filter_clause, column, f"p{position}"
+            )
+            sql_clause_list.extend(clause if isinstance(clause, list) else [clause])
+            params.update(clause_params)
+
+        after_dict = query.get(after)
+        assert after_dict is None or (isinstance(after_dict, dict) and after_dict), (
+            f"The value for {after} is {after_dict}. This is expected to be a non empty dict of {{column: last value read}}"
+        )
+        # ordering by the keyset columns is what makes the cursor seek through an index
+        order_by_list = _parse_order_by(
+            query.get(order_by, list(after_dict) if after_dict else None)
+        )
+
+        if after_dict:
+            clause, clause_params = _keyset_clause(after_dict, order_by_list)
+            sql_clause_list.append(clause)
+            params.update(clause_params)
 
-        sql_clause_list = [
-            _transform_kv_to_clause(filter_clause, column)
-            for column, filter_clause in filter_dict.items()
-        ]
+        final_query = select_columns_from_table
+        if sql_clause_list:
+            final_query += " WHERE " + " AND ".join(sql_clause_list)
+        if order_by_list:
+            final_query += " ORDER BY " + ", ".join(
+                f"{column} {direction}" for column, direction in order_by_list
+            )
 
-        for index, clause in enumerate(sql_clause_list):
-            if isinstance(clause, str):
-                sql_clause_list[index] = f" AND {clause}"
-            elif isinstance(clause, list):
-                sql_clause_list[index] = " AND ".join(clause)
-
-        final_query = select_columns_from_table + " WHERE " + " ".join(sql_clause_list)
-
-        where_and_pattern = r"\bwhere\s+and\b"
-        if re.search(where_and_pattern, final_query, re.IGNORECASE):
-            final_query = re.sub(
-                pattern=where_and_pattern,
-                repl="WHERE ",
-                string=final_query,
-                flags=re.IGNORECASE,
+        row_limit = query.get(limit)
+        if row_limit is not None:
+            assert isinstance(row_limit, int) and row_limit >= 0, (
+                f"The value for {limit} is {row_limit}. This is expected to be a non negative int"
             )
+            # bound too so every page of a scan runs the same (prepared) statement
+            final_query += " LIMIT :row_limit"
+            params["row_limit"] = row_limit
+
+        return ParameterisedQuery(sql=self._format(final_query), params=params)
 
-        return sqlparse.format(
-            final_query,
-            **self._sqlparse_kwargs,
+
+def _parse_order_by(order_by):
+    """
+    Normalise the order_by of a dictionary query
+
+    Args:
+        order_by: None, column name, list/tuple of column names or dictionary of {column: "asc" or "desc"}
+
+    Return:
+        list of (column, direction) tuples
+    """
+    if order_by is None:
+        return []
+    if isinstance(order_by, str):
+        order_by = [order_by]
+    if isinstance(order_by, (list, tuple)):
+        order_by = dict.fromkeys(order_by, "ASC")
+    assert isinstance(order_by, dict), (
+        f"order_by is {order_by}. This is expected to be a str, list/tuple of str or dict of {{column: direction}}"
+    )
+
+    order_by_list = []
+    for column, direction in order_by.items():
+        assert isinstance(column, str) and str(direction).upper() in SQL_DIRECTION, (
+            f"order_by {column}: {direction} is not allowed. Columns should be str and directions one of {SQL_DIRECTION}"
         )
+        order_by_list.append((column, direction.upper()))
+    return order_by_list
+
+
+def _keyset_clause(after, order_by_list):
+    """
+    Build the clause seeking past the last row read, (a, b) > (:a, :b) compares the
+    columns in order so the database can use an index on them instead of an OFFSET scan.
+
+    Args:
+        after: dictionary of {column: value} of the last row read, its columns should be unique together
+        order_by_list: list of (column, direction) tuples from _parse_order_by
+
+    Return:
+        tuple of clause str and dictionary of parameters
+    """
+    assert list(after) == [column for column, _ in order_by_list], (
+        f"after columns {list(after)} must be the order_by columns {[column for column, _ in order_by_list]}, in the same order"
+    )
+    directions = {direction for _, direction in order_by_list}
+    assert len(directions) == 1, (
+        "after can only be used when every order_by column has the same direction"
+    )
+
+    params = {}
+    placeholders = [
+        _bind(params, value, column, "after") for column, value in after.items()
+    ]
+    comparator = ">" if directions == {"ASC"} else "<"
+    if len(placeholders) == 1:
+        return f"{next(iter(after))} {comparator} {placeholders[0]}", params
+    return (
+        f"({', '.join(after)}) {comparator} ({', '.join(placeholders)})",
+        params,
+    )
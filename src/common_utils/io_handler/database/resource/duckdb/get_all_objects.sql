@@ -0,0 +1,22 @@
+select
+    'table' as object_type
+    ,schema_name
+    ,table_name as object_name
+    ,table_name as "table_name"
+from duckdb_tables()
+where not internal
+union all
+select
+    'view' as object_type
+    ,schema_name
+    ,view_name as object_name
+    ,view_name as "table_name"
+from duckdb_views()
+where not internal
+union all
+select
+    'index' as object_type
+    ,schema_name
+    ,index_name as object_name
+    ,table_name as "table_name"
+from duckdb_indexes()
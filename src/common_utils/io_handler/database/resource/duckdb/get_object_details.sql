@@ -0,0 +1,7 @@
+SELECT table_name AS tbl
+, column_name        AS col
+, data_type          AS datatype
+FROM   duckdb_columns()
+WHERE  schema_name = '{schema}'
+AND    table_name = '{table_name}'
+ORDER  BY column_index;
@@ -0,0 +1,14 @@
+select
+    c.schema_name
+    ,c.table_name
+    ,c.column_name
+    ,c.data_type
+from (
+    select
+        unnest(:schema_names) as schema_name
+        ,unnest(:table_names) as table_name
+) requested_table
+join duckdb_columns() c
+on c.schema_name = requested_table.schema_name
+and c.table_name = requested_table.table_name
+order by c.schema_name, c.table_name, c.column_index
@@ -3,7 +3,7 @@ SELECT attrelid::regclass AS tbl
 , atttypid::regtype  AS datatype
 -- more attributes?
 FROM   pg_attribute
-WHERE  attrelid = '{schema}.{table}'::regclass  -- table name optionally schema-qualified
+WHERE  attrelid = '{schema}.{table_name}'::regclass  -- table name optionally schema-qualified
 AND    attnum > 0
 AND    NOT attisdropped
 ORDER  BY attnum;
\ No newline at end of file
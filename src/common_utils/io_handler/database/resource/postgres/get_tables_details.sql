@@ -0,0 +1,16 @@
+select
+    n.nspname as schema_name
+    ,c.relname as table_name
+    ,a.attname as column_name
+    ,format_type(a.atttypid, a.atttypmod) as data_type
+from unnest(cast(:schema_names as text[]), cast(:table_names as text[])) as requested_table(schema_name, table_name)
+join pg_namespace n
+on n.nspname = requested_table.schema_name
+join pg_class c
+on c.relnamespace = n.oid
+and c.relname = requested_table.table_name
+join pg_attribute a
+on a.attrelid = c.oid
+where a.attnum > 0
+and not a.attisdropped
+order by n.nspname, c.relname, a.attnum
@@ -0,0 +1,8 @@
+select
+    json_extract(:schema_names, '$[' || requested_table.key || ']') as schema_name
+    ,requested_table.value as table_name
+    ,ti.name as column_name
+    ,ti.type as data_type
+from json_each(:table_names) requested_table
+join pragma_table_info(requested_table.value) ti
+order by schema_name, table_name, ti.cid
@@ -5,6 +5,8 @@ import yaml
 import tomllib
 import pypdf
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import os
 import pickle
 
@@ -13,6 +15,128 @@ class UnsupportedFileExtensionError(Exception):
     pass
 
 
+# leading chunks held back while a column is all null (so has no type yet), after this many
+# rows the columns still without a type are written as strings
+PARQUET_SCHEMA_BUFFER_ROWS = 100_000
+
+
+def _has_null_fields(schema):
+    return any(pa.types.is_null(field.type) for field in schema)
+
+
+def _write_parquet_chunks(chunks, file_path, **kwargs):
+    # every chunk becomes a row group, only one chunk is held in memory at a time once the
+    # schema is known
+    writer = None
+    pending = []
+    row_count = 0
+    try:
+        for chunk in chunks:
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            row_count += len(chunk)
+            if writer is not None:
+                if table.schema != writer.schema:
+                    # e.g. ints becoming floats or a column all null in this chunk
+                    table = table.cast(writer.schema)
+                writer.write_table(table)
+                continue
+
+            pending.append(table)
+            # a column that was all null so far takes the type of the first chunk with values
+            schema = pa.unify_schemas(
+                [table.schema for table in pending], promote_options="permissive"
+            )
+            if _has_null_fields(schema) and row_count < PARQUET_SCHEMA_BUFFER_ROWS:
+                continue
+
+            schema = pa.schema(
+                [
+                    field.with_type(pa.string())
+                    if pa.types.is_null(field.type)
+                    else field
+                    for field in schema
+                ],
+                metadata=schema.metadata,
+            )
+            writer = pq.ParquetWriter(file_path, schema, **kwargs)
+            for table in pending:
+                writer.write_table(table.cast(schema))
+            pending = []
+
+        if pending:
+            # the columns all null in every chunk stay null typed
+            writer = pq.ParquetWriter(
+                file_path,
+                pa.unify_schemas(
+                    [table.schema for table in pending], promote_options="permissive"
+                ),
+                **kwargs,
+            )
+            for table in pending:
+                writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        pq.write_table(pa.table({}), file_path)
+    return row_count
+
+
+def _write_text_chunks(chunks, file_path, write_chunk, encoding="utf-8"):
+    row_count = 0
+    with open(file_path, mode="w", encoding=encoding, newline="") as file_obj:
+        for position, chunk in enumerate(chunks):
+            write_chunk(chunk, file_obj, first_chunk=position == 0)
+            row_count += len(chunk)
+    return row_count
+
+
+def _write_csv_chunks(chunks, file_path, encoding="utf-8", **kwargs):
+    # header only written with the first chunk
+    return _write_text_chunks(
+        chunks,
+        file_path,
+        lambda chunk, file_obj, first_chunk: chunk.to_csv(
+            file_obj, header=first_chunk, index=False, **kwargs
+        ),
+        encoding=encoding,
+    )
+
+
+def _write_json_lines_chunks(chunks, file_path, encoding="utf-8", **kwargs):
+    kwargs.setdefault("date_format", "iso")
+    return _write_text_chunks(
+        chunks,
+        file_path,
+        lambda chunk, file_obj, first_chunk: chunk.to_json(
+            file_obj, orient="records", lines=True, **kwargs
+        ),
+        encoding=encoding,
+    )
+
+
+def _read_json_lines(file_path, **kwargs):
+    return pd.read_json(file_path, lines=True, **kwargs)
+
+
+def _read_parquet_chunks(file_path, chunksize, **kwargs):
+    # reads chunksize rows at a time across the row groups rather than the whole file
+    parquet_file = pq.ParquetFile(file_path)
+    for batch in parquet_file.iter_batches(batch_size=chunksize, **kwargs):
+        yield batch.to_pandas()
+
+
+def _read_csv_chunks(file_path, chunksize, **kwargs):
+    with pd.read_csv(file_path, chunksize=chunksize, **kwargs) as reader:
+        yield from reader
+
+
+def _read_json_lines_chunks(file_path, chunksize, **kwargs):
+    with pd.read_json(file_path, lines=True, chunksize=chunksize, **kwargs) as reader:
+        yield from reader
+
+
 # anything that's not implemented is defaulted to .read()/.write()
 SUPPORTED_FILE_EXTENSION = {
     # specific func
@@ -35,11 +159,13 @@ SUPPORTED_FILE_EXTENSION = {
     # default everything
     ".txt": dict(),
     ".sql": dict(),
-    # tabular format so use pandas to read (might be better to use duckdb to read multiple files?)
+    # tabular format so use pandas to read (for many files, DuckdbConnection.create_view_from_files queries them in place)
     # use pandas to write so these get treated differently
     ".parquet": dict(
         read=pd.read_parquet,
         pandas_write="to_parquet",
+        chunk_read=_read_parquet_chunks,
+        chunk_write=_write_parquet_chunks,
     ),
     ".pkl": dict(
         read=pd.read_pickle,
@@ -54,6 +180,14 @@ SUPPORTED_FILE_EXTENSION = {
     ".csv": dict(
         read=pd.read_csv,
         pandas_write="to_csv",
+        chunk_read=_read_csv_chunks,
+        chunk_write=_write_csv_chunks,
+    ),
+    # json lines, one record per line so it can be written chunk by chunk
+    ".jsonl": dict(
+        read=_read_json_lines,
+        chunk_read=_read_json_lines_chunks,
+        chunk_write=_write_json_lines_chunks,
     ),
     ".xlsx": dict(
         read=pd.read_excel,
@@ -263,6 +397,82 @@ def save_to_file(
             raise e
 
 
+def read_file_chunks(file_path, chunksize, **kwargs):
+    """
+    Read a .parquet, .csv or .jsonl file as dataframes of at most chunksize rows so the full
+    file never has to be held in memory.
+
+    Args:
+        file_path: string file path, can be relative or absolute
+        chunksize: maximum number of rows per dataframe
+        **kwargs: Keyword arguments passed to the reader (pyarrow.parquet.ParquetFile.iter_batches,
+            pandas.read_csv or pandas.read_json)
+
+    Return:
+        generator of pandas DataFrames
+    """
+    file_path = Path(file_path)
+
+    allowed_chunk_reader_extension = {
+        k: v.get("chunk_read")
+        for k, v in SUPPORTED_FILE_EXTENSION.items()
+        if v.get("chunk_read") is not None
+    }
+
+    try:
+        function = allowed_chunk_reader_extension[file_path.suffix]
+    except KeyError:
+        raise UnsupportedFileExtensionError(
+            f"File with extension '{file_path.suffix}' is not supported for reading in chunks. "
+            f"The allowed extension are: {list(allowed_chunk_reader_extension.keys())}. "
+            "Update SUPPORTED_FILE_EXTENSION in common_utils.io_handler.file to add support for this file extension."
+        )
+
+    return function(file_path, chunksize, **kwargs)
+
+
+def save_chunks_to_file(chunks, file_path, build_parent_dir=True, **kwargs):
+    """
+    Save an iterable of dataframes to a single file, writing chunk by chunk so the full data
+    never has to be held in memory (e.g. the output of DatabaseConnection.select_iter).
+    Parquet files get a row group per chunk, csv files a single header.
+
+    Args:
+        chunks: iterable of pandas DataFrames with the same columns
+        file_path: string file path (.parquet, .csv or .jsonl), can be relative or absolute
+        build_parent_dir: boolean, set to true to build parent dirs. Default is True
+        **kwargs: Keyword arguments passed to the writer (pyarrow.parquet.ParquetWriter,
+            pandas.DataFrame.to_csv or pandas.DataFrame.to_json)
+
+    Return:
+        number of rows written
+    """
+    file_path = prepare_file_path(file_path) if build_parent_dir else Path(file_path)
+
+    allowed_chunk_writer_extension = {
+        k: v.get("chunk_write")
+        for k, v in SUPPORTED_FILE_EXTENSION.items()
+        if v.get("chunk_write") is not None
+    }
+
+    try:
+        function = allowed_chunk_writer_extension[file_path.suffix]
+    except KeyError:
+        raise UnsupportedFileExtensionError(
+            f"File with extension '{file_path.suffix}' is not supported for writing in chunks. "
+            f"The allowed extension are: {list(allowed_chunk_writer_extension.keys())}. "
+            "Update SUPPORTED_FILE_EXTENSION in common_utils.io_handler.file to add support for this file extension."
+        )
+
+    # always wanna delete file if fail
+    try:
+        return function(chunks, file_path, **kwargs)
+    except Exception as e:
+        print(f"Unable to write to {file_path}. Removing created file place holder")
+        remove_file(file_path=file_path)
+        raise e
+
+
 if __name__ == "__main__":
     # read_file("test.py")
     # remove_dir("test")
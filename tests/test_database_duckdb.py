@@ -0,0 +1,196 @@
+import tempfile
+import shutil
+from pathlib import Path
+import pandas as pd
+import pytest
+from common_utils.io_handler.database.connection import DatabaseConnection
+from common_utils.io_handler.database.query import ParameterisedQuery
+
+
+@pytest.fixture
+def tmpdir():
+    # create a temporary directory under the user's home so prepare_file_path accepts it
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    yield tmpdir
+    try:
+        shutil.rmtree(tmpdir)
+    except Exception:
+        pass
+
+
+def test_duckdb_connection_create_insert_select(tmpdir):
+    with DatabaseConnection(
+        connection_engine="duckdb", database_file_path=str(tmpdir / "test_db.duckdb")
+    ) as conn:
+        conn.execute_statement("CREATE TABLE test_table (id INTEGER, val TEXT);")
+
+        df_in = pd.DataFrame([{"val": "a", "id": 1}, {"val": "b", "id": 2}])
+        conn.insert_into_table(df_in, "test_table")
+
+        df_out = conn.select_into_dataframe("SELECT id, val FROM test_table")
+        assert len(df_out) == 2
+        # results come back arrow backed unless asked otherwise
+        assert isinstance(df_out["id"].dtype, pd.ArrowDtype)
+
+        q = {"table": "test_table", "columns": ["val"], "filters": {"id": {">": 1}}}
+        df_out2 = conn.select_into_dataframe(q, dtype_backend="numpy")
+        assert df_out2["val"].tolist() == ["b"]
+
+        chunks = list(conn.select_iter("SELECT * FROM test_table", chunksize=1))
+        assert sum(len(chunk) for chunk in chunks) == 2
+
+        partitioned = conn.select_into_dataframe(
+            "SELECT * FROM test_table", partition_column="id", partitions=2
+        )
+        assert sorted(partitioned["id"].tolist()) == [1, 2]
+
+
+def test_duckdb_catalog_and_table_details(tmpdir):
+    with DatabaseConnection(connection_engine="duckdb") as conn:
+        conn.insert_into_table(pd.DataFrame({"id": [1]}), "new_table")
+        conn.execute_statement("CREATE VIEW new_view AS SELECT * FROM new_table;")
+
+        objects = conn.get_all_objects()
+        assert set(objects.object_type) == {"table", "view"}
+        assert conn.find_objects("new_table")[0]["schema_name"] == "main"
+
+        details = conn.get_table_details("new_table")
+        assert details["col"].tolist() == ["id"]
+
+        conn.insert_into_table(pd.DataFrame({"id": [2, 3]}), "new_table")
+        assert len(conn.select_into_dataframe("SELECT * FROM new_table")) == 3
+
+        with pytest.raises(ValueError):
+            conn.insert_into_table(
+                pd.DataFrame({"id": [1]}), "new_table", if_exists="fail"
+            )
+
+
+def test_duckdb_queries_file_globs_in_place(tmpdir):
+    for index in range(3):
+        pd.DataFrame({"part": [index] * 2, "amount": [1.0, 2.0]}).to_parquet(
+            tmpdir / f"export_{index}.parquet"
+        )
+
+    with DatabaseConnection(connection_engine="duckdb") as conn:
+        conn.create_view_from_files("exports", tmpdir / "export_*.parquet")
+        totals = conn.select_into_dataframe(
+            "SELECT part, SUM(amount) total FROM exports GROUP BY part ORDER BY part"
+        )
+        assert totals["total"].tolist() == [3.0, 3.0, 3.0]
+
+
+def test_duckdb_select_into_file(tmpdir):
+    with DatabaseConnection(connection_engine="duckdb") as conn:
+        conn.insert_into_table(pd.DataFrame({"id": range(100)}), "export_table")
+
+        # written by duckdb itself
+        row_count = conn.select_into_file(
+            "SELECT * FROM export_table", tmpdir / "export.parquet", chunksize=30
+        )
+        assert row_count == 100
+        assert len(pd.read_parquet(tmpdir / "export.parquet")) == 100
+
+        # parameterised queries go through select_iter
+        row_count = conn.select_into_file(
+            {"table": "export_table", "columns": [], "filters": {"id": {"<": 10}}},
+            tmpdir / "export.csv",
+        )
+        assert row_count == 10
+        assert len(pd.read_csv(tmpdir / "export.csv")) == 10
+
+
+def test_duckdb_load_file_into_table(tmpdir):
+    for index in range(2):
+        pd.DataFrame({"id": [index] * 5}).to_csv(
+            tmpdir / f"load_{index}.csv", index=False
+        )
+
+    with DatabaseConnection(connection_engine="duckdb") as conn:
+        assert conn.load_file_into_table(tmpdir / "load_*.csv", "loaded_table") == 10
+        assert conn.load_file_into_table(tmpdir / "load_0.csv", "loaded_table") == 5
+        assert len(conn.select_into_dataframe("SELECT * FROM loaded_table")) == 15
+
+
+def test_duckdb_get_tables_details_in_one_query():
+    with DatabaseConnection(connection_engine="duckdb") as conn:
+        conn.execute_statement("CREATE SCHEMA other;")
+        conn.execute_statement("CREATE TABLE first_table (id INTEGER, val VARCHAR);")
+        conn.execute_statement("CREATE TABLE other.second_table (id BIGINT);")
+
+        details = conn.get_tables_details(
+            [("other", "second_table"), "first_table", ("main", "missing_table")]
+        )
+        assert details.values.tolist() == [
+            ["main", "first_table", "id", "INTEGER"],
+            ["main", "first_table", "val", "VARCHAR"],
+            ["other", "second_table", "id", "BIGINT"],
+        ]
+
+
+def test_duckdb_transaction_rolls_back_when_first_call_is_insert(tmpdir):
+    with DatabaseConnection(
+        connection_engine="duckdb", database_file_path=str(tmpdir / "test_db.duckdb")
+    ) as conn:
+        conn.execute_statement("CREATE TABLE tx_table (id INTEGER);")
+
+        with pytest.raises(RuntimeError):
+            with conn.transaction():
+                conn.insert_into_table(pd.DataFrame({"id": [1, 2]}), "tx_table")
+                raise RuntimeError("rolled back")
+        assert conn.select_into_dataframe("SELECT * FROM tx_table").empty
+
+        with conn.transaction():
+            conn.insert_into_table(pd.DataFrame({"id": [1, 2]}), "tx_table")
+        assert len(conn.select_into_dataframe("SELECT * FROM tx_table")) == 2
+
+
+def test_duckdb_select_applies_pandas_reader_options():
+    with DatabaseConnection(connection_engine="duckdb") as conn:
+        conn.execute_statement(
+            "CREATE TABLE dated (id INTEGER, due TEXT); INSERT INTO dated VALUES (1, '2024-01-31');"
+        )
+
+        out = conn.select_into_dataframe(
+            "SELECT * FROM dated", parse_dates=["due"], index_col="id"
+        )
+        assert out.loc[1, "due"] == pd.Timestamp("2024-01-31")
+
+        out = conn.select_into_dataframe(
+            "SELECT * FROM dated", parse_dates={"due": "%Y-%m-%d"}
+        )
+        assert pd.api.types.is_datetime64_any_dtype(out["due"])
+
+        with pytest.raises(TypeError, match="coerce_float"):
+            conn.select_into_dataframe("SELECT * FROM dated", coerce_float=False)
+
+
+def test_duckdb_parameters_leave_casts_literals_and_paths_alone(tmpdir):
+    with DatabaseConnection(connection_engine="duckdb") as conn:
+        conn.execute_statement(
+            "CREATE TABLE cast_table (id INTEGER, v INTEGER); INSERT INTO cast_table VALUES (1, 5);"
+        )
+        out = conn.select_into_dataframe(
+            {
+                "table": "cast_table",
+                "columns": ["id", "v::varchar as vv"],
+                "filters": {"id": 1},
+            }
+        )
+        assert out["vv"].tolist() == ["5"]
+
+        out = conn.select_into_dataframe(
+            ParameterisedQuery(
+                sql="SELECT ':id' AS label, id FROM cast_table WHERE id = :id",
+                params={"id": 1},
+            )
+        )
+        assert out["label"].tolist() == [":id"]
+
+        # quotes in the path and options are escaped
+        file_path = tmpdir / "it's.csv"
+        file_path.write_text("id;val\n1;a\n")
+        conn.create_view_from_files("quoted_view", str(file_path), delim=";")
+        assert conn.select_into_dataframe("SELECT * FROM quoted_view")[
+            "val"
+        ].tolist() == ["a"]
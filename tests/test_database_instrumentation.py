@@ -0,0 +1,110 @@
+import tempfile
+import shutil
+from pathlib import Path
+import pandas as pd
+import pytest
+from common_utils.io_handler.database import (
+    DatabaseConnection,
+    QueryCollector,
+    QueryHook,
+)
+
+
+@pytest.fixture
+def db_file():
+    # create a temporary directory under the user's home so prepare_file_path accepts it
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    yield str(tmpdir / "test_db.sqlite")
+    try:
+        shutil.rmtree(tmpdir)
+    except Exception:
+        pass
+
+
+class RecordingHook(QueryHook):
+    def __init__(self):
+        self.calls = []
+
+    def before_query(self, metrics):
+        self.calls.append(("before", metrics.method))
+
+    def after_query(self, metrics):
+        self.calls.append(("after", metrics.method))
+
+
+class FailingHook(QueryHook):
+    def after_query(self, metrics):
+        raise RuntimeError("broken hook")
+
+
+def test_collector_records_timings_rows_and_errors(db_file):
+    collector = QueryCollector(slow_query_seconds=0)
+    with DatabaseConnection(
+        connection_engine="sqlite",
+        database_file_path=db_file,
+        query_hooks=[collector],
+    ) as conn:
+        conn.insert_into_table(pd.DataFrame({"id": range(10)}), "metric_table")
+        for _ in range(2):
+            conn.select_into_dataframe(
+                {"table": "metric_table", "columns": [], "filters": {"id": {"<": 5}}}
+            )
+        assert (
+            sum(
+                len(chunk)
+                for chunk in conn.select_iter("SELECT * FROM metric_table", chunksize=3)
+            )
+            == 10
+        )
+        with pytest.raises(Exception):
+            conn.execute_statement("SELECT * FROM missing_table")
+
+    records = collector.to_dataframe()
+    selects = records[
+        (records["method"] == "select_into_dataframe")
+        & records["sql"].str.contains(":p0_0", na=False)
+    ]
+    assert len(selects) == 2
+    assert (selects["rows"] == 5).all()
+    assert (selects["result_bytes"] > 0).all()
+    assert (selects["execute_seconds"] > 0).all()
+
+    # phases add up to the total
+    first = records.iloc[0]
+    assert first["method"] == "insert_into_table" and first["rows"] == 10
+    assert first["parse_seconds"] + first["acquire_seconds"] + first[
+        "execute_seconds"
+    ] + first["fetch_seconds"] == pytest.approx(first["total_seconds"])
+
+    assert records.loc[records["method"] == "select_iter", "rows"].item() == 10
+    assert records["error"].notna().sum() == 1
+
+    report = collector.report()
+    assert report["total_seconds"].is_monotonic_decreasing
+    assert report.loc[report["method"] == "select_into_dataframe", "count"].max() == 2
+    assert len(collector.slow_queries()) == len(records)
+    assert collector.slow_queries(slow_query_seconds=60).empty
+
+
+def test_hooks_can_be_added_and_removed(db_file):
+    hook = RecordingHook()
+    with DatabaseConnection(
+        connection_engine="sqlite", database_file_path=db_file
+    ) as conn:
+        conn.add_query_hook(hook)
+        conn.execute_statement("CREATE TABLE hook_table (id INTEGER);")
+        assert hook.calls == [
+            ("before", "execute_statement"),
+            ("after", "execute_statement"),
+        ]
+
+        # a failing hook doesn't fail the query
+        failing_hook = FailingHook()
+        conn.add_query_hook(failing_hook)
+        with pytest.warns(UserWarning, match="broken hook"):
+            conn.execute_statement("INSERT INTO hook_table VALUES (1);")
+
+        conn.remove_query_hook(hook)
+        conn.remove_query_hook(failing_hook)
+        conn.execute_statement("INSERT INTO hook_table VALUES (2);")
+        assert len(hook.calls) == 4
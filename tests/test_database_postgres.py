@@ -0,0 +1,111 @@
+import tempfile
+import shutil
+from pathlib import Path
+import pandas as pd
+import pytest
+import sqlalchemy
+from common_utils.io_handler.database.connection import (
+    _EXECUTE_STARTED_INFO_KEY,
+    DatabaseConnection,
+)
+
+
+@pytest.fixture
+def postgres_connection():
+    # needs a local server with the default credentials, skipped otherwise
+    conn = DatabaseConnection(connection_engine="postgres")
+    try:
+        conn.select_into_dataframe("SELECT 1 AS ok")
+    except Exception as e:
+        conn.close()
+        pytest.skip(f"postgres isn't available: {e}")
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def test_postgres_prepared_statements_survive_schema_changes(postgres_connection):
+    postgres_connection.execute_statement(
+        """
+        DROP TABLE IF EXISTS prepared_table;
+        CREATE TABLE prepared_table (id INTEGER, val TEXT);
+        INSERT INTO prepared_table VALUES (1, 'a');
+        """
+    )
+    query = {"table": "public.prepared_table", "columns": [], "filters": {"id": 1}}
+    assert postgres_connection.select_into_dataframe(query).columns.tolist() == [
+        "id",
+        "val",
+    ]
+
+    # changed by another object sharing the pool
+    with DatabaseConnection(connection_engine="postgres") as other:
+        other.execute_statement("ALTER TABLE prepared_table ADD COLUMN amount INTEGER;")
+
+    assert postgres_connection.select_into_dataframe(query).columns.tolist() == [
+        "id",
+        "val",
+        "amount",
+    ]
+    postgres_connection.execute_statement("DROP TABLE prepared_table;")
+
+
+def test_postgres_copy_loads_nullable_integers(postgres_connection):
+    postgres_connection.execute_statement(
+        """
+        DROP TABLE IF EXISTS copy_table;
+        CREATE TABLE copy_table (id INTEGER, amount BIGINT, ratio DOUBLE PRECISION);
+        """
+    )
+    # amount is float64 in pandas because of the null
+    data = pd.DataFrame({"id": [1, 2], "amount": [10, None], "ratio": [1.0, 0.5]})
+    postgres_connection.insert_into_table(
+        data, "copy_table", schema="public", method="copy"
+    )
+
+    out = postgres_connection.select_into_dataframe(
+        "SELECT * FROM copy_table ORDER BY id"
+    )
+    assert out["amount"].tolist()[0] == 10 and pd.isna(out["amount"].tolist()[1])
+    assert out["ratio"].tolist() == [1.0, 0.5]
+    postgres_connection.execute_statement("DROP TABLE copy_table;")
+
+
+def test_postgres_load_file_into_table_with_nullable_integers(postgres_connection):
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        postgres_connection.execute_statement(
+            """
+            DROP TABLE IF EXISTS loaded_table;
+            CREATE TABLE loaded_table (id INTEGER, amount INTEGER);
+            """
+        )
+        # a blank cell in the csv, a nullable integer column in the parquet
+        (tmpdir / "load.csv").write_text("id,amount\n1,10\n2,\n")
+        pd.DataFrame(
+            {"id": [3, 4], "amount": pd.array([30, None], dtype="Int64")}
+        ).to_parquet(tmpdir / "load.parquet")
+
+        for suffix in (".csv", ".parquet"):
+            postgres_connection.load_file_into_table(
+                tmpdir / f"load{suffix}", "loaded_table", schema="public"
+            )
+
+        out = postgres_connection.select_into_dataframe(
+            "SELECT id, amount FROM loaded_table ORDER BY id",
+            dtype_backend="numpy_nullable",
+        )
+        assert out["amount"].tolist() == [10, pd.NA, 30, pd.NA]
+        postgres_connection.execute_statement("DROP TABLE loaded_table;")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def test_postgres_failed_statements_leave_no_execute_timing(postgres_connection):
+    with postgres_connection.engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(sqlalchemy.exc.ProgrammingError):
+                conn.exec_driver_sql("SELECT * FROM missing_table")
+            conn.rollback()
+        assert not conn.info.get(_EXECUTE_STARTED_INFO_KEY)
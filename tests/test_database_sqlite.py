@@ -1,7 +1,12 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
 import tempfile
 import shutil
+import warnings
 from pathlib import Path
 import pandas as pd
+import pytest
 from common_utils.io_handler.database.connection import DatabaseConnection
 
 
@@ -48,3 +53,659 @@ def test_sqlite_connection_create_insert_select():
             shutil.rmtree(tmpdir)
         except Exception:
             pass
+
+
+def test_sqlite_connection_is_reused_until_closed():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite", database_file_path=str(db_file)
+        ) as conn:
+            first_connection = conn.database_connection
+            conn.execute_statement("CREATE TABLE test_table (id INTEGER);")
+            conn.select_into_dataframe("SELECT * FROM test_table")
+            assert conn.database_connection is first_connection
+
+        # closed on exit, next access opens a new one
+        assert conn._connections == []
+        assert conn.database_connection is not first_connection
+        conn.close()
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_select_iter_yields_bounded_chunks():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite", database_file_path=str(db_file)
+        ) as conn:
+            conn.execute_statement("CREATE TABLE test_table (id INTEGER, val TEXT);")
+            conn.insert_into_table(
+                pd.DataFrame({"id": range(25), "val": "x"}), "test_table"
+            )
+
+            chunks = list(conn.select_iter("SELECT * FROM test_table", chunksize=10))
+            assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+            assert list(chunks[0].columns) == ["id", "val"]
+
+            q = {"table": "test_table", "columns": ["id"], "filters": {"id": {"<": 3}}}
+            chunks = list(conn.select_iter(q, chunksize=2))
+            assert pd.concat(chunks)["id"].tolist() == [0, 1, 2]
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_high_throughput_insert_matches_pandas_insert():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        df_in = pd.DataFrame(
+            {
+                "id": [1, 2, 3],
+                "val": ["a", None, ""],
+                "amount": [1.5, float("nan"), 3.0],
+                "created": pd.to_datetime(
+                    ["2024-01-01", None, "2024-01-02 10:11:12.5"], format="mixed"
+                ),
+            }
+        )
+
+        results = {}
+        for high_throughput in (False, True):
+            with DatabaseConnection(
+                connection_engine="sqlite",
+                database_file_path=str(tmpdir / f"{high_throughput}.sqlite"),
+                high_throughput=high_throughput,
+                batch_size=2,
+            ) as conn:
+                conn.insert_into_table(df_in, "test_table")
+                results[high_throughput] = conn.select_into_dataframe(
+                    "SELECT * FROM test_table"
+                )
+                journal_mode = conn.select_into_dataframe("PRAGMA journal_mode")
+
+        assert journal_mode.iloc[0, 0] == "wal"
+        pd.testing.assert_frame_equal(results[False], results[True])
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_catalog_is_cached_and_invalidated_on_ddl():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite", database_file_path=str(db_file)
+        ) as conn:
+            conn.execute_statement("CREATE TABLE first_table (id INTEGER);")
+            assert len(conn.find_objects("first_table")) == 1
+
+            # served from the cache, no catalog query
+            conn._get_all_objects = None
+            assert set(conn.get_all_objects().table_name) == {"first_table"}
+            del conn._get_all_objects
+
+            # ddl and inserts creating tables drop the cache
+            conn.execute_statement("CREATE TABLE second_table (id INTEGER);")
+            assert conn.find_objects("second_table")[0]["schema_name"] == "test_db"
+
+            conn.insert_into_table(pd.DataFrame({"id": [1]}), "third_table")
+            assert len(conn.find_objects("third_table", schema_name="test_db")) == 1
+            assert conn.find_objects("third_table", schema_name="other") == []
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_async_api_runs_concurrently_on_worker_connections():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        async def run():
+            async with DatabaseConnection(
+                connection_engine="sqlite",
+                database_file_path=str(db_file),
+                async_max_workers=2,
+            ) as conn:
+                await conn.async_execute_statement(
+                    "CREATE TABLE test_table (id INTEGER);"
+                )
+                await conn.async_insert_into_table(
+                    pd.DataFrame({"id": range(10)}), "test_table"
+                )
+                results = await asyncio.gather(
+                    *(
+                        conn.async_select_into_dataframe(
+                            {
+                                "table": "test_table",
+                                "columns": [],
+                                "filters": {"id": i},
+                            }
+                        )
+                        for i in range(10)
+                    )
+                )
+                # the worker threads use their own connections, not the caller's
+                assert 1 <= len(conn._connections) <= 2
+                return results
+
+        results = asyncio.run(run())
+        assert [df["id"].item() for df in results] == list(range(10))
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_partitioned_select_matches_single_select():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite", database_file_path=str(db_file)
+        ) as conn:
+            conn.execute_statement("CREATE TABLE test_table (id INTEGER, val REAL);")
+            conn.insert_into_table(
+                pd.DataFrame({"id": [*range(-5, 95), None], "val": range(101)}),
+                "test_table",
+            )
+            expected = conn.select_into_dataframe("SELECT * FROM test_table")
+
+            for partition_column, partition_method in (
+                ("id", "modulo"),
+                ("val", "range"),
+            ):
+                out = conn.select_into_dataframe(
+                    "SELECT * FROM test_table",
+                    partition_column=partition_column,
+                    partitions=3,
+                    partition_method=partition_method,
+                )
+                pd.testing.assert_frame_equal(
+                    out.sort_values("val", ignore_index=True), expected
+                )
+
+            with pytest.raises(ValueError):
+                conn.select_into_dataframe(
+                    "SELECT * FROM test_table",
+                    partition_column="id",
+                    partition_method="hash",
+                )
+
+            # trailing ; and bigint keys floats can't represent exactly
+            conn.execute_statement("CREATE TABLE big_table (id INTEGER);")
+            big_ids = [2**62 + offset for offset in range(7)]
+            conn.insert_into_table(pd.DataFrame({"id": big_ids}), "big_table")
+            out = conn.select_into_dataframe(
+                "SELECT * FROM big_table;",
+                partition_column="id",
+                partitions=3,
+                partition_method="range",
+            )
+            assert sorted(out["id"].tolist()) == big_ids
+
+            # a column all null in one partition keeps the type a single read gives
+            conn.execute_statement("CREATE TABLE sparse_table (id INTEGER, val REAL);")
+            conn.insert_into_table(
+                pd.DataFrame({"id": range(6), "val": [None, 1.5] * 3}), "sparse_table"
+            )
+            with warnings.catch_warnings():
+                warnings.simplefilter("error")
+                out = conn.select_into_dataframe(
+                    "SELECT * FROM sparse_table", partition_column="id", partitions=2
+                )
+            pd.testing.assert_frame_equal(
+                out.sort_values("id", ignore_index=True),
+                conn.select_into_dataframe("SELECT * FROM sparse_table ORDER BY id"),
+            )
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_result_cache_is_invalidated_by_writes():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite",
+            database_file_path=str(db_file),
+            result_cache_bytes=1024**2,
+        ) as conn:
+            conn.execute_statement(
+                "CREATE TABLE reference_data (id INTEGER, val TEXT);"
+            )
+            conn.execute_statement("CREATE TABLE other (id INTEGER);")
+            conn.insert_into_table(
+                pd.DataFrame({"id": [1, 2], "val": ["a", "b"]}), "reference_data"
+            )
+
+            query = {
+                "table": "reference_data",
+                "columns": [],
+                "filters": {"id": {">": 0}},
+            }
+            first = conn.select_into_dataframe(query)
+            assert len(first) == 2
+
+            # served from the cache, no database read
+            conn._select_into_dataframe = None
+            second = conn.select_into_dataframe(query)
+            pd.testing.assert_frame_equal(first, second)
+            del conn._select_into_dataframe
+
+            # cached data can't be changed through the frames handed out
+            with pytest.raises(ValueError):
+                second.loc[0, "id"] = 100
+            assert conn.select_into_dataframe(query)["id"].tolist() == [1, 2]
+
+            # writes to other tables keep the entry, writes to reference_data drop it
+            conn.execute_statement("INSERT INTO other VALUES (1);")
+            assert conn._result_cache.size_bytes > 0
+            conn.execute_statement("UPDATE reference_data SET id = 3 WHERE id = 2;")
+            assert conn.select_into_dataframe(query)["id"].tolist() == [1, 3]
+
+            conn.insert_into_table(
+                pd.DataFrame({"id": [4], "val": ["d"]}), "reference_data"
+            )
+            assert len(conn.select_into_dataframe(query)) == 3
+
+        # results bigger than the limit aren't cached
+        with DatabaseConnection(
+            connection_engine="sqlite",
+            database_file_path=str(db_file),
+            result_cache_bytes=1,
+        ) as conn:
+            assert len(conn.select_into_dataframe("SELECT * FROM reference_data")) == 3
+            assert conn._result_cache.size_bytes == 0
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_execute_script_runs_in_one_transaction():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite", database_file_path=str(db_file)
+        ) as conn:
+            rowcounts = conn.execute_script(
+                """
+                CREATE TABLE script_table (id INTEGER, val TEXT);
+                INSERT INTO script_table VALUES (1, 'a'), (2, 'b'), (3, 'c');
+                UPDATE script_table SET val = 'z' WHERE id > 1;
+                """
+            )
+            assert rowcounts == [-1, 3, 2]
+
+            rowcounts = conn.execute_script(
+                [
+                    "DELETE FROM script_table WHERE id = 1",
+                    {"table": "script_table", "columns": [], "filters": {"id": 2}},
+                ]
+            )
+            assert rowcounts == [1, -1]
+
+            # a failing statement rolls back the whole script, ddl included
+            with pytest.raises(Exception):
+                conn.execute_script(
+                    [
+                        "INSERT INTO script_table VALUES (4, 'd')",
+                        "CREATE TABLE other_table (id INTEGER)",
+                        "SELECT * FROM missing_table",
+                    ]
+                )
+            assert conn.select_into_dataframe("SELECT id FROM script_table")[
+                "id"
+            ].tolist() == [2, 3]
+            assert conn.find_objects("other_table") == []
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_upsert_inserts_new_and_updates_existing_rows():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite", database_file_path=str(db_file)
+        ) as conn:
+            conn.execute_statement(
+                "CREATE TABLE upsert_table (id INTEGER PRIMARY KEY, val TEXT, amount REAL);"
+            )
+            conn.insert_into_table(
+                pd.DataFrame({"id": [1, 2], "val": ["a", "b"], "amount": [1.0, 2.0]}),
+                "upsert_table",
+            )
+
+            conn.insert_into_table(
+                pd.DataFrame({"id": [2, 3], "val": ["B", "c"], "amount": [None, 3.0]}),
+                "upsert_table",
+                if_exists="upsert",
+                key_columns=["id"],
+            )
+            df_out = conn.select_into_dataframe(
+                "SELECT * FROM upsert_table ORDER BY id"
+            )
+            assert df_out["val"].tolist() == ["a", "B", "c"]
+            assert df_out["amount"].isna().tolist() == [False, True, False]
+
+            # the temporary table doesn't outlive the upsert
+            assert (
+                conn.select_into_dataframe("SELECT COUNT(*) n FROM temp.sqlite_master")[
+                    "n"
+                ].item()
+                == 0
+            )
+
+            # upserting into a missing table creates it
+            conn.insert_into_table(
+                pd.DataFrame({"id": [1]}),
+                "new_table",
+                if_exists="upsert",
+                key_columns=["id"],
+            )
+            assert len(conn.select_into_dataframe("SELECT * FROM new_table")) == 1
+
+            with pytest.raises(ValueError):
+                conn.insert_into_table(
+                    pd.DataFrame({"id": [1]}), "upsert_table", if_exists="upsert"
+                )
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_select_arrow_backed_and_memory_optimized():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite", database_file_path=str(db_file)
+        ) as conn:
+            conn.insert_into_table(
+                pd.DataFrame({"id": range(100), "region": ["north", "south"] * 50}),
+                "wide_table",
+            )
+
+            df_arrow = conn.select_into_dataframe(
+                "SELECT * FROM wide_table", dtype_backend="pyarrow"
+            )
+            assert isinstance(df_arrow["region"].dtype, pd.ArrowDtype)
+
+            df_small = conn.select_into_dataframe(
+                "SELECT * FROM wide_table", optimize_memory=True
+            )
+            assert isinstance(df_small["region"].dtype, pd.CategoricalDtype)
+            assert df_small["id"].dtype == "int8"
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_select_into_file_streams_chunks():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite", database_file_path=str(db_file)
+        ) as conn:
+            conn.insert_into_table(
+                pd.DataFrame({"id": range(25), "val": ["x"] * 25}), "export_table"
+            )
+            row_count = conn.select_into_file(
+                "SELECT * FROM export_table",
+                tmpdir / "exports" / "export.parquet",
+                chunksize=10,
+            )
+            assert row_count == 25
+
+            df_out = pd.read_parquet(tmpdir / "exports" / "export.parquet")
+            assert df_out["id"].tolist() == list(range(25))
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_load_file_into_table_from_glob():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+        for index in range(3):
+            pd.DataFrame({"id": range(index * 10, index * 10 + 10)}).to_parquet(
+                tmpdir / f"load_{index}.parquet"
+            )
+
+        with DatabaseConnection(
+            connection_engine="sqlite", database_file_path=str(db_file)
+        ) as conn:
+            row_count = conn.load_file_into_table(
+                tmpdir / "load_*.parquet", "loaded_table", chunksize=4
+            )
+            assert row_count == 30
+
+            df_out = conn.select_into_dataframe("SELECT id FROM loaded_table")
+            assert sorted(df_out["id"].tolist()) == list(range(30))
+
+            # replace only applies to the first chunk
+            conn.load_file_into_table(
+                tmpdir / "load_0.parquet",
+                "loaded_table",
+                if_exists="replace",
+                chunksize=4,
+            )
+            assert len(conn.select_into_dataframe("SELECT id FROM loaded_table")) == 10
+
+            with pytest.raises(FileNotFoundError):
+                conn.load_file_into_table(tmpdir / "missing_*.csv", "loaded_table")
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_get_tables_details_in_one_query():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite", database_file_path=str(db_file)
+        ) as conn:
+            conn.execute_statement("CREATE TABLE first_table (id INTEGER, val TEXT);")
+            conn.execute_statement("CREATE TABLE second_table (code TEXT);")
+
+            details = conn.get_tables_details(
+                [("test_db", "second_table"), "first_table", "missing_table"]
+            )
+            assert details.values.tolist() == [
+                ["test_db", "first_table", "id", "INTEGER"],
+                ["test_db", "first_table", "val", "TEXT"],
+                ["test_db", "second_table", "code", "TEXT"],
+            ]
+            assert conn.get_tables_details([]).empty
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_select_pages_walks_table_with_keyset():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite", database_file_path=str(db_file)
+        ) as conn:
+            conn.insert_into_table(
+                pd.DataFrame({"grp": ["a", "b"] * 25, "id": range(50)}), "paged_table"
+            )
+            query = {
+                "table": "paged_table",
+                "columns": ["grp", "id"],
+                "filters": {},
+                "order_by": ["grp", "id"],
+            }
+
+            pages = list(conn.select_pages(query, page_size=10))
+            assert [len(page) for page in pages] == [10] * 5
+            walked = pd.concat(pages, ignore_index=True)
+            expected = conn.select_into_dataframe(query)
+            pd.testing.assert_frame_equal(walked, expected)
+
+            # resume after a given row, an exact multiple of page_size ends cleanly
+            pages = list(
+                conn.select_pages(
+                    {**query, "after": {"grp": "b", "id": 29}}, page_size=10
+                )
+            )
+            assert [len(page) for page in pages] == [10]
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_sqlite_read_pool_shares_readers_and_serialises_writes():
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        db_file = tmpdir / "test_db.sqlite"
+
+        with DatabaseConnection(
+            connection_engine="sqlite",
+            database_file_path=str(db_file),
+            read_pool_size=2,
+        ) as conn:
+            conn.execute_statement("CREATE TABLE pooled_table (id INTEGER);")
+
+            def write_and_read(thread_number):
+                conn.insert_into_table(
+                    pd.DataFrame(
+                        {"id": range(thread_number * 10, thread_number * 10 + 10)}
+                    ),
+                    "pooled_table",
+                )
+                return len(conn.select_into_dataframe("SELECT * FROM pooled_table"))
+
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                row_counts = list(executor.map(write_and_read, range(8)))
+
+            assert all(10 <= row_count <= 80 for row_count in row_counts)
+            assert len(conn.select_into_dataframe("SELECT * FROM pooled_table")) == 80
+            assert conn.select_into_dataframe("PRAGMA journal_mode").iloc[0, 0] == "wal"
+
+            # a writer and at most read_pool_size readers whatever the number of threads
+            assert len(conn._connections) <= 3
+            with conn._reader_scope() as reader:
+                with pytest.raises(sqlite3.OperationalError, match="readonly"):
+                    reader.execute("DELETE FROM pooled_table")
+
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+@pytest.mark.parametrize("read_pool_size", [None, 2])
+def test_sqlite_transaction_commits_once_or_rolls_back(read_pool_size):
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        with DatabaseConnection(
+            connection_engine="sqlite",
+            database_file_path=str(tmpdir / "test_db.sqlite"),
+            read_pool_size=read_pool_size,
+        ) as conn:
+            conn.execute_statement("CREATE TABLE tx_table (id INTEGER PRIMARY KEY);")
+
+            # pandas commits its own transaction unless one is in progress
+            with pytest.raises(RuntimeError):
+                with conn.transaction():
+                    conn.insert_into_table(pd.DataFrame({"id": [1, 2]}), "tx_table")
+                    raise RuntimeError("rolled back")
+            assert conn.select_into_dataframe("SELECT * FROM tx_table").empty
+
+            with pytest.raises(RuntimeError):
+                with conn.transaction():
+                    conn.execute_statement(
+                        "INSERT INTO tx_table VALUES (1); CREATE TABLE tx_other (id INTEGER);"
+                    )
+                    conn.insert_into_table(pd.DataFrame({"id": [2]}), "tx_table")
+                    # the transaction's writes are visible within it
+                    assert (
+                        len(conn.select_into_dataframe("SELECT * FROM tx_table")) == 2
+                    )
+                    raise RuntimeError("rolled back")
+
+            assert conn.select_into_dataframe("SELECT * FROM tx_table").empty
+            assert not conn.find_objects(table_name="tx_other")
+
+            with conn.transaction():
+                conn.insert_into_table(pd.DataFrame({"id": [1, 2]}), "tx_table")
+                with conn.transaction():
+                    conn.execute_script(["DELETE FROM tx_table WHERE id = 1"])
+
+            assert conn.select_into_dataframe("SELECT id FROM tx_table")[
+                "id"
+            ].tolist() == [2]
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
@@ -19,3 +19,58 @@ def test_remove_dir_raises_for_file(tmp_path):
     f.write_text("x")
     with pytest.raises(NotADirectoryError):
         filemod.remove_dir(str(f))
+
+
+def test_save_chunks_to_file(tmp_path):
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    chunks = [
+        pd.DataFrame({"id": [1, 2], "val": ["a", None]}),
+        pd.DataFrame({"id": [3], "val": ["c"]}),
+    ]
+    for suffix in (".parquet", ".csv", ".jsonl"):
+        target = tmp_path / f"chunks{suffix}"
+        assert filemod.save_chunks_to_file(iter(chunks), str(target)) == 3
+        content = filemod.read_file(str(target))
+        assert content["id"].tolist() == [1, 2, 3]
+
+    # a row group per chunk
+    assert pq.ParquetFile(tmp_path / "chunks.parquet").num_row_groups == 2
+
+    with pytest.raises(filemod.UnsupportedFileExtensionError):
+        filemod.save_chunks_to_file(iter(chunks), str(tmp_path / "chunks.xlsx"))
+
+
+def test_read_file_chunks(tmp_path):
+    import pandas as pd
+
+    data = pd.DataFrame({"id": range(10)})
+    data.to_parquet(tmp_path / "data.parquet")
+    data.to_csv(tmp_path / "data.csv", index=False)
+
+    for suffix in (".parquet", ".csv"):
+        chunks = list(filemod.read_file_chunks(tmp_path / f"data{suffix}", chunksize=4))
+        assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+        assert pd.concat(chunks)["id"].tolist() == list(range(10))
+
+
+def test_save_chunks_to_parquet_with_column_null_in_first_chunk(tmp_path, monkeypatch):
+    import pandas as pd
+    import pyarrow.parquet as pq
+
+    chunks = [
+        pd.DataFrame({"id": [1, 2], "val": [None, None]}),
+        pd.DataFrame({"id": [3], "val": ["c"]}),
+        pd.DataFrame({"id": [4], "val": [None]}),
+    ]
+    target = tmp_path / "chunks.parquet"
+    assert filemod.save_chunks_to_file(iter(chunks), str(target)) == 4
+    assert filemod.read_file(str(target))["val"].tolist() == [None, None, "c", None]
+    assert pq.ParquetFile(target).num_row_groups == 3
+
+    # past the buffer the columns still without values are written as strings
+    monkeypatch.setattr(filemod, "PARQUET_SCHEMA_BUFFER_ROWS", 2)
+    assert filemod.save_chunks_to_file(iter(chunks), str(target)) == 4
+    assert pq.read_schema(target).field("val").type == "string"
+    assert filemod.read_file(str(target))["val"].tolist() == [None, None, "c", None]
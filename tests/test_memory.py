@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+from common_utils.data_handler.memory import optimize_dataframe_memory
+
+
+def test_optimize_dataframe_memory_keeps_values():
+    data = pd.DataFrame(
+        {
+            "id": np.arange(100),
+            "amount": np.linspace(0, 1, 100),
+            "qty": np.arange(100, dtype=float),
+            "region": ["north", "south"] * 50,
+            "name": [f"name_{i}" for i in range(100)],
+            "flag": [True, False] * 50,
+        }
+    )
+    optimized = optimize_dataframe_memory(data)
+
+    assert optimized["id"].dtype == np.int8
+    # downcasting amount to float32 would lose precision
+    assert optimized["amount"].dtype == np.float64
+    assert optimized["qty"].dtype == np.float32
+    assert isinstance(optimized["region"].dtype, pd.CategoricalDtype)
+    assert optimized["name"].dtype == object
+    assert optimized["flag"].dtype == bool
+
+    pd.testing.assert_frame_equal(
+        optimized.astype(data.dtypes.to_dict()), data, check_categorical=False
+    )
+    assert optimized.memory_usage(deep=True).sum() < data.memory_usage(deep=True).sum()
+    # the input isn't modified
+    assert data["id"].dtype == np.int64
+
+
+def test_optimize_dataframe_memory_arrow_backed():
+    data = pd.DataFrame(
+        {"id": [1, 2, None] * 10, "region": ["a", "b", None] * 10}
+    ).convert_dtypes(dtype_backend="pyarrow")
+    optimized = optimize_dataframe_memory(data)
+
+    assert optimized["id"].dtype == "int8[pyarrow]"
+    assert isinstance(optimized["region"].dtype, pd.CategoricalDtype)
+    assert optimized["region"].isna().sum() == 10
+
+
+def test_optimize_dataframe_memory_invalid_input():
+    with pytest.raises(ValueError):
+        optimize_dataframe_memory([1, 2, 3])
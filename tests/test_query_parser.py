@@ -0,0 +1,101 @@
+import pytest
+from common_utils.io_handler.database import query
+from common_utils.io_handler.database.query import QueryParser
+
+
+class _Connection:
+    @QueryParser
+    def select(self, query, **kwargs):
+        return query
+
+
+def test_query_parser_accepts_positional_and_keyword_query():
+    conn = _Connection()
+    assert conn.select("select   *   from   tbl") == conn.select(
+        query="select * from tbl"
+    )
+
+
+def test_query_parser_caches_formatted_sql():
+    query._format_sql.cache_clear()
+    conn = _Connection()
+
+    for _ in range(3):
+        conn.select("select * from cached_table")
+
+    assert query._format_sql.cache_info().hits == 2
+    assert query._format_sql.cache_info().misses == 1
+
+
+def test_query_parser_skips_formatting_but_still_validates(monkeypatch):
+    monkeypatch.setattr(QueryParser, "format_sql", False)
+    conn = _Connection()
+
+    assert conn.select("  select   *\n  from tbl ") == "select * from tbl"
+
+    with pytest.raises(AssertionError):
+        conn.select({"table": "tbl"})
+
+
+def test_query_parser_requires_query_argument():
+    with pytest.raises(KeyError):
+
+        @QueryParser
+        def select(self, sql):
+            return sql
+
+
+def test_query_parser_binds_dict_filters_as_parameters():
+    conn = _Connection()
+    parsed = conn.select(
+        {"table": "tbl", "columns": ["a"], "filters": {"a": [1, 2], "b": "x"}}
+    )
+
+    assert isinstance(parsed, query.ParameterisedQuery)
+    assert parsed.params == {"p0_0": 1, "p0_1": 2, "p1_0": "x"}
+    assert "'x'" not in parsed.sql
+
+
+def test_query_parser_orders_limits_and_seeks_after_keyset(monkeypatch):
+    monkeypatch.setattr(QueryParser, "format_sql", False)
+    conn = _Connection()
+    parsed = conn.select(
+        {
+            "table": "tbl",
+            "columns": [],
+            "filters": {"a": "x"},
+            "order_by": ["b", "c"],
+            "after": {"b": 1, "c": 2},
+            "limit": 10,
+        }
+    )
+
+    assert " ".join(parsed.sql.split()) == (
+        "SELECT * FROM tbl WHERE a = :p0_0 AND (b, c) > (:after_0, :after_1)"
+        " ORDER BY b ASC, c ASC LIMIT :row_limit"
+    )
+    assert parsed.params == {"p0_0": "x", "after_0": 1, "after_1": 2, "row_limit": 10}
+
+    # the keyset columns are the default order
+    parsed = conn.select(
+        {"table": "tbl", "columns": [], "filters": {}, "after": {"b": 1}}
+    )
+    assert " ".join(parsed.sql.split()) == (
+        "SELECT * FROM tbl WHERE b > :after_0 ORDER BY b ASC"
+    )
+
+
+def test_query_parser_rejects_invalid_keyset():
+    conn = _Connection()
+    base = {"table": "tbl", "columns": [], "filters": {}}
+
+    with pytest.raises(AssertionError):
+        conn.select({**base, "order_by": "a", "after": {"b": 1}})
+    with pytest.raises(AssertionError):
+        conn.select(
+            {**base, "order_by": {"a": "asc", "b": "desc"}, "after": {"a": 1, "b": 2}}
+        )
+    with pytest.raises(AssertionError):
+        conn.select({**base, "order_by": {"a": "sideways"}})
+    with pytest.raises(AssertionError):
+        conn.select({**base, "limit": -1})
@@ -3,26 +3,30 @@ from common_utils.io_handler.database._query_transformer import _transform_kv_to
 
 
 def test_transform_str():
-    assert _transform_kv_to_clause("a", "col") == "col = 'a'"
+    assert _transform_kv_to_clause("a", "col") == ("col = :col_0", {"col_0": "a"})
 
 
 def test_transform_num():
-    assert _transform_kv_to_clause(5, "n") == "n = 5"
+    assert _transform_kv_to_clause(5, "n") == ("n = :n_0", {"n_0": 5})
 
 
 def test_transform_list():
-    # use strings to avoid internal join type-mismatch in the implementation
-    out = _transform_kv_to_clause(["1", "b"], "c")
-    # check basic structure and members
-    assert "c in" in out
-    assert "'b'" in out
-    assert "'1'" in out
+    out, params = _transform_kv_to_clause([1, "b"], "c", param_prefix="p0")
+    assert out == "c in (:p0_0, :p0_1)"
+    assert params == {"p0_0": 1, "p0_1": "b"}
+
+
+def test_transform_value_is_never_inlined():
+    out, params = _transform_kv_to_clause("x' or '1'='1", "tbl.col")
+    assert out == "tbl.col = :tbl_col_0"
+    assert params == {"tbl_col_0": "x' or '1'='1"}
 
 
 def test_transform_dict_valid_and_invalid():
     # valid comparator
-    out = _transform_kv_to_clause({">": 5}, "a")
-    assert isinstance(out, list)
+    out, params = _transform_kv_to_clause({">": 5, "<": 9}, "a")
+    assert out == ["a > :a_0", "a < :a_1"]
+    assert params == {"a_0": 5, "a_1": 9}
 
     # invalid comparator should assert
     with pytest.raises(AssertionError):
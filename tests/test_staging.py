@@ -0,0 +1,375 @@
+import tempfile
+import shutil
+from pathlib import Path
+import pandas as pd
+import pytest
+from common_utils.io_handler.database.connection import DatabaseConnection
+from common_utils.data_handler import staging
+
+
+@pytest.fixture
+def sqlite_connection():
+    # create a temporary directory under the user's home so prepare_file_path accepts it
+    tmpdir = Path(tempfile.mkdtemp(dir=Path.home()))
+    try:
+        with DatabaseConnection(
+            connection_engine="sqlite",
+            database_file_path=str(tmpdir / "test_db.sqlite"),
+        ) as conn:
+            conn.execute_statement(
+                """
+                CREATE TABLE fact (id INTEGER PRIMARY KEY, val TEXT, _created_date TEXT, _created_by TEXT);
+                CREATE TABLE fact_staging (id INTEGER, val TEXT, _created_date TEXT, _created_by TEXT, status TEXT DEFAULT 'pending');
+                """
+            )
+            yield conn
+    finally:
+        try:
+            shutil.rmtree(tmpdir)
+        except Exception:
+            pass
+
+
+def test_get_staging_table_name(sqlite_connection):
+    assert (
+        staging.get_staging_table_name(sqlite_connection, table_name="fact")
+        == "fact_staging"
+    )
+
+    with pytest.raises(staging.MissingStagingTableError):
+        staging.get_staging_table_name(sqlite_connection, table_name="missing")
+
+
+def test_staging_round_trip(sqlite_connection):
+    sqlite_connection.insert_into_table(
+        pd.DataFrame({"id": [1, 2], "val": ["a", "b"]}), "fact"
+    )
+    data = pd.DataFrame({"id": [1, 2, 3], "val": ["a", "changed", "c"]}).assign(
+        _created_date="2024-01-01", _created_by="test"
+    )
+
+    staging.populate_staging_table(sqlite_connection, table_name="fact", data=data)
+    staging.update_staging_table_status(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+    )
+
+    status = sqlite_connection.select_into_dataframe(
+        "SELECT id, status FROM fact_staging ORDER BY id"
+    )
+    assert status["status"].tolist() == ["old", "update", "new"]
+    assert staging.is_new_data_available(sqlite_connection, table_name="fact")
+
+    staging.sync_staging_table_to_source_table(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+    )
+
+    fact = sqlite_connection.select_into_dataframe(
+        "SELECT id, val FROM fact ORDER BY id"
+    )
+    assert fact["val"].tolist() == ["a", "changed", "c"]
+
+
+def test_merge_staging_table_into_source_table(sqlite_connection):
+    sqlite_connection.insert_into_table(
+        pd.DataFrame({"id": [1, 2], "val": ["a", "b"]}), "fact"
+    )
+    data = pd.DataFrame({"id": [1, 2, 3], "val": ["a", "changed", "c"]}).assign(
+        _created_date="2024-01-01", _created_by="test"
+    )
+    staging.populate_staging_table(sqlite_connection, table_name="fact", data=data)
+
+    counts = staging.merge_staging_table_into_source_table(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+    )
+    assert counts == {"new": 1, "updated": 1, "unchanged": 1}
+
+    fact = sqlite_connection.select_into_dataframe(
+        "SELECT id, val, _created_by FROM fact ORDER BY id"
+    )
+    assert fact["val"].tolist() == ["a", "changed", "c"]
+    # unchanged records are left as they are, audit columns included
+    assert fact["_created_by"].tolist() == [None, "test", "test"]
+
+    assert staging.merge_staging_table_into_source_table(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+    ) == {"new": 0, "updated": 0, "unchanged": 3}
+
+
+def test_add_row_hash_column_detects_null_changes():
+    data = pd.DataFrame({"id": [1, 2, 3], "val": ["a", None, "c"]})
+    hashed = staging.add_row_hash_column(data, ["val"])
+
+    assert hashed[staging.ROW_HASH_COLUMN].dtype == "int64"
+    changed = staging.add_row_hash_column(data.assign(val=["a", "b", None]), ["val"])
+    assert (
+        hashed[staging.ROW_HASH_COLUMN] == changed[staging.ROW_HASH_COLUMN]
+    ).tolist() == [True, False, False]
+
+
+def test_add_row_hash_column_ignores_dtypes():
+    # a nullable integer column is int64 in a batch without nulls, float64 otherwise
+    as_int = pd.DataFrame({"amount": [1, 2], "val": ["a", "b"]})
+    as_float = pd.DataFrame({"amount": [1.0, 2.0, None], "val": ["a", "b", None]})
+    as_nullable = as_float.astype({"amount": "Int64", "val": "string[pyarrow]"})
+
+    hashes = [
+        staging.add_row_hash_column(data, ["amount", "val"])[staging.ROW_HASH_COLUMN]
+        for data in (as_int, as_float, as_nullable)
+    ]
+    assert hashes[0].tolist() == hashes[1].tolist()[:2]
+    assert hashes[1].tolist() == hashes[2].tolist()
+
+    # fractions still count
+    changed = staging.add_row_hash_column(
+        as_float.assign(amount=[1.5, 2.0, None]), ["amount", "val"]
+    )
+    assert changed[staging.ROW_HASH_COLUMN].tolist()[0] != hashes[1].tolist()[0]
+
+
+def test_staging_round_trip_with_row_hash(sqlite_connection):
+    sqlite_connection.execute_script(
+        [
+            "ALTER TABLE fact ADD COLUMN _row_hash INTEGER",
+            "ALTER TABLE fact_staging ADD COLUMN _row_hash INTEGER",
+        ]
+    )
+    data = pd.DataFrame({"id": [1, 2], "val": ["a", None]}).assign(
+        _created_date="2024-01-01", _created_by="test"
+    )
+    staging.populate_staging_table(
+        sqlite_connection, table_name="fact", data=data, hash_columns=["val"]
+    )
+    staging.update_staging_table_status(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+        use_row_hash=True,
+    )
+    staging.sync_staging_table_to_source_table(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+        use_row_hash=True,
+    )
+
+    # null to value is an update, which != comparisons miss
+    data = pd.DataFrame({"id": [1, 2, 3], "val": ["a", "b", "c"]}).assign(
+        _created_date="2024-01-02", _created_by="test"
+    )
+    staging.populate_staging_table(
+        sqlite_connection, table_name="fact", data=data, hash_columns=["val"]
+    )
+    staging.update_staging_table_status(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+        use_row_hash=True,
+    )
+    status = sqlite_connection.select_into_dataframe(
+        "SELECT id, status FROM fact_staging ORDER BY id"
+    )
+    assert status["status"].tolist() == ["old", "update", "new"]
+
+    assert staging.merge_staging_table_into_source_table(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+        use_row_hash=True,
+    ) == {"new": 1, "updated": 1, "unchanged": 1}
+    fact = sqlite_connection.select_into_dataframe("SELECT val FROM fact ORDER BY id")
+    assert fact["val"].tolist() == ["a", "b", "c"]
+
+
+def test_incremental_staging_loads_past_watermark(sqlite_connection):
+    def load(ids):
+        data = pd.DataFrame({"id": ids, "val": [f"v{i}" for i in ids]}).assign(
+            _created_date="2024-01-01", _created_by="test"
+        )
+        staging.populate_staging_table(
+            sqlite_connection, table_name="fact", data=data, watermark_column="id"
+        )
+        return sqlite_connection.select_into_dataframe(
+            "SELECT id FROM fact_staging ORDER BY id"
+        )["id"].tolist()
+
+    assert staging.get_watermark(sqlite_connection, "fact") is None
+    assert load([1, 2, 3]) == [1, 2, 3]
+    staging.update_staging_table_status(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+    )
+    staging.sync_staging_table_to_source_table(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+    )
+    assert staging.get_watermark(sqlite_connection, "fact") == "3"
+
+    # the watermark only moves once the records are synced
+    assert load([2, 3, 4, 5]) == [4, 5]
+    assert load([2, 3, 4, 5]) == [4, 5]
+    assert staging.merge_staging_table_into_source_table(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+    ) == {"new": 2, "updated": 0, "unchanged": 0}
+    assert staging.get_watermark(sqlite_connection, "fact") == "5"
+    # sqlite has no schemas, the watermark table is found without one
+    assert staging.get_watermark(sqlite_connection, "fact", schema_name="dbo") == "5"
+
+    assert load([4, 5]) == []
+    assert len(sqlite_connection.select_into_dataframe("SELECT * FROM fact")) == 5
+
+
+@pytest.mark.parametrize("use_row_hash", [False, True])
+def test_sync_dataframe_to_source_table(sqlite_connection, use_row_hash):
+    if use_row_hash:
+        sqlite_connection.execute_statement(
+            "ALTER TABLE fact ADD COLUMN _row_hash INTEGER"
+        )
+
+    def sync(ids, values):
+        data = pd.DataFrame({"id": ids, "val": values}).assign(
+            _created_date="2024-01-01", _created_by="test"
+        )
+        return staging.sync_dataframe_to_source_table(
+            sqlite_connection,
+            table_name="fact",
+            data=data,
+            matching_columns=["id"],
+            nonmatching_columns=["val"],
+            use_row_hash=use_row_hash,
+        )
+
+    assert sync([1, 2, 3], ["a", None, "c"]) == {"new": 3, "updated": 0, "unchanged": 0}
+    assert sync([1, 2, 3, 4], ["a", "b", None, "d"]) == {
+        "new": 1,
+        "updated": 2,
+        "unchanged": 1,
+    }
+
+    fact = sqlite_connection.select_into_dataframe(
+        "SELECT id, val FROM fact ORDER BY id"
+    )
+    assert fact["val"].tolist() == ["a", "b", None, "d"]
+
+
+def test_staging_pipeline_runs_in_one_transaction(sqlite_connection):
+    sqlite_connection.insert_into_table(
+        pd.DataFrame({"id": [1, 2], "val": ["a", "b"]}), "fact"
+    )
+    data = pd.DataFrame({"id": [1, 2, 3], "val": ["a", "changed", "c"]}).assign(
+        _created_date="2024-01-01", _created_by="test"
+    )
+    pipeline = staging.StagingPipeline(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+    )
+    assert pipeline.staging_table_name == "fact_staging"
+
+    timings = pipeline.run(data)
+    assert list(timings) == ["populate", "classify", "check", "sync", "commit"]
+    assert pipeline.timings == timings
+
+    fact = sqlite_connection.select_into_dataframe(
+        "SELECT id, val FROM fact ORDER BY id"
+    )
+    assert fact["val"].tolist() == ["a", "changed", "c"]
+
+    # nothing new the second time
+    assert "sync" not in pipeline.run(data)
+
+
+def test_staging_pipeline_rolls_back_every_step_on_failure(
+    sqlite_connection, monkeypatch
+):
+    sqlite_connection.insert_into_table(
+        pd.DataFrame({"id": [1], "val": ["a"], "status": ["old"]}), "fact_staging"
+    )
+    pipeline = staging.StagingPipeline(
+        sqlite_connection,
+        table_name="fact",
+        matching_columns=["id"],
+        nonmatching_columns=["val"],
+    )
+
+    def failing_sync(*args, **kwargs):
+        raise RuntimeError("sync failed")
+
+    monkeypatch.setattr(staging, "_sync_staging_table_to_source_table", failing_sync)
+    with pytest.raises(RuntimeError, match="sync failed"):
+        pipeline.run(
+            pd.DataFrame({"id": [2], "val": ["b"]}).assign(
+                _created_date="2024-01-01", _created_by="test"
+            )
+        )
+
+    # the staging table wasn't flushed nor reloaded
+    staged = sqlite_connection.select_into_dataframe(
+        "SELECT id, val, status FROM fact_staging"
+    )
+    assert staged.to_dict("records") == [{"id": 1, "val": "a", "status": "old"}]
+    assert "sync" not in pipeline.timings
+
+
+def test_sync_dataframe_to_source_table_with_null_source_values(sqlite_connection):
+    sqlite_connection.execute_statement(
+        """
+        CREATE TABLE measure (id INTEGER PRIMARY KEY, amount INTEGER, _created_date TEXT, _created_by TEXT);
+        INSERT INTO measure (id, amount) VALUES (1, 10), (2, NULL);
+        ALTER TABLE measure ADD COLUMN _row_hash INTEGER;
+        """
+    )
+
+    def sync(amounts, use_row_hash):
+        data = pd.DataFrame({"id": [1, 2], "amount": amounts}).assign(
+            _created_date="2024-01-01", _created_by="test"
+        )
+        return staging.sync_dataframe_to_source_table(
+            sqlite_connection,
+            table_name="measure",
+            data=data,
+            matching_columns=["id"],
+            nonmatching_columns=["amount"],
+            use_row_hash=use_row_hash,
+        )
+
+    # null value in an integer column
+    assert sync([10, 20], use_row_hash=False) == {
+        "new": 0,
+        "updated": 1,
+        "unchanged": 1,
+    }
+    # null hashes right after the hash column was added
+    assert sync([10, 20], use_row_hash=True) == {
+        "new": 0,
+        "updated": 2,
+        "unchanged": 0,
+    }
+    assert sync([10, 20], use_row_hash=True) == {
+        "new": 0,
+        "updated": 0,
+        "unchanged": 2,
+    }